@@ -22,9 +22,10 @@ roc_action_group_stack = RoCStack(app,
                                          loki_secret_name=conf.get('LogsSecretName'),
                                          prom_secret_name=conf.get('MetricsSecretName'),
                                         #  secret_name=conf.get('LogsSecretName'),
-                                         ecs_cluster=vpc_stack.ecs_cluster
+                                         ecs_cluster=vpc_stack.ecs_cluster,
+                                         access_logs_bucket=vpc_stack.access_logs_bucket
 )
-# metrics_lambda_stack = MetricsActionGroupStack(app, "grafana-metrics-action-group", secret_name=conf.get('MetricsSecretName'))
+# metrics_lambda_stack = MetricsActionGroupStack(app, "grafana-metrics-action-group", secret_name=conf.get('MetricsSecretName'), access_logs_bucket=vpc_stack.access_logs_bucket)
 
 knowledgebase_stack = AossStack(app, "grafana-knowledgebase")
 bedrock_agent_stack = ObservabilityAssistantAgent(app, 
@@ -42,7 +43,9 @@ streamlit_stack = WebAppStack(app,
             # bedrock_agent_id=bedrock_agent_stack.bedrock_agent_id,
             fargate_service=roc_action_group_stack.fargate_service,
             ecs_cluster=vpc_stack.ecs_cluster,
-            imported_cert_arn=conf.get('SelfSignedCertARN')
+            imported_cert_arn=conf.get('SelfSignedCertARN'),
+            access_logs_bucket=vpc_stack.access_logs_bucket,
+            knowledgebase_retrieval=conf.get('KnowledgeBaseRetrieval', {})
 )
 
 cdk.Aspects.of(app).add(AwsSolutionsChecks())
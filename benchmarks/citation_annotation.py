@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# Benchmark for the citation annotator of the Streamlit UI (stacks/user_interface/streamlit/citations.py).
+#
+# Generates a large synthetic answer with many citations, checks that the single pass annotator produces the
+# same text as the previous string slicing loop when every reference is distinct, and times both.
+#
+#   python benchmarks/citation_annotation.py
+#   python benchmarks/citation_annotation.py --chars 200000 --citations 500 --refs 10
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "stacks", "user_interface", "streamlit"))
+from citations import annotate_citations  # noqa: E402
+
+
+# The loop previously used in app.py, rebuilds the whole answer for every retrieved reference
+def annotate_citations_slicing(output_text, citations):
+    citation_num = 1
+    num_citation_chars = 0
+    citation_locs = ""
+    for citation in citations:
+        end_span = citation["generatedResponsePart"]["textResponsePart"]["span"]["end"] + 1
+        for retrieved_ref in citation["retrievedReferences"]:
+            citation_marker = f"[{citation_num}]"
+            output_text = output_text[:end_span + num_citation_chars] + citation_marker + output_text[end_span + num_citation_chars:]
+            citation_locs = citation_locs + "\n<br>" + citation_marker + " " + retrieved_ref["location"]["s3Location"]["uri"]
+            citation_num = citation_num + 1
+            num_citation_chars = num_citation_chars + len(citation_marker)
+        output_text = output_text[:end_span + num_citation_chars] + "\n" + output_text[end_span + num_citation_chars:]
+        num_citation_chars = num_citation_chars + 1
+    return output_text + "\n" + citation_locs
+
+
+def synthetic_answer(chars, citation_count, refs_per_citation, distinct_refs):
+    text = "".join(random.choice("abcdefghij klmnop qrstuv wxyz.") for _ in range(chars))
+    ends = sorted(random.sample(range(chars - 1), citation_count))
+    ref_num = 0
+    citations = []
+    for end in ends:
+        refs = []
+        for _ in range(refs_per_citation):
+            ref_num += 1
+            uri_num = ref_num if distinct_refs else random.randint(1, 20)
+            refs.append({"location": {"type": "S3", "s3Location": {"uri": f"s3://kb-docs/doc-{uri_num}.md"}}})
+        citations.append({
+            "generatedResponsePart": {"textResponsePart": {"span": {"start": max(end - 50, 0), "end": end}}},
+            "retrievedReferences": refs
+        })
+    return text, citations
+
+
+def timed(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the citation annotators on synthetic answers")
+    parser.add_argument("--chars", type=int, default=100000, help="Answer length in characters")
+    parser.add_argument("--citations", type=int, default=300, help="Citations in the answer")
+    parser.add_argument("--refs", type=int, default=10, help="Retrieved references per citation")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    text, citations = synthetic_answer(args.chars, args.citations, args.refs, distinct_refs=True)
+    expected, slicing_time = timed(annotate_citations_slicing, text, citations)
+    annotated, single_pass_time = timed(annotate_citations, text, citations)
+    if annotated != expected:
+        sys.exit("Single pass annotator output differs from the slicing loop")
+    print(f"{args.chars} chars, {args.citations} citations x {args.refs} references, all distinct")
+    print(f"  slicing loop  {slicing_time * 1000:9.2f} ms")
+    print(f"  single pass   {single_pass_time * 1000:9.2f} ms  ({slicing_time / single_pass_time:.1f}x)")
+
+    text, citations = synthetic_answer(args.chars, args.citations, args.refs, distinct_refs=False)
+    annotated, single_pass_time = timed(annotate_citations, text, citations)
+    print(f"{args.chars} chars, {args.citations} citations x {args.refs} references, 20 distinct documents")
+    print(f"  single pass   {single_pass_time * 1000:9.2f} ms  ({len(annotated) - len(text)} characters added)")
+
+
+if __name__ == "__main__":
+    main()
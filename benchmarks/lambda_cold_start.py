@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# Cold start benchmark for the metrics action group Lambda (stacks/metrics_action_group/lambda).
+#
+# Imports the Lambda module in fresh interpreters, like a new execution environment would, and reports
+#   * the module initialization duration (median over --runs interpreters)
+#   * the slowest modules imported by the handler module by cumulative time, parsed from python -X importtime
+# and fails when the median init duration is over --max-init-ms, or more than --max-regression percent slower
+# than a baseline saved earlier with --save-baseline.
+#
+#   python benchmarks/lambda_cold_start.py
+#   python benchmarks/lambda_cold_start.py --slim
+#   python benchmarks/lambda_cold_start.py --save-baseline /tmp/cold-start.json
+#   python benchmarks/lambda_cold_start.py --baseline /tmp/cold-start.json --max-regression 10
+#
+# Requires the Lambda requirements (stacks/metrics_action_group/lambda/requirements.txt) to be installed.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+DEFAULT_LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "stacks", "metrics_action_group", "lambda")
+
+# Measures the import of the handler module, the same work the Lambda runtime does during init
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import app
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def lambda_env(slim):
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    env.setdefault("API_SECRET_NAME", "cold-start-benchmark")
+    env.setdefault("POWERTOOLS_SERVICE_NAME", "MetricsLambdaAgent")
+    env["SLIM_MODE"] = "true" if slim else "false"
+    return env
+
+
+def measure_init(lambda_dir, env):
+    result = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=lambda_dir, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+# Parses "import time: self [us] | cumulative | imported package" lines and returns the cumulative time of every
+# module imported directly by the handler module, plus the total. Nested imports are indented by two spaces per
+# level and are printed before the module importing them.
+def measure_imports(lambda_dir, env):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=lambda_dir, env=env,
+                            capture_output=True, text=True, check=True)
+    children = {}
+    modules = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 1:
+            children[name] = int(cumulative)
+        elif depth == 0:
+            if name == "app":
+                modules = children
+                total = int(cumulative)
+            children = {}
+    return modules, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the cold start imports and init duration of the metrics Lambda")
+    parser.add_argument("--lambda-dir", default=DEFAULT_LAMBDA_DIR, help="Folder with the Lambda handler module app.py")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to measure the init duration in")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports of the handler module to show")
+    parser.add_argument("--slim", action="store_true", help="Measure with SLIM_MODE=true")
+    parser.add_argument("--max-init-ms", type=float, default=2000, help="Fail when the median init duration is higher")
+    parser.add_argument("--baseline", help="Baseline JSON written by --save-baseline to compare against")
+    parser.add_argument("--max-regression", type=float, default=20, help="Allowed slowdown against the baseline in percent")
+    parser.add_argument("--save-baseline", help="Write the measured init duration to this JSON file")
+    args = parser.parse_args()
+
+    env = lambda_env(args.slim)
+    # The first import also writes the bytecode cache, it is not counted
+    measure_init(args.lambda_dir, env)
+    durations = [measure_init(args.lambda_dir, env) for _ in range(args.runs)]
+    init_ms = statistics.median(durations)
+
+    modules, total = measure_imports(args.lambda_dir, env)
+    print(f"Slowest imports of app.py (cumulative, slim mode {'on' if args.slim else 'off'}), {total / 1000:.1f} ms in total")
+    for name, micros in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {name:<48} {micros / 1000:8.1f} ms")
+    print(f"Init duration: median {init_ms:.1f} ms, min {min(durations):.1f} ms, max {max(durations):.1f} ms over {args.runs} runs")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump({"initMs": init_ms, "slim": args.slim}, baseline_file)
+
+    failed = False
+    if init_ms > args.max_init_ms:
+        print(f"FAIL: init duration {init_ms:.1f} ms is over the {args.max_init_ms:.0f} ms budget")
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline_ms = json.load(baseline_file)["initMs"]
+        regression = (init_ms - baseline_ms) / baseline_ms * 100
+        print(f"Baseline {baseline_ms:.1f} ms, change {regression:+.1f}%")
+        if regression > args.max_regression:
+            print(f"FAIL: init duration regressed by more than {args.max_regression:.0f}%")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
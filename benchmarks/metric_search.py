@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# Benchmark for the metric name search index of the RoC service (stacks/roc_action_group/src/search_index.py).
+#
+# Builds the index over generated metric names, or the names in --names (one per line, e.g. saved from
+# /api/v1/label/__name__/values), and reports the build time, search latency percentiles and the payload bytes of a
+# search response against the full list returned by /get-available-metric-names.
+#
+#   python benchmarks/metric_search.py
+#   python benchmarks/metric_search.py --count 100000 --limit 20
+#   python benchmarks/metric_search.py --names metric_names.txt --queries cpu "memory bytes" http_reqests
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "stacks", "roc_action_group", "src"))
+from search_index import NameIndex  # noqa: E402
+
+PREFIXES = ["node", "kube", "container", "http", "grpc", "process", "go", "prometheus", "loki", "apiserver", "etcd", "coredns"]
+SUBJECTS = ["cpu", "memory", "disk", "network", "requests", "pod", "deployment", "request", "response", "gc", "heap", "threads"]
+SUFFIXES = ["seconds_total", "bytes", "bytes_total", "count", "duration_seconds_bucket", "errors_total", "info", "ratio"]
+DEFAULT_QUERIES = ["node_cpu", "cpu seconds", "memory bytes", "kube pod", "http_reqests", "grpc errors", "containr_memory", "gc"]
+
+
+def synthetic_names(count):
+    rnd = random.Random(42)
+    names = set()
+    while len(names) < count:
+        words = [rnd.choice(PREFIXES), rnd.choice(SUBJECTS)]
+        words += rnd.sample(SUBJECTS, rnd.randint(0, 2))
+        names.add("_".join(words + [rnd.choice(SUFFIXES)]) + (f"_{rnd.randint(0, 999)}" if rnd.random() < 0.5 else ""))
+    return sorted(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the metric name search index build time, latency and payload size")
+    parser.add_argument("--names", help="File with one metric name per line, generated names are used otherwise")
+    parser.add_argument("--count", type=int, default=50000, help="Number of generated metric names")
+    parser.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES, help="Queries to search for")
+    parser.add_argument("--limit", type=int, default=10, help="Matches per search")
+    parser.add_argument("--repeat", type=int, default=20, help="Searches per query")
+    args = parser.parse_args()
+
+    if args.names:
+        with open(args.names) as names_file:
+            names = [line.strip() for line in names_file if line.strip()]
+    else:
+        names = synthetic_names(args.count)
+
+    start = time.perf_counter()
+    index = NameIndex(names)
+    build_ms = (time.perf_counter() - start) * 1000
+    full_bytes = len(json.dumps({"status": "success", "data": names}))
+    print(f"Indexed {len(names)} metric names in {build_ms:.0f} ms, full name list {full_bytes} bytes")
+
+    print(f"{'query':<20} {'p50 ms':>8} {'p99 ms':>8} {'bytes':>7}  best match")
+    for query in args.queries:
+        durations = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            matches = index.search(query, args.limit)
+            durations.append((time.perf_counter() - start) * 1000)
+        response = {"matches": [{"name": names[i], "score": round(score, 3)} for i, score in matches], "metricNames": len(names)}
+        durations.sort()
+        print(f"{query:<20} {statistics.median(durations):>8.2f} {durations[int(0.99 * (len(durations) - 1))]:>8.2f} "
+              f"{len(json.dumps(response)):>7}  {response['matches'][0]['name'] if matches else '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# Payload size benchmark for the return of control response encodings.
+#
+# Builds representative Prometheus matrices, instant vectors and Loki log streams and compares the size of
+# the body sent to the agent as JSON (what the UI used to send, json.dumps of the Grafana response) against
+# the compact text encoding produced by the RoC service (stacks/roc_action_group/src/compact.py).
+# Token counts use tiktoken when it is installed, otherwise an estimate of one token per 4 characters.
+#
+#   python benchmarks/response_encoding.py
+#   python benchmarks/response_encoding.py --series 50 --points 500 --lines 2000
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "stacks", "roc_action_group", "src"))
+import compact  # noqa: E402
+
+try:
+    import tiktoken
+    encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(text):
+        return len(encoding.encode(text))
+    TOKENIZER = "tiktoken cl100k_base"
+except ImportError:
+    def count_tokens(text):
+        return len(text) // 4
+    TOKENIZER = "estimate, 4 characters per token"
+
+START = 1_700_000_000
+
+
+def matrix(series, points, step=60):
+    return {"status": "success", "step": step, "data": {"resultType": "matrix", "result": [
+        {"metric": {"__name__": "node_cpu_seconds_total", "job": "integrations/node_exporter", "cluster": "prod-eu-west-1",
+                    "instance": f"ip-10-0-{i // 8}-{i % 8}.eu-west-1.compute.internal:9100", "cpu": str(i % 8), "mode": "idle"},
+         "values": [[START + step * k, str(random.uniform(0, 100))] for k in range(points)]}
+        for i in range(series)
+    ]}}
+
+
+def vector(series):
+    return {"status": "success", "data": {"resultType": "vector", "result": [
+        {"metric": {"__name__": "http_requests_total", "job": "api", "namespace": "checkout", "pod": f"api-7d9f8b-{i:05d}",
+                    "code": random.choice(["200", "404", "500"])},
+         "value": [START, str(random.randint(0, 100000))]}
+        for i in range(series)
+    ]}}
+
+
+def streams(count, lines):
+    messages = ["GET /api/v1/orders 200 12ms", "POST /api/v1/checkout 500 1043ms upstream timeout",
+                "cache miss for key session:8f2a", "user 1842 logged in"]
+    return {"status": "success", "lines": lines, "truncated": False, "data": {"resultType": "streams", "result": [
+        {"stream": {"app": "checkout", "namespace": "prod", "cluster": "prod-eu-west-1", "pod": f"checkout-{i}", "level": "info"},
+         "values": [[str((START + k) * 1_000_000_000 + random.randint(0, 999_999_999)),
+                     f"level=info ts={START + k} msg=\"{random.choice(messages)}\""]
+                    for k in range(lines // count)]}
+        for i in range(count)
+    ]}}
+
+
+def report(name, response):
+    json_body = json.dumps(response)
+    compact_body = compact.encode(response)
+    json_tokens = count_tokens(json_body)
+    compact_tokens = count_tokens(compact_body)
+    print(f"{name:<28} {len(json_body):>10} {len(compact_body):>10} {len(compact_body) / len(json_body):>7.1%}"
+          f" {json_tokens:>10} {compact_tokens:>10} {compact_tokens / json_tokens:>7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares JSON and compact response payload sizes")
+    parser.add_argument("--series", type=int, default=20, help="Series per matrix and vector")
+    parser.add_argument("--points", type=int, default=500, help="Samples per matrix series")
+    parser.add_argument("--streams", type=int, default=5, help="Log streams")
+    parser.add_argument("--lines", type=int, default=1000, help="Log lines over all streams")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print(f"Tokens: {TOKENIZER}")
+    print(f"{'result':<28} {'json B':>10} {'compact B':>10} {'ratio':>7} {'json tok':>10} {'compact tok':>10} {'ratio':>7}")
+    report(f"matrix {args.series}x{args.points}", matrix(args.series, args.points))
+    report(f"matrix {args.series}x60", matrix(args.series, 60))
+    report(f"vector {args.series * 10}", vector(args.series * 10))
+    report(f"streams {args.streams}x{args.lines // args.streams}", streams(args.streams, args.lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# Offline benchmark of answer latency and token usage against the knowledge base result count.
+#
+# record  invokes the deployed agent once per prompt and numberOfResults value and appends one JSON line per
+#         turn to the recording: time to first text, total latency, model token usage (from the orchestration,
+#         pre and post processing traces) and the number of retrieved references. Needs AWS credentials and the
+#         UI environment variables (BEDROCK_AGENT_ID, BEDROCK_AGENT_ALIAS_ID, KNOWLEDGEBASE_ID, FUNCTION_CALLING_URL).
+# report  reads a recording offline and prints latency percentiles and mean token usage per numberOfResults.
+#
+#   python benchmarks/retrieval_settings.py record --prompts prompts.txt --results 5 20 100 --out recording.jsonl
+#   python benchmarks/retrieval_settings.py report recording.jsonl
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+STREAMLIT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "stacks", "user_interface", "streamlit")
+
+
+# Sums the token usage reported by every model invocation of the turn
+def token_usage(trace):
+    usage = {"inputTokens": 0, "outputTokens": 0}
+    for step_traces in trace.values():
+        for step_trace in step_traces:
+            metadata = step_trace.get("modelInvocationOutput", {}).get("metadata", {})
+            for name in usage:
+                usage[name] += metadata.get("usage", {}).get(name, 0)
+    return usage
+
+
+def record(args):
+    sys.path.insert(0, STREAMLIT_DIR)
+    import bedrock_agent_runtime
+
+    agent_id = os.environ["BEDROCK_AGENT_ID"]
+    agent_alias_id = os.environ.get("BEDROCK_AGENT_ALIAS_ID", "TSTALIASID")
+    with open(args.prompts) as prompts_file:
+        prompts = [line.strip() for line in prompts_file if line.strip()]
+
+    with open(args.out, "a") as out:
+        for number_of_results in args.results:
+            for prompt in prompts:
+                retrieval = {"numberOfResults": number_of_results, "searchType": args.search_type}
+                # A new session per turn, so earlier answers do not change the prompt size
+                session_id = str(uuid.uuid4())
+                invocation = bedrock_agent_runtime.AgentInvocation(agent_id, agent_alias_id, session_id, retrieval)
+                start = time.perf_counter()
+                first_text = None
+                for event in bedrock_agent_runtime.invoke_agent_stream(agent_id, agent_alias_id, session_id, prompt, invocation):
+                    if event["type"] == "chunk" and first_text is None:
+                        first_text = time.perf_counter() - start
+                latency = time.perf_counter() - start
+                turn = {
+                    "prompt": prompt,
+                    "numberOfResults": number_of_results,
+                    "searchType": args.search_type,
+                    "latencyMs": round(latency * 1000, 1),
+                    "firstTextMs": round(first_text * 1000, 1) if first_text is not None else None,
+                    "retrievedReferences": sum(len(citation["retrievedReferences"]) for citation in invocation.citations),
+                    "outputChars": len(invocation.output_text),
+                    **token_usage(invocation.trace)
+                }
+                out.write(json.dumps(turn) + "\n")
+                out.flush()
+                print(f"numberOfResults={number_of_results} {turn['latencyMs']:.0f} ms "
+                      f"{turn['inputTokens']} input tokens - {prompt[:60]}")
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def report(args):
+    turns = defaultdict(list)
+    with open(args.recording) as recording:
+        for line in recording:
+            if line.strip():
+                turn = json.loads(line)
+                turns[(turn["numberOfResults"], turn["searchType"])].append(turn)
+
+    print(f"{'results':>7} {'search':>8} {'turns':>5} {'p50 ms':>9} {'p90 ms':>9} {'first text':>10} "
+          f"{'input tok':>10} {'output tok':>10} {'refs':>6}")
+    for (number_of_results, search_type), group in sorted(turns.items()):
+        latencies = [turn["latencyMs"] for turn in group]
+        first_text = [turn["firstTextMs"] for turn in group if turn["firstTextMs"] is not None]
+        print(f"{number_of_results:>7} {search_type:>8} {len(group):>5} {percentile(latencies, 50):>9.0f} "
+              f"{percentile(latencies, 90):>9.0f} {statistics.median(first_text) if first_text else 0:>10.0f} "
+              f"{statistics.mean(turn['inputTokens'] for turn in group):>10.0f} "
+              f"{statistics.mean(turn['outputTokens'] for turn in group):>10.0f} "
+              f"{statistics.mean(turn['retrievedReferences'] for turn in group):>6.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Records and reports agent latency and token usage per knowledge base result count")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="Invoke the agent and record the turns")
+    record_parser.add_argument("--prompts", required=True, help="Text file with one prompt per line")
+    record_parser.add_argument("--results", type=int, nargs="+", default=[5, 20, 50, 100], help="numberOfResults values to compare")
+    record_parser.add_argument("--search-type", default="HYBRID", choices=["HYBRID", "SEMANTIC"])
+    record_parser.add_argument("--out", default="retrieval_recording.jsonl", help="Recording to append to")
+    record_parser.set_defaults(func=record)
+
+    report_parser = commands.add_parser("report", help="Summarize a recording offline")
+    report_parser.add_argument("recording", help="Recording written by record")
+    report_parser.set_defaults(func=report)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
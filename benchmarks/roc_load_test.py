@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# Load benchmark for the Return of Control (RoC) FastAPI service against a local stub Grafana server.
+#
+# The script starts two local processes
+#   * a stub Grafana Cloud server answering the Loki and Prometheus APIs used by the RoC service
+#     after a configurable artificial latency
+#   * the RoC service itself (uvicorn, single worker, like the Fargate task) with its Secrets Manager
+#     lookups pointed at the stub server
+# and then fires concurrent requests at one RoC endpoint, reporting requests/sec and latency percentiles.
+#
+# To compare before and after a change, run it once per source tree, e.g.
+#   git worktree add /tmp/roc-before <old-commit>
+#   python benchmarks/roc_load_test.py --app-dir /tmp/roc-before/stacks/roc_action_group/src
+#   python benchmarks/roc_load_test.py --app-dir stacks/roc_action_group/src
+#
+# Requires the RoC service requirements (stacks/roc_action_group/src/requirements.txt) to be installed.
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+DEFAULT_APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "stacks", "roc_action_group", "src")
+
+
+# Stub Grafana server, answers with small canned payloads after the configured latency
+def serve_stub(port, latency_ms):
+    from fastapi import FastAPI
+    import uvicorn
+
+    stub = FastAPI()
+    delay = latency_ms / 1000.0
+
+    # Answers without the artificial latency, used to wait for the stub to come up
+    @stub.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @stub.get("/loki/api/v1/query_range")
+    async def loki_query_range():
+        await asyncio.sleep(delay)
+        return {"status": "success", "data": {"resultType": "streams", "result": [
+            {"stream": {"app": "stub"}, "values": [[str(time.time_ns()), "stub log line"]]}
+        ]}}
+
+    @stub.get("/loki/api/v1/labels")
+    async def loki_labels():
+        await asyncio.sleep(delay)
+        return {"status": "success", "data": ["app", "cluster", "namespace"]}
+
+    @stub.get("/api/v1/query")
+    async def prom_query():
+        await asyncio.sleep(delay)
+        return {"status": "success", "data": {"resultType": "vector", "result": [
+            {"metric": {"__name__": "up", "job": "stub"}, "value": [time.time(), "1"]}
+        ]}}
+
+    @stub.get("/api/v1/labels")
+    async def prom_labels():
+        await asyncio.sleep(delay)
+        return {"status": "success", "data": ["__name__", "job", "instance"]}
+
+    @stub.get("/api/v1/label/__name__/values")
+    async def prom_metric_names():
+        await asyncio.sleep(delay)
+        return {"status": "success", "data": ["up", "kube_pod_info"]}
+
+    uvicorn.run(stub, host="127.0.0.1", port=port, log_level="warning")
+
+
+# RoC service with Secrets Manager replaced by a provider that points at the stub server
+def serve_roc(port, app_dir, stub_port):
+    import uvicorn
+
+    class StubSecretsProvider:
+        def get(self, name, transform=None, **kwargs):
+            return {"baseUrl": f"http://127.0.0.1:{stub_port}", "username": "stub", "apikey": "stub"}
+
+    # boto3 clients are created at import, they need a region even though Secrets Manager is never called
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("LOKI_API_SECRET_NAME", "stub-loki")
+    os.environ.setdefault("PROM_API_SECRET_NAME", "stub-prom")
+    sys.path.insert(0, os.path.abspath(app_dir))
+    os.chdir(app_dir)
+    import app as roc_app
+    roc_app.secretsmanager = StubSecretsProvider()
+    # Quiet the per request debug logging so it does not dominate the measurement
+    roc_app.logger.setLevel("WARNING")
+    uvicorn.run(roc_app.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def wait_for(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def run_load(url, params, total, concurrency):
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency), timeout=120) as client:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url, params=params)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark for the RoC service against a stub Grafana server")
+    parser.add_argument("--app-dir", default=DEFAULT_APP_DIR, help="RoC source directory to benchmark")
+    parser.add_argument("--endpoint", default="/invoke-logql", help="RoC endpoint to call")
+    parser.add_argument("--query", default='{app="stub"}', help="Statement passed as logql/promql parameter")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency-ms", type=int, default=200, help="Artificial latency of the stub Grafana server")
+    parser.add_argument("--roc-port", type=int, default=18080)
+    parser.add_argument("--stub-port", type=int, default=18081)
+    parser.add_argument("--serve", choices=["stub", "roc"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve == "stub":
+        return serve_stub(args.stub_port, args.latency_ms)
+    if args.serve == "roc":
+        return serve_roc(args.roc_port, args.app_dir, args.stub_port)
+
+    base_cmd = [sys.executable, os.path.abspath(__file__),
+                "--app-dir", args.app_dir,
+                "--roc-port", str(args.roc_port),
+                "--stub-port", str(args.stub_port),
+                "--latency-ms", str(args.latency_ms)]
+    processes = [subprocess.Popen(base_cmd + ["--serve", "stub"]),
+                 subprocess.Popen(base_cmd + ["--serve", "roc"])]
+    try:
+        wait_for(f"http://127.0.0.1:{args.stub_port}/health")
+        wait_for(f"http://127.0.0.1:{args.roc_port}/health")
+
+        params = {}
+        if args.endpoint == "/invoke-logql":
+            params["logql"] = args.query
+        elif args.endpoint == "/invoke-promql":
+            params["promql"] = args.query
+
+        url = f"http://127.0.0.1:{args.roc_port}{args.endpoint}"
+        # Warm up the connection pools before measuring
+        asyncio.run(run_load(url, params, min(args.concurrency, args.requests), args.concurrency))
+        latencies, errors, elapsed = asyncio.run(run_load(url, params, args.requests, args.concurrency))
+
+        print(f"app_dir      : {os.path.abspath(args.app_dir)}")
+        print(f"endpoint     : {args.endpoint}")
+        print(f"requests     : {args.requests} (concurrency {args.concurrency}, stub latency {args.latency_ms}ms)")
+        print(f"errors       : {errors}")
+        print(f"requests/sec : {args.requests / elapsed:.1f}")
+        print(f"p50 latency  : {statistics.median(latencies) * 1000:.1f}ms")
+        print(f"p99 latency  : {percentile(latencies, 99) * 1000:.1f}ms")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import yaml
 from yaml.loader import SafeLoader
 
+_REQUIRED = object()
+
 class Config:
 
     _environment = 'development'
@@ -15,5 +17,8 @@ class Config:
             self.data = yaml.load(f, Loader=SafeLoader)
         return self.data
 
-    def get(self, key):
-        return self.data[key]
\ No newline at end of file
+    # Keys without a default are required
+    def get(self, key, default=_REQUIRED):
+        if default is _REQUIRED:
+            return self.data[key]
+        return self.data.get(key, default)
\ No newline at end of file
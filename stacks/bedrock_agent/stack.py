@@ -185,9 +185,9 @@ class ObservabilityAssistantAgent(cdk.Stack):
         # metrics_lambda.grant_invoke(agent_role)
         model = bedrock.FoundationModel.from_foundation_model_id(self, "AnthropicClaudeV3", bedrock.FoundationModelIdentifier.ANTHROPIC_CLAUDE_3_SONNET_20240229_V1_0)
         
-        #Add policy to invoke model
+        #Add policy to invoke model. The streaming action is needed when the final response is streamed to the UI
         agent_role.add_to_policy(iam.PolicyStatement(
-            actions=["bedrock:InvokeModel"],
+            actions=["bedrock:InvokeModel", "bedrock:InvokeModelWithResponseStream"],
             resources=[model.model_arn],
         ))
 
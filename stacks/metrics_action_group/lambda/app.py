@@ -1,4 +1,8 @@
+import time
+# Start of the module initialization, reported as InitDuration on cold starts
+init_started = time.perf_counter()
 import os
+from typing import Optional
 from aws_lambda_powertools.event_handler import BedrockAgentResolver
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools import Logger
@@ -6,16 +10,24 @@ from aws_lambda_powertools import Tracer
 from aws_lambda_powertools import Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 import requests
-from requests.exceptions import HTTPError
-from aws_lambda_powertools.utilities import parameters
 from typing_extensions import Annotated
 from aws_lambda_powertools.event_handler.openapi.params import Body, Query
+from cache import TTLCache
+from credentials import GrafanaCredentialsProvider
+import summarize
+from result_store import ResultStore, create_result_backend, result_page
+import promql as promql_utils
+import prom_stream
+from bedrock_event import event_parameters, log_event, log_response
 
-app = BedrockAgentResolver(enable_validation=True)
+# Slim mode skips the request validation of the resolver, which builds pydantic models for every route on the
+# first request. The Bedrock agent only sends parameters declared in openapi_schema.json, so this is safe to turn
+# on when cold starts matter more than validation error messages.
+slim_mode = os.environ.get("SLIM_MODE", "false").lower() == "true"
+app = BedrockAgentResolver(enable_validation=not slim_mode)
 tracer = Tracer()
 logger = Logger()
 metrics = Metrics(namespace="MetricsLambdaAgent")
-secretsmanager = parameters.SecretsProvider()
 
 #Enable this only when required to enable HTTP trace
 # requests.packages.urllib3.add_stderr_logger() 
@@ -27,40 +39,145 @@ def get_env_var(var_name):
     except KeyError:
         logger.error(f"Environment variable {var_name} is not set.")
         return None
+
+# Credentials and HTTP session are kept at module level so warm invocations skip the Secrets Manager round trip
+credentials_provider = GrafanaCredentialsProvider(get_env_var("API_SECRET_NAME"))
+session = requests.Session()
+
+# Makes a GET call to the given Grafana API path, re-reading the secret once if Grafana answers 401.
+# With stream set the body is read incrementally by the caller, which has to close the response.
+def grafana_get(path, params=None, stream=False):
+    credentials = credentials_provider.get()
+    response = session.get(credentials.base_url+path, params=params, auth=credentials.auth, stream=stream)
+    if response.status_code == 401:
+        logger.warning("Grafana returned 401, refreshing credentials")
+        response.close()
+        credentials_provider.invalidate()
+        credentials = credentials_provider.get()
+        response = session.get(credentials.base_url+path, params=params, auth=credentials.auth, stream=stream)
+    return response
+
+# Full results that were summarized because they exceeded the size budget, kept across warm invocations.
+# Set RESULT_STORE_BUCKET to fetch them from any execution environment, not only the one that ran the statement.
+result_store = ResultStore(backend=create_result_backend())
+
+# Replaces responses over the size budget with a compact digest, parking the full result in the result store
+def summarize_response(response):
+    summarized = summarize.summarize_if_needed(response, result_store)
+    if summarized is not response:
+        metrics.add_metric(name="SummarizedResults", unit=MetricUnit.Count, value=1)
+    return summarized
+
+# Label and metric names change rarely, cache them across warm invocations instead of calling Grafana Cloud every time
+discovery_cache = TTLCache("Discovery",
+                           ttl=int(os.environ.get("DISCOVERY_CACHE_TTL_SECONDS", 300)),
+                           maxsize=int(os.environ.get("DISCOVERY_CACHE_MAXSIZE", 64)),
+                           stale_ttl=int(os.environ.get("DISCOVERY_CACHE_STALE_SECONDS", 0)),
+                           metrics=metrics)
+
+# Route functions get their parameters decoded from the raw event, the resolver truncates values after a comma
+# and does not pass query parameters at all in slim mode
+decoded_parameters = event_parameters(lambda: app.current_event)
+
+# Fetches label or metric names through the discovery cache, only successful responses are cached
+def get_discovery_data(path):
+    def load():
+        return grafana_get(path).json()
+    return discovery_cache.get_or_load(path, load,
+                                       should_cache=lambda response: response.get('status') == 'success')
     
 @app.get("/invoke-promql", 
          summary="Invokes a given promql statement",
          description="Makes GET HTTP to Grafana Cloud to invoke a specified promql statement passed in the input .This calls \
          /api/v1/query endpoint from Grafana Prometheus host endpoint using basic authentication.\
-         Secrets to call are stored in AWS Secrets Manager",
+         Large results are returned in pages, if the result has truncated set to true invoke the statement again\
+         with the continuation token to get the next series. Secrets to call are stored in AWS Secrets Manager",
          operation_id="invokePromqlStatement",
          tags=["GrafanaCloud","Prometheus","Statement"],
          response_description="PromQL Statement invocation results from Grafana Cloud"
          )
+@decoded_parameters
 @tracer.capture_method
 def invoke_promql_statement(
-    promql: Annotated[str, Query(description="The PromQL Statement to invoke", strict=True)]
+    promql: Annotated[str, Query(description="The PromQL Statement to invoke", strict=True)],
+    continuation: Annotated[Optional[str], Query(description="The continuation token of the previous page of a truncated result")] = None
 ) -> Annotated[dict, Body(description="Results from the promql statement")]:
     # adding custom metrics
     # See: https://awslabs.github.io/aws-lambda-powertools-python/latest/core/metrics/
     metrics.add_metric(name="PromQLInvocations", unit=MetricUnit.Count, value=1)   
+    try:
+        eval_time, offset = prom_stream.decode_continuation(continuation, promql) if continuation else (time.time(), 0)
+    except prom_stream.ContinuationError as e:
+        return {"error": str(e)}
     # Try Except block to make Grafana Cloud API call
     try:
-        auth_key_pair = secretsmanager.get(get_env_var("API_SECRET_NAME"), transform='json')
-        base_url = auth_key_pair['baseUrl']+"/api/v1/query"
-        session = requests.Session()
-        session.auth = (auth_key_pair['username'], auth_key_pair['apikey'])
-        # Using this because directly accessing the promql input is truncating the records after comma
-        # This does bypass the typing extension validation, but good enough to generate the openapi spec
-        # without compromising 
-        session.params = {'query': app.current_event.parameters[0]['value']}
-        logger.debug(session.params)
-        response = session.get(base_url).json()
+        logger.debug({'query': promql, 'time': eval_time, 'offset': offset})
+        # The body is parsed as it streams in and only the series within the payload budget are kept
+        # The page is already within the payload budget, it is not summarized
+        response = prom_stream.query_page(grafana_get, promql, eval_time, offset=offset)
+        if response.get('truncated'):
+            metrics.add_metric(name="PromQLPagedResults", unit=MetricUnit.Count, value=1)
         return response
     except Exception as e:
         logger.error(str(e))
         raise 
     
+@app.get("/invoke-promql-range", 
+         summary="Invokes a given promql statement over a time range",
+         description="Makes GET HTTP to Grafana Cloud to invoke a specified promql statement over a time range. This calls \
+         /api/v1/query_range endpoint from Grafana Prometheus host endpoint using basic authentication.\
+         Use this for trends over time instead of running many instant queries. The step is chosen automatically\
+         to keep the number of points per series bounded. Secrets to call are stored in AWS Secrets Manager",
+         operation_id="invokePromqlRangeStatement",
+         tags=["GrafanaCloud","Prometheus","Statement"],
+         response_description="PromQL range statement invocation results from Grafana Cloud"
+         )
+@decoded_parameters
+@tracer.capture_method
+def invoke_promql_range_statement(
+    promql: Annotated[str, Query(description="The PromQL Statement to invoke", strict=True)],
+    start: Annotated[Optional[str], Query(description="Start of the time range as RFC3339, unix epoch or now-<duration> such as now-6h, defaults to one hour before end")] = None,
+    end: Annotated[Optional[str], Query(description="End of the time range as RFC3339, unix epoch or now, defaults to now")] = None,
+    step: Annotated[Optional[str], Query(description="Minimum resolution step as a duration such as 1m, chosen automatically when not set")] = None
+) -> Annotated[dict, Body(description="Results from the promql range statement")]:
+    metrics.add_metric(name="PromQLRangeInvocations", unit=MetricUnit.Count, value=1)
+    try:
+        end_ts = promql_utils.parse_time(end, default=time.time())
+        start_ts = promql_utils.parse_time(start, default=end_ts - promql_utils.DEFAULT_LOOKBACK_SECONDS)
+        if start_ts >= end_ts:
+            return {"error": "start must be before end"}
+        min_step = promql_utils.parse_duration(step) if step else None
+    except ValueError as e:
+        return {"error": str(e)}
+
+    try:
+        resolution = promql_utils.choose_step(start_ts, end_ts, min_step=min_step)
+        ranges = promql_utils.split_range(start_ts, end_ts, resolution)
+        logger.debug(f"query_range {promql} step={resolution} sub-ranges={len(ranges)}")
+
+        def fetch(sub_range):
+            return grafana_get("/api/v1/query_range", params={
+                'query': promql,
+                'start': sub_range[0],
+                'end': sub_range[1],
+                'step': resolution,
+            }).json()
+
+        if len(ranges) == 1:
+            responses = [fetch(ranges[0])]
+        else:
+            # Only needed for split range statements, imported here to keep it out of the cold start
+            from concurrent.futures import ThreadPoolExecutor
+            workers = int(os.environ.get("PROMQL_SPLIT_CONCURRENCY", promql_utils.DEFAULT_SPLIT_CONCURRENCY))
+            with ThreadPoolExecutor(max_workers=min(len(ranges), workers)) as executor:
+                responses = list(executor.map(fetch, ranges))
+        response = promql_utils.merge_range_results(responses)
+        response['step'] = resolution
+        return summarize_response(response)
+    except Exception as e:
+        logger.error(str(e))
+        raise 
+
 @app.get("/get-available-promql-labels", 
          summary="Get available PromQL filter labels from Grafana Cloud",
          description="Makes GET HTTP to Grafana Cloud to get a list of available filter labels .This calls \
@@ -70,6 +187,7 @@ def invoke_promql_statement(
          tags=["GrafanaCloud","Prometheus","Labels"],
          response_description="List of available Prometheus labels from Grafana Cloud"
          )
+@decoded_parameters
 @tracer.capture_method
 def get_available_labels() -> Annotated[list, Body(description="List of available Prometheus Labels from Grafana Cloud")]:
     # Adding custom logs
@@ -80,12 +198,7 @@ def get_available_labels() -> Annotated[list, Body(description="List of availabl
 
     # Try Except block to make Grafana Cloud API call
     try:
-        auth_key_pair = secretsmanager.get(get_env_var("API_SECRET_NAME"), transform='json')
-        base_url = auth_key_pair['baseUrl']+"/api/v1/labels"
-        session = requests.Session()
-        session.auth = (auth_key_pair['username'], auth_key_pair['apikey'])   
-        
-        response = session.get(base_url).json()
+        response = get_discovery_data("/api/v1/labels")
         logger.debug("get_available_labels - HTTP 200")
         return response['data']
     except Exception as e:
@@ -103,6 +216,7 @@ def get_available_labels() -> Annotated[list, Body(description="List of availabl
          tags=["GrafanaCloud","Prometheus","Metrics"],
          response_description="List of available Prometheus metric namesfrom Grafana Cloud"
          )
+@decoded_parameters
 @tracer.capture_method
 def get_available_metric_names() -> Annotated[list, Body(description="List of available Prometheus metric names from Grafana Cloud")]:
     # Adding custom logs
@@ -113,18 +227,57 @@ def get_available_metric_names() -> Annotated[list, Body(description="List of av
 
     # Try Except block to make Grafana Cloud API call
     try:
-        auth_key_pair = secretsmanager.get(get_env_var("API_SECRET_NAME"), transform='json')
-        base_url = auth_key_pair['baseUrl']+"/api/v1/label/__name__/values"
-        session = requests.Session()
-        session.auth = (auth_key_pair['username'], auth_key_pair['apikey'])   
-        
-        response = session.get(base_url).json()
+        response = get_discovery_data("/api/v1/label/__name__/values")
         logger.debug("get_available_metrics - HTTP 200")
         return response['data']
     except Exception as e:
         logger.error(str(e))
         raise 
 
+@app.get("/fetch-result-page", 
+         summary="Fetches one page of the full result of a summarized statement invocation",
+         description="Returns one page of the full result of a PromQL statement invocation that was summarized because it was too large.\
+         Pages are kept under the Lambda response size limit, they hold whole series unless a series is too large for one page.\
+         The same handle and page always return the same page.\
+         The response has the page number, the number of pages, the range of series on the page and their total.\
+         Fetch only the pages needed to answer instead of invoking the statement again.",
+         operation_id="fetchResultPage",
+         tags=["Results"],
+         response_description="One page of the full result of the statement invocation"
+         )
+@decoded_parameters
+@tracer.capture_method
+def fetch_result_page(
+    handle: Annotated[str, Query(description="The resultHandle from a summarized response", strict=True)],
+    page: Annotated[int, Query(description="The page to fetch, starting at 1", ge=1)] = 1
+) -> Annotated[dict, Body(description="One page of the full result of the statement invocation")]:
+    metrics.add_metric(name="FetchResultPageInvocations", unit=MetricUnit.Count, value=1)
+    result = result_store.get(handle)
+    if result is None:
+        return {"error": f"No result found for handle {handle}, it may have expired. Invoke the statement again."}
+    try:
+        response = result_page(result, page)
+    except ValueError as e:
+        return {"error": str(e)}
+    response["resultHandle"] = handle
+    return response
+
+# Builds the validation models of every route during initialization instead of on the first request
+def build_validation_models():
+    try:
+        for route in app._static_routes + app._dynamic_routes:
+            route.dependant
+            route.body_field
+    except Exception as e:
+        # Relies on resolver internals, the models are still built on the first request if this fails
+        logger.warning(f"Could not build validation models at init: {str(e)}")
+
+if not slim_mode:
+    build_validation_models()
+
+init_duration_ms = (time.perf_counter() - init_started) * 1000
+cold_start = True
+
 # Enrich logging with contextual information from Lambda
 # @logger.inject_lambda_context(correlation_id_path=correlation_paths.API_GATEWAY_REST)
 # Adding tracer
@@ -134,8 +287,14 @@ def get_available_metric_names() -> Annotated[list, Body(description="List of av
 # ensures metrics are flushed upon request completion/failure and capturing ColdStart metric
 @metrics.log_metrics(capture_cold_start_metric=True)
 def lambda_handler(event: dict, context: LambdaContext) -> dict:
-    logger.info(event)
-    return app.resolve(event, context)
+    global cold_start
+    if cold_start:
+        metrics.add_metric(name="InitDuration", unit=MetricUnit.Milliseconds, value=init_duration_ms)
+        cold_start = False
+    log_event(event)
+    response = app.resolve(event, context)
+    log_response(response)
+    return response
 
 if __name__ == "__main__":  
     print(app.get_openapi_json_schema(openapi_version='3.0.0')) 
\ No newline at end of file
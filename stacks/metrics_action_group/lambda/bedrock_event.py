@@ -0,0 +1,93 @@
+# Parameter decoding and size capped logging for the Bedrock action group events.
+# Bedrock passes every parameter as a name, type and string value. The resolver's query string handling splits
+# values on commas, which truncates PromQL such as sum by (job, instance) (...), so route functions get their
+# parameters decoded from the raw event instead, verbatim apart from the type conversion.
+import functools
+import inspect
+import json
+import os
+
+from aws_lambda_powertools import Logger
+
+logger = Logger(child=True)
+
+DEFAULT_LOG_MAX_VALUE_CHARS = 512
+DEFAULT_LOG_MAX_EVENT_CHARS = 4096
+
+
+class ParameterError(ValueError):
+    pass
+
+
+def decode_value(value, value_type):
+    try:
+        if value_type == "integer":
+            return int(value)
+        if value_type == "number":
+            return float(value)
+        if value_type == "boolean":
+            return str(value).lower() == "true"
+        if value_type == "array":
+            return json.loads(value)
+    except ValueError:
+        raise ParameterError(f"Invalid {value_type} value {value}")
+    return value
+
+
+def decode_parameters(event_parameters):
+    return {parameter['name']: decode_value(parameter.get('value'), parameter.get('type', 'string'))
+            for parameter in event_parameters or []}
+
+
+# Calls the route function with the parameters decoded from the event, after checking the required ones are there.
+# Errors are returned to the agent, so it can correct the call.
+def event_parameters(get_event):
+    def decorator(fn):
+        required = [name for name, parameter in inspect.signature(fn).parameters.items()
+                    if parameter.default is inspect.Parameter.empty]
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                decoded = decode_parameters(get_event().parameters)
+            except ParameterError as e:
+                return {"error": str(e)}
+            missing = [name for name in required if name not in decoded and name not in kwargs]
+            if missing:
+                return {"error": f"Missing required parameters: {', '.join(missing)}"}
+            kwargs.update(decoded)
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def cap(value, max_chars):
+    value = value if isinstance(value, str) else json.dumps(value, default=str)
+    if len(value) <= max_chars:
+        return value
+    return value[:max_chars] + f"... ({len(value) - max_chars} more characters)"
+
+
+# Logs one structured line per invocation with capped parameter values instead of the whole event.
+# The full event (still capped) is only logged with LOG_FULL_EVENT=true.
+def log_event(event):
+    max_value_chars = int(os.environ.get("LOG_MAX_VALUE_CHARS", DEFAULT_LOG_MAX_VALUE_CHARS))
+    logger.info("Action group invocation", extra={
+        "action_group": event.get("actionGroup"),
+        "api_path": event.get("apiPath"),
+        "http_method": event.get("httpMethod"),
+        "session_id": event.get("sessionId"),
+        "parameters": {parameter.get("name"): cap(parameter.get("value", ""), max_value_chars)
+                       for parameter in event.get("parameters") or []},
+    })
+    if os.environ.get("LOG_FULL_EVENT", "false").lower() == "true":
+        logger.info(cap(event, int(os.environ.get("LOG_MAX_EVENT_CHARS", DEFAULT_LOG_MAX_EVENT_CHARS))))
+
+
+def log_response(response):
+    body = response.get("response", {}).get("responseBody", {}).get("application/json", {}).get("body", "")
+    logger.info("Action group response", extra={
+        "http_status_code": response.get("response", {}).get("httpStatusCode"),
+        "body_chars": len(body),
+        "body": cap(body, int(os.environ.get("LOG_MAX_VALUE_CHARS", DEFAULT_LOG_MAX_VALUE_CHARS))),
+    })
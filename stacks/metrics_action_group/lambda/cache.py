@@ -0,0 +1,99 @@
+# In-process TTL caches for near-static Grafana Cloud data (label names, metric names).
+# The cache lives at module level, so it survives across invocations of a warm Lambda execution environment.
+# Entries are bounded by size (least recently used entries are evicted first) and by age.
+# With stale_ttl set, an expired entry is still served for that many extra seconds while a
+# background thread refreshes it (stale-while-revalidate). Lambda freezes background threads
+# between invocations, so a refresh started at the end of one invocation may finish in the next.
+import threading
+import time
+from collections import OrderedDict
+
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.metrics import MetricUnit
+
+logger = Logger(child=True)
+
+
+class CacheEntry:
+
+    def __init__(self, value, ttl, stale_ttl):
+        now = time.monotonic()
+        self.value = value
+        self.expires_at = now + ttl
+        self.stale_until = self.expires_at + stale_ttl
+
+
+class TTLCache:
+
+    def __init__(self, name, ttl, maxsize, stale_ttl=0, metrics=None):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        self.metrics = metrics
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _add_metric(self, name):
+        if self.metrics is not None:
+            self.metrics.add_metric(name=f"{self.name}{name}", unit=MetricUnit.Count, value=1)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() >= entry.stale_until:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = CacheEntry(value, self.ttl, self.stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    # Returns the cached value for the key, calling the loader on a miss.
+    # should_cache decides if a loaded value is kept, e.g. to skip caching error responses.
+    def get_or_load(self, key, loader, should_cache=None):
+        entry = self.get(key)
+        if entry is not None:
+            if time.monotonic() < entry.expires_at:
+                self._add_metric("CacheHits")
+                return entry.value
+            self._add_metric("CacheStaleHits")
+            self._refresh_in_background(key, loader, should_cache)
+            return entry.value
+
+        self._add_metric("CacheMisses")
+        value = loader()
+        if should_cache is None or should_cache(value):
+            self.set(key, value)
+        return value
+
+    def _refresh_in_background(self, key, loader, should_cache):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                value = loader()
+                if should_cache is None or should_cache(value):
+                    self.set(key, value)
+            except Exception as e:
+                logger.error(f"{self.name} cache refresh for {key} failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
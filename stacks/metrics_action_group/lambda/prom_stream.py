@@ -0,0 +1,151 @@
+# Streaming read of Prometheus instant query responses for the Lambda payload limit.
+# Bedrock caps the size of an action group Lambda response, so instead of loading the whole /api/v1/query
+# body into a dict, the series of the result array are decoded one at a time from the HTTP stream and only
+# kept until the byte budget is reached. The remaining series are counted but not kept, and the page comes
+# with a continuation token that evaluates the same query at the same time and resumes at the next series.
+import base64
+import codecs
+import json
+import os
+import re
+
+DEFAULT_BUDGET_BYTES = 20000
+CHUNK_SIZE = 64 * 1024
+
+RESULT_START = re.compile(r'"result"\s*:\s*\[')
+RESULT_TYPE = re.compile(r'"resultType"\s*:\s*"(\w+)"')
+STATUS = re.compile(r'"status"\s*:\s*"(\w+)"')
+
+
+class ContinuationError(ValueError):
+    pass
+
+
+def encode_continuation(query, eval_time, offset):
+    token = json.dumps({"q": query, "t": eval_time, "o": offset}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(token.encode()).decode()
+
+
+# Returns the evaluation time and series offset of a continuation token issued for the query
+def decode_continuation(token, query):
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(token.encode()))
+        eval_time, offset = decoded["t"], int(decoded["o"])
+    except (ValueError, KeyError, TypeError):
+        raise ContinuationError("Invalid continuation token")
+    if decoded.get("q") != query:
+        raise ContinuationError("The continuation token was issued for a different statement")
+    return eval_time, offset
+
+
+# Keeps the most recent samples of a single series that is larger than the budget on its own
+def trim_series(series, size, budget_bytes):
+    values = series.get("values")
+    if not values:
+        return series
+    keep = max(1, int(len(values) * budget_bytes / size))
+    return dict(series, values=values[-keep:], samplesTruncated=len(values) - keep)
+
+
+def read_page(chunks, offset=0, budget_bytes=None):
+    budget_bytes = budget_bytes or int(os.environ.get("PROMQL_RESPONSE_BUDGET_BYTES", DEFAULT_BUDGET_BYTES))
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+
+    def read_more():
+        chunk = next(chunks, None)
+        return None if chunk is None else text_decoder.decode(chunk)
+
+    # status and resultType come before the result array in Prometheus responses
+    buffer = ""
+    match = None
+    while match is None:
+        more = read_more()
+        if more is None:
+            # No result array, e.g. an error response, which is small enough to parse whole
+            return json.loads(buffer + text_decoder.decode(b"", final=True))
+        buffer += more
+        match = RESULT_START.search(buffer)
+    header = buffer[:match.start()]
+    result_type = RESULT_TYPE.search(header)
+    result_type = result_type.group(1) if result_type else None
+    status = STATUS.search(header)
+    if result_type not in ("vector", "matrix"):
+        # Scalar and string results are a single value
+        rest = buffer
+        while (more := read_more()) is not None:
+            rest += more
+        return json.loads(rest)
+
+    decoder = json.JSONDecoder()
+    pos = match.end()
+    index = 0
+    size = 0
+    result = []
+    truncated = False
+    while True:
+        # Skip separators, reading more of the stream when the buffer runs out
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos == len(buffer):
+            more = read_more()
+            if more is None:
+                raise ValueError("Unexpected end of the Prometheus response")
+            buffer = buffer[pos:] + more
+            pos = 0
+            continue
+        if buffer[pos] == "]":
+            break
+        try:
+            series, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The series continues in the next chunk
+            more = read_more()
+            if more is None:
+                raise
+            buffer = buffer[pos:] + more
+            pos = 0
+            continue
+
+        series_size = end - pos
+        if index >= offset and not truncated:
+            if size + series_size <= budget_bytes:
+                result.append(series)
+                size += series_size
+            elif not result:
+                result.append(trim_series(series, series_size, budget_bytes))
+                size = budget_bytes
+            else:
+                truncated = True
+        index += 1
+        pos = end
+        # Drop the parsed part of the buffer so memory stays bounded by the chunk and series size
+        if pos > CHUNK_SIZE:
+            buffer = buffer[pos:]
+            pos = 0
+
+    return {
+        "status": status.group(1) if status else "success",
+        "data": {"resultType": result_type, "result": result},
+        "seriesTotal": index,
+        "seriesOffset": offset,
+        "seriesReturned": len(result),
+        "truncated": truncated,
+    }
+
+
+# Runs an instant query and returns one page of its series within the byte budget.
+# The evaluation time is pinned on the first page so the following pages see the same series.
+def query_page(grafana_get, query, eval_time, offset=0, budget_bytes=None):
+    response = grafana_get("/api/v1/query", params={"query": query, "time": eval_time}, stream=True)
+    try:
+        page = read_page(response.iter_content(chunk_size=CHUNK_SIZE), offset=offset, budget_bytes=budget_bytes)
+    finally:
+        response.close()
+    if page.get("truncated"):
+        next_offset = page["seriesOffset"] + page["seriesReturned"]
+        page["continuation"] = encode_continuation(query, eval_time, next_offset)
+        page["message"] = (f"Returned series {page['seriesOffset'] + 1} to {next_offset} of {page['seriesTotal']}. "
+                           "Invoke the statement again with this continuation token to get the next series, "
+                           "or narrow the statement down with label filters or aggregations.")
+    return page
@@ -0,0 +1,212 @@
+# Server side summarization of large Prometheus and Loki responses.
+# This module is shared by the RoC service (stacks/roc_action_group/src) and the metrics Lambda
+# (stacks/metrics_action_group/lambda). Both are packaged from their own folder, so keep the two copies identical.
+#
+# When a response is larger than the size budget it is replaced by a compact digest before it is sent back
+# through the agent: per series statistics for metrics, and top patterns, label counts and sampled lines for logs.
+# The full response is parked in a result store and the digest carries the handle to fetch it. The digest is
+# trimmed until the summarized response fits the budget as well.
+import json
+import math
+import os
+import re
+from collections import Counter
+
+DEFAULT_BUDGET_BYTES = 100_000
+DEFAULT_MAX_SERIES = 50
+DEFAULT_TOP_PATTERNS = 20
+DEFAULT_SAMPLE_LINES = 20
+
+# Variable parts of log lines that are masked to group lines into patterns
+LOG_PATTERN_MASKS = [
+    (re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"), "<uuid>"),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<ip>"),
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"), "<ts>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b|\b[0-9a-fA-F]{16,}\b"), "<hex>"),
+    (re.compile(r"(?<![A-Za-z_])\d+(?:\.\d+)?"), "<num>"),
+]
+
+
+def payload_size(response):
+    return len(json.dumps(response, separators=(",", ":")))
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _to_floats(values):
+    floats = []
+    for value in values:
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            continue
+        if not math.isnan(number):
+            floats.append(number)
+    return floats
+
+
+def _sort_value(value):
+    floats = _to_floats([value])
+    return floats[0] if floats else float("-inf")
+
+
+def series_stats(samples):
+    values = _to_floats(value for _, value in samples)
+    if not values:
+        return {"samples": len(samples)}
+    ordered = sorted(values)
+    return {
+        "samples": len(samples),
+        "first_ts": samples[0][0],
+        "last_ts": samples[-1][0],
+        "min": ordered[0],
+        "max": ordered[-1],
+        "avg": sum(values) / len(values),
+        "last": values[-1],
+        "p50": percentile(ordered, 50),
+        "p90": percentile(ordered, 90),
+        "p99": percentile(ordered, 99),
+    }
+
+
+def label_counts(label_sets, max_values=10):
+    counts = {}
+    for labels in label_sets:
+        for name, value in labels.items():
+            counts.setdefault(name, Counter())[value] += 1
+    return {name: dict(counter.most_common(max_values)) for name, counter in counts.items()}
+
+
+# Digest of a Prometheus matrix or vector result
+def summarize_metrics(response, max_series=DEFAULT_MAX_SERIES):
+    data = response.get("data", {})
+    result_type = data.get("resultType")
+    result = data.get("result", [])
+    digest = {"resultType": result_type, "seriesCount": len(result)}
+
+    if result_type == "matrix":
+        series = [{"metric": item.get("metric", {}), **series_stats(item.get("values", []))} for item in result]
+        # Series with the largest peaks are the most likely to be interesting to the agent
+        series.sort(key=lambda item: item.get("max", float("-inf")), reverse=True)
+        digest["series"] = series[:max_series]
+    elif result_type == "vector":
+        series = [{"metric": item.get("metric", {}), "value": item.get("value", [None, None])[1]} for item in result]
+        values = sorted(_to_floats(item["value"] for item in series))
+        if values:
+            digest["valueStats"] = {
+                "min": values[0], "max": values[-1], "avg": sum(values) / len(values),
+                "p50": percentile(values, 50), "p90": percentile(values, 90), "p99": percentile(values, 99),
+            }
+        series.sort(key=lambda item: _sort_value(item["value"]), reverse=True)
+        digest["topSeries"] = series[:max_series]
+    else:
+        # Scalars and strings are already small
+        digest["result"] = result
+
+    digest["labelCounts"] = label_counts(item.get("metric", {}) for item in result if isinstance(item, dict))
+    return digest
+
+
+def log_pattern(line):
+    for regex, mask in LOG_PATTERN_MASKS:
+        line = regex.sub(mask, line)
+    return line
+
+
+# Digest of a Loki streams result
+def summarize_logs(response, top_patterns=DEFAULT_TOP_PATTERNS, sample_lines=DEFAULT_SAMPLE_LINES):
+    data = response.get("data", {})
+    if data.get("resultType") != "streams":
+        return summarize_metrics(response)
+
+    streams = data.get("result", [])
+    patterns = Counter()
+    entries = []
+    for stream in streams:
+        for ts, line in stream.get("values", []):
+            patterns[log_pattern(line)] += 1
+            entries.append((ts, line, stream.get("stream", {})))
+
+    # Evenly spaced sample across the whole result so both ends of the time range are represented
+    entries.sort(key=lambda entry: int(entry[0]))
+    step = max(1, len(entries) // sample_lines) if sample_lines else len(entries) + 1
+    samples = [{"ts": ts, "line": line, "stream": labels} for ts, line, labels in entries[::step][:sample_lines]]
+
+    line_counts = Counter()
+    for stream in streams:
+        for name, value in stream.get("stream", {}).items():
+            line_counts[(name, value)] += len(stream.get("values", []))
+    counts_by_label = {}
+    for (name, value), count in line_counts.most_common():
+        counts_by_label.setdefault(name, {})
+        if len(counts_by_label[name]) < 10:
+            counts_by_label[name][value] = count
+
+    return {
+        "resultType": "streams",
+        "streamCount": len(streams),
+        "lineCount": len(entries),
+        "firstTs": entries[0][0] if entries else None,
+        "lastTs": entries[-1][0] if entries else None,
+        "topPatterns": [{"pattern": pattern, "count": count} for pattern, count in patterns.most_common(top_patterns)],
+        "lineCountsByLabel": counts_by_label,
+        "sampledLines": samples,
+    }
+
+
+# Keeps at most limit entries of every list of a digest and values of every label. Series and patterns are sorted
+# by relevance and keep their head, sampled lines are thinned out evenly so both ends of the time range stay.
+def trim_digest(digest, limit):
+    trimmed = dict(digest)
+    for key in ("series", "topSeries", "topPatterns"):
+        if key in trimmed:
+            trimmed[key] = trimmed[key][:limit]
+    if "sampledLines" in trimmed:
+        samples = trimmed["sampledLines"]
+        trimmed["sampledLines"] = samples[::max(1, -(-len(samples) // limit))] if limit else []
+    for key in ("labelCounts", "lineCountsByLabel"):
+        if key in trimmed:
+            trimmed[key] = {name: dict(list(values.items())[:limit])
+                            for name, values in trimmed[key].items()} if limit else {}
+    return trimmed
+
+
+# Returns the response unchanged when it fits the budget, otherwise a digest with a handle to the full result
+def summarize_if_needed(response, result_store, budget_bytes=None):
+    budget_bytes = budget_bytes or int(os.environ.get("RESULT_SUMMARY_BUDGET_BYTES", DEFAULT_BUDGET_BYTES))
+    if not isinstance(response, dict) or "data" not in response:
+        return response
+    size = payload_size(response)
+    if size <= budget_bytes:
+        return response
+
+    if response["data"].get("resultType") == "streams":
+        digest = summarize_logs(response)
+    else:
+        digest = summarize_metrics(response)
+    handle = result_store.put(response)
+    summarized = {
+        "status": response.get("status"),
+        "summarized": True,
+        "originalBytes": size,
+        "resultHandle": handle,
+        "message": ("The result was too large and has been summarized. Use the resultHandle to fetch the result "
+                    "page by page."),
+        "summary": digest,
+    }
+    # Keep top level flags such as truncated from the original response
+    for key, value in response.items():
+        if key not in ("status", "data") and key not in summarized:
+            summarized[key] = value
+
+    # Halve the entries of the digest until the summarized response fits, an empty digest still has the counts
+    limit = max(DEFAULT_MAX_SERIES, DEFAULT_TOP_PATTERNS, DEFAULT_SAMPLE_LINES)
+    while limit and payload_size(summarized) > budget_bytes:
+        limit //= 2
+        summarized["summary"] = trim_digest(digest, limit)
+    return summarized
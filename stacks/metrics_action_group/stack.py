@@ -7,6 +7,7 @@ from aws_cdk import (
     aws_lambda as _lambda,
     aws_iam as iam,
     aws_logs as logs,
+    aws_s3 as s3,
     BundlingOptions,
     aws_secretsmanager as sm,
     CfnOutput,
@@ -19,16 +20,32 @@ class LambdaStack(Stack):
                  scope: Construct, 
                  construct_id: str,
                  secret_name: str,
+                 access_logs_bucket: s3.IBucket,
                  **kwargs
                  ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         secret = sm.Secret.from_secret_name_v2(self, "Secret", secret_name)
 
+        # Bedrock limits action group Lambda responses to about 25KB, every response of the function is kept under this budget
+        response_budget_bytes = "20000"
+
         log_group = logs.LogGroup(self, "LogGroup",
                                       log_group_name="metrics-action-group",
                                        removal_policy=cdk.RemovalPolicy.DESTROY )
 
+        # Full query results that were too large for the agent, readable from any execution environment by handle
+        results_bucket = s3.Bucket(self, "Results",
+            auto_delete_objects=True,
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True,
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            server_access_logs_bucket=access_logs_bucket,
+            server_access_logs_prefix="results-access-logs/",
+            lifecycle_rules=[s3.LifecycleRule(expiration=cdk.Duration.days(1))]
+        )
+
         lambda_function = _lambda.Function(
             self,
             "metrics-action-group",
@@ -57,7 +74,17 @@ class LambdaStack(Stack):
             environment = {
                 "POWERTOOLS_SERVICE_NAME": "MetricsLambdaAgent",
                 "POWERTOOLS_METRICS_NAMESPACE": "MetricsLambdaAgent",
-                "API_SECRET_NAME": secret.secret_name
+                "API_SECRET_NAME": secret.secret_name,
+                "DISCOVERY_CACHE_TTL_SECONDS": "300",
+                "GRAFANA_CREDENTIALS_MAX_AGE_SECONDS": "900",
+                "RESULT_SUMMARY_BUDGET_BYTES": response_budget_bytes,
+                # Summarized results are kept in S3 and fetched page by page, pages are sized in bytes for the Lambda response limit
+                "RESULT_STORE_BUCKET": results_bucket.bucket_name,
+                "RESULT_PAGE_BYTES": response_budget_bytes,
+                # Instant query results are paged to stay under the Bedrock Lambda response limit
+                "PROMQL_RESPONSE_BUDGET_BYTES": response_budget_bytes,
+                # Set to true to skip request validation for faster cold starts, see benchmarks/lambda_cold_start.py
+                "SLIM_MODE": "false"
             },
             initial_policy=[
                 iam.PolicyStatement(
@@ -69,3 +96,4 @@ class LambdaStack(Stack):
 
         self.lambda_function = lambda_function
         secret.grant_read(lambda_function)
+        results_bucket.grant_read_write(lambda_function)
@@ -1,18 +1,27 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Query, Body
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
 # from aws_lambda_powertools import Logger
 from aws_lambda_powertools import Tracer
 from aws_lambda_powertools import Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 import logging
-import requests
-from requests.exceptions import HTTPError
 from aws_lambda_powertools.utilities import parameters
-import os,sys
+import os,sys,time
+from typing import Optional, Literal, List
 from typing_extensions import Annotated
-requests.packages.urllib3.add_stderr_logger() 
-app = FastAPI()
-app.openapi_version = "3.0.0"
-app.title = "ReturnOfControlApis"
+from grafana_client import GrafanaClient, request_key
+from cache import TTLCache, ResultCache, create_cache_backend
+from credentials import GrafanaCredentialsProvider
+import asyncio
+import compact
+import loki
+import promql as promql_utils
+import summarize
+from result_store import ResultStore, create_result_backend, result_page
+from search_index import DiscoveryIndex
+from singleflight import SingleFlight
 tracer = Tracer()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -32,6 +41,117 @@ def get_env_var(var_name):
     except KeyError:
         logger.error(f"Environment variable {var_name} is not set.")
         return None
+
+# Shared Grafana Cloud clients, one per backend, created once at startup and reused across requests
+clients = {}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Identical in-flight calls from concurrent agent sessions share one upstream request
+    singleflight = SingleFlight("Grafana", metrics=metrics)
+    clients["loki"] = GrafanaClient("loki",
+                                    GrafanaCredentialsProvider(get_env_var("LOKI_API_SECRET_NAME"), secrets_provider=secretsmanager),
+                                    singleflight=singleflight)
+    clients["prometheus"] = GrafanaClient("prometheus",
+                                          GrafanaCredentialsProvider(get_env_var("PROM_API_SECRET_NAME"), secrets_provider=secretsmanager),
+                                          singleflight=singleflight)
+    index_refresh = asyncio.create_task(discovery_index.run(clients["prometheus"]))
+    yield
+    index_refresh.cancel()
+    for client in clients.values():
+        await client.close()
+    clients.clear()
+    await result_cache.close()
+
+# Label and metric names change rarely, cache them in process instead of calling Grafana Cloud on every agent plan
+discovery_cache = TTLCache("Discovery",
+                           ttl=int(os.environ.get("DISCOVERY_CACHE_TTL_SECONDS", 300)),
+                           maxsize=int(os.environ.get("DISCOVERY_CACHE_MAXSIZE", 64)),
+                           stale_ttl=int(os.environ.get("DISCOVERY_CACHE_STALE_SECONDS", 0)),
+                           metrics=metrics)
+
+# Searchable index of metric names, label names and label values, refreshed in the background every
+# INDEX_REFRESH_SECONDS so searches do not pull the full name lists from Grafana Cloud
+discovery_index = DiscoveryIndex()
+
+def is_success(response):
+    return isinstance(response, dict) and response.get('status') == 'success'
+
+# Fetches label or metric names through the discovery cache, only successful responses are cached
+async def get_discovery_data(backend, path):
+    async def load():
+        return (await clients[backend].get(path)).json()
+    return await discovery_cache.get_or_load((backend, path), load, should_cache=is_success)
+
+# Agents re-run the same statements across turns and sessions, cache their results per endpoint.
+# Set RESULT_CACHE_URL to a Redis compatible store to share the cache between Fargate tasks.
+result_cache = ResultCache("Result",
+                           create_cache_backend(os.environ.get("RESULT_CACHE_URL"),
+                                                max_bytes=int(os.environ.get("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))),
+                           ttls={
+                               "/api/v1/query": int(os.environ.get("RESULT_CACHE_TTL_PROMQL_SECONDS", 30)),
+                               "/api/v1/query_range": int(os.environ.get("RESULT_CACHE_TTL_PROMQL_RANGE_SECONDS", 60)),
+                               "/loki/api/v1/query_range": int(os.environ.get("RESULT_CACHE_TTL_LOGQL_SECONDS", 30)),
+                           },
+                           metrics=metrics)
+
+# Fetches a statement result through the result cache. The key is the normalized statement and its time range,
+# statements evaluated at "now" share a key for the TTL of the endpoint. Only successful results are cached.
+async def get_cached_result(path, params, loader):
+    params = {name: value for name, value in params.items() if value is not None}
+    key = request_key(path, params, time_bucket=result_cache.ttls.get(path) or 1)
+    return await result_cache.get_or_load(path, key, loader, should_cache=is_success)
+
+# Full results that were summarized because they exceeded the size budget, addressed by handle.
+# Set RESULT_STORE_BUCKET to share the results between Fargate tasks.
+result_store = ResultStore(backend=create_result_backend())
+
+# Replaces responses over the size budget with a compact digest, parking the full result in the result store.
+# Runs in a worker thread, sizing large results and writing them to the result store bucket would block the event loop.
+async def summarize_response(response):
+    summarized = await asyncio.to_thread(summarize.summarize_if_needed, response, result_store)
+    if summarized is not response:
+        metrics.add_metric(name="SummarizedResults", unit=MetricUnit.Count, value=1)
+    return summarized
+
+# Statement results are returned as JSON, or in the compact text encoding when RESPONSE_FORMAT (or the format
+# parameter) is compact. Errors and summaries have no compact form and stay JSON.
+default_response_format = os.environ.get("RESPONSE_FORMAT", "json")
+
+def encode_response(response, response_format=None):
+    if (response_format or default_response_format) == "compact":
+        text = compact.encode(response)
+        if text is not None:
+            metrics.add_metric(name="CompactResults", unit=MetricUnit.Count, value=1)
+            return text
+    return response
+
+# Compact results are sent as plain text, so they reach the agent as is without another JSON encoding
+def format_response(response, response_format=None):
+    encoded = encode_response(response, response_format)
+    return PlainTextResponse(encoded) if isinstance(encoded, str) else encoded
+
+# Runs a LogQL statement through the paged query_range reader
+async def run_logql_statement(logql, start=None, end=None, direction="backward"):
+    response = await get_cached_result(loki.QUERY_RANGE_PATH,
+                                       {'query': logql, 'start': start, 'end': end, 'direction': direction},
+                                       lambda: loki.query_range(clients["loki"], logql, start=start, end=end, direction=direction))
+    if response.get('truncated'):
+        metrics.add_metric(name="LogQLTruncatedResults", unit=MetricUnit.Count, value=1)
+    return await summarize_response(response)
+
+# Runs a PromQL statement as an instant query
+async def run_promql_statement(promql):
+    params = {'query': promql}
+    logger.debug(params)
+    async def load():
+        return (await clients["prometheus"].get("/api/v1/query", params=params)).json()
+    response = await get_cached_result("/api/v1/query", params, load)
+    return await summarize_response(response)
+
+app = FastAPI(lifespan=lifespan)
+app.openapi_version = "3.0.0"
+app.title = "ReturnOfControlApis"
     
 @app.get("/health", include_in_schema=False)
 def health_check():
@@ -41,35 +161,29 @@ def health_check():
          summary="Invokes a given logql statement",
          description="Makes GET HTTP to Grafana Cloud to invoke a specified logql statement passed in the input .This calls \
          /loki/api/v1/query_range endpoint from Grafana Loki host endpoint using basic authentication.\
+         Results are paged and capped, if the result has truncated set to true narrow the time range or add filters.\
          Secrets to call are stored in AWS Secrets Manager",
          operation_id="invokeLogqlStatement",
          tags=["GrafanaCloud","Loki","Statement"],
          response_description="LogQL Statement invocation results from Grafana Cloud"
          )
 @tracer.capture_method
-def invoke_logql_statement(
-    logql: Annotated[str, Query(description="The LogQL Statement to invoke", strict=True)]
+async def invoke_logql_statement(
+    logql: Annotated[str, Query(description="The LogQL Statement to invoke", strict=True)],
+    start: Annotated[Optional[str], Query(description="Start of the time range as RFC3339 or unix epoch, defaults to one hour before end")] = None,
+    end: Annotated[Optional[str], Query(description="End of the time range as RFC3339 or unix epoch, defaults to now")] = None,
+    direction: Annotated[Literal["backward", "forward"], Query(description="Order in which log lines are read, backward returns the newest lines first")] = "backward",
+    format: Annotated[Optional[Literal["json", "compact"]], Query(description="Response encoding, compact returns a tabular text encoding of the result")] = None
 ) -> Annotated[dict, Body(description="Results from the logql statement")]:
     # adding custom metrics
     # See: https://awslabs.github.io/aws-lambda-powertools-python/latest/core/metrics/
     metrics.add_metric(name="LogQLInvocations", unit=MetricUnit.Count, value=1)   
     # Try Except block to make Grafana Cloud API call
     try:
-        auth_key_pair = secretsmanager.get(get_env_var("LOKI_API_SECRET_NAME"), transform='json')
-        base_url = auth_key_pair['baseUrl']+"/loki/api/v1/query_range"
-        session = requests.Session()
-        session.auth = (auth_key_pair['username'], auth_key_pair['apikey'])
-        session.params = {
-                    'query': logql,
-                    'limit': 5000
-        }
-        response = session.get(base_url)
-        if response.headers['Content-Type'] == 'application/json':
-                    response = response.json()
-        else:
-                    response = {"error": response.content}
-        logger.info(response)
-        return response
+        return format_response(await run_logql_statement(logql, start=start, end=end, direction=direction), format)
+    except loki.LokiQueryError as e:
+        logger.error(str(e))
+        return {"error": str(e)}
             
     except Exception as e:
         logger.error(str(e))
@@ -85,7 +199,7 @@ def invoke_logql_statement(
          response_description="List of available Loki labels from Grafana Cloud"
          )
 @tracer.capture_method
-def get_available_loki_labels() -> Annotated[dict, Body(description="List of available Loki Labels from Grafana Cloud")]:
+async def get_available_loki_labels() -> Annotated[dict, Body(description="List of available Loki Labels from Grafana Cloud")]:
     # Adding custom logs
     logger.debug("get_available_labels - Invoked")
     # adding custom metrics
@@ -94,16 +208,8 @@ def get_available_loki_labels() -> Annotated[dict, Body(description="List of ava
 
     # Try Except block to make Grafana Cloud API call
     try:
-        auth_key_pair = secretsmanager.get(get_env_var("LOKI_API_SECRET_NAME"), transform='json')
-        base_url = auth_key_pair['baseUrl']+"/loki/api/v1/labels"
-        session = requests.Session()
-        session.auth = (auth_key_pair['username'], auth_key_pair['apikey'])   
-        
-        response = session.get(base_url).json()
-        logger.info("get_available_labels - HTTP 200")
-        #append status code in the response
-        logger.info(response)
-        logger.info(type(response))
+        response = await get_discovery_data("loki", "/loki/api/v1/labels")
+        logger.debug(f"get_available_labels - HTTP 200, {len(response.get('data') or [])} labels")
         return response
     except Exception as e:
         logger.error(str(e))
@@ -120,29 +226,126 @@ def get_available_loki_labels() -> Annotated[dict, Body(description="List of ava
          response_description="PromQL Statement invocation results from Grafana Cloud"
          )
 @tracer.capture_method
-def invoke_promql_statement(
-    promql: Annotated[str, Query(description="The PromQL Statement to invoke", strict=True)]
+async def invoke_promql_statement(
+    promql: Annotated[str, Query(description="The PromQL Statement to invoke", strict=True)],
+    format: Annotated[Optional[Literal["json", "compact"]], Query(description="Response encoding, compact returns a tabular text encoding of the result")] = None
 ) -> Annotated[dict, Body(description="Results from the promql statement")]:
     # adding custom metrics
     # See: https://awslabs.github.io/aws-lambda-powertools-python/latest/core/metrics/
     metrics.add_metric(name="PromQLInvocations", unit=MetricUnit.Count, value=1)   
     # Try Except block to make Grafana Cloud API call
     try:
-        auth_key_pair = secretsmanager.get(get_env_var("PROM_API_SECRET_NAME"), transform='json')
-        base_url = auth_key_pair['baseUrl']+"/api/v1/query"
-        session = requests.Session()
-        session.auth = (auth_key_pair['username'], auth_key_pair['apikey'])
-        # Using this because directly accessing the promql input is truncating the records after comma
-        # This does bypass the typing extension validation, but good enough to generate the openapi spec
-        # without compromising 
-        session.params = {'query': promql}
-        logger.debug(session.params)
-        response = session.get(base_url).json()
-        return response
+        return format_response(await run_promql_statement(promql), format)
     except Exception as e:
         logger.error(str(e))
         raise 
     
+@app.get("/invoke-promql-range", 
+         summary="Invokes a given promql statement over a time range",
+         description="Makes GET HTTP to Grafana Cloud to invoke a specified promql statement over a time range. This calls \
+         /api/v1/query_range endpoint from Grafana Prometheus host endpoint using basic authentication.\
+         Use this for trends over time instead of running many instant queries. The step is chosen automatically\
+         to keep the number of points per series bounded. Secrets to call are stored in AWS Secrets Manager",
+         operation_id="invokePromqlRangeStatement",
+         tags=["GrafanaCloud","Prometheus","Statement"],
+         response_description="PromQL range statement invocation results from Grafana Cloud"
+         )
+@tracer.capture_method
+async def invoke_promql_range_statement(
+    promql: Annotated[str, Query(description="The PromQL Statement to invoke", strict=True)],
+    start: Annotated[Optional[str], Query(description="Start of the time range as RFC3339, unix epoch or now-<duration> such as now-6h, defaults to one hour before end")] = None,
+    end: Annotated[Optional[str], Query(description="End of the time range as RFC3339, unix epoch or now, defaults to now")] = None,
+    step: Annotated[Optional[str], Query(description="Minimum resolution step as a duration such as 1m, chosen automatically when not set")] = None,
+    format: Annotated[Optional[Literal["json", "compact"]], Query(description="Response encoding, compact returns a tabular text encoding of the result")] = None
+) -> Annotated[dict, Body(description="Results from the promql range statement")]:
+    metrics.add_metric(name="PromQLRangeInvocations", unit=MetricUnit.Count, value=1)
+    try:
+        end_ts = promql_utils.parse_time(end, default=time.time())
+        start_ts = promql_utils.parse_time(start, default=end_ts - promql_utils.DEFAULT_LOOKBACK_SECONDS)
+        if start_ts >= end_ts:
+            return {"error": "start must be before end"}
+        min_step = promql_utils.parse_duration(step) if step else None
+    except ValueError as e:
+        return {"error": str(e)}
+
+    try:
+        resolution = promql_utils.choose_step(start_ts, end_ts, min_step=min_step)
+        ranges = promql_utils.split_range(start_ts, end_ts, resolution)
+        logger.debug(f"query_range {promql} step={resolution} sub-ranges={len(ranges)}")
+
+        # Sub-ranges are aligned to the step, so repeated queries over a moving window reuse cached sub-ranges.
+        # Only a few are fetched at a time, so one long range does not turn into a burst of Grafana Cloud calls.
+        semaphore = asyncio.Semaphore(int(os.environ.get("PROMQL_SPLIT_CONCURRENCY", promql_utils.DEFAULT_SPLIT_CONCURRENCY)))
+
+        async def fetch(sub_start, sub_end):
+            params = {
+                'query': promql,
+                'start': sub_start,
+                'end': sub_end,
+                'step': resolution,
+            }
+            async def load():
+                return (await clients["prometheus"].get("/api/v1/query_range", params=params)).json()
+            async with semaphore:
+                return await get_cached_result("/api/v1/query_range", params, load)
+
+        responses = await asyncio.gather(*[fetch(sub_start, sub_end) for sub_start, sub_end in ranges])
+        response = promql_utils.merge_range_results(responses)
+        response['step'] = resolution
+        return format_response(await summarize_response(response), format)
+    except Exception as e:
+        logger.error(str(e))
+        raise
+
+class Statement(BaseModel):
+    type: Literal["promql", "logql"] = Field(description="The statement language, promql or logql")
+    query: str = Field(description="The PromQL or LogQL statement to invoke")
+
+class BatchRequest(BaseModel):
+    statements: List[Statement] = Field(description="The PromQL and LogQL statements to invoke together", min_length=1)
+
+@app.post("/invoke-batch", 
+         summary="Invokes several promql and logql statements together",
+         description="Invokes a list of PromQL instant statements and LogQL statements against Grafana Cloud concurrently.\
+         Use this instead of invoking several simple statements one by one. Results are keyed by statement type and\
+         statement, for example promql:up, each result has a status of success, error or timeout. Secrets to call are stored in AWS Secrets Manager",
+         operation_id="invokeBatchStatements",
+         tags=["GrafanaCloud","Prometheus","Loki","Statement"],
+         response_description="Results of every statement keyed by statement"
+         )
+@tracer.capture_method
+async def invoke_batch_statements(
+    batch: Annotated[BatchRequest, Body(description="The statements to invoke")],
+    format: Annotated[Optional[Literal["json", "compact"]], Query(description="Response encoding, compact returns a tabular text encoding of the result")] = None
+) -> Annotated[dict, Body(description="Results of every statement keyed by statement")]:
+    metrics.add_metric(name="BatchInvocations", unit=MetricUnit.Count, value=1)
+    metrics.add_metric(name="BatchStatements", unit=MetricUnit.Count, value=len(batch.statements))
+    # Bounded concurrency and a per statement timeout, so one slow statement does not hold back the others
+    semaphore = asyncio.Semaphore(int(os.environ.get("BATCH_MAX_WORKERS", 8)))
+    timeout = float(os.environ.get("BATCH_STATEMENT_TIMEOUT_SECONDS", 25))
+
+    async def run(statement):
+        async with semaphore:
+            try:
+                if statement.type == "promql":
+                    result = await asyncio.wait_for(run_promql_statement(statement.query), timeout)
+                else:
+                    result = await asyncio.wait_for(run_logql_statement(statement.query), timeout)
+                return {"type": statement.type, "status": "success", "result": encode_response(result, format)}
+            except asyncio.TimeoutError:
+                metrics.add_metric(name="BatchStatementTimeouts", unit=MetricUnit.Count, value=1)
+                return {"type": statement.type, "status": "timeout",
+                        "error": f"Statement did not complete within {timeout} seconds"}
+            except Exception as e:
+                logger.error(f"Batch statement {statement.query} failed: {str(e)}")
+                return {"type": statement.type, "status": "error", "error": str(e)}
+
+    # Identical statements are only invoked once
+    statements = list({(statement.type, statement.query): statement for statement in batch.statements}.values())
+    results = await asyncio.gather(*[run(statement) for statement in statements])
+    # The same selector can be a PromQL and a LogQL statement, the type keeps their results apart
+    return {f"{statement.type}:{statement.query}": result for statement, result in zip(statements, results)}
+
 @app.get("/get-available-promql-labels", 
          summary="Get available PromQL filter labels from Grafana Cloud",
          description="Makes GET HTTP to Grafana Cloud to get a list of available filter labels .This calls \
@@ -153,7 +356,7 @@ def invoke_promql_statement(
          response_description="List of available Prometheus labels from Grafana Cloud"
          )
 @tracer.capture_method
-def get_available_prometheus_labels() -> Annotated[list, Body(description="List of available Prometheus Labels from Grafana Cloud")]:
+async def get_available_prometheus_labels() -> Annotated[list, Body(description="List of available Prometheus Labels from Grafana Cloud")]:
     # Adding custom logs
     logger.debug("get_available_labels - Invoked")
     # adding custom metrics
@@ -162,12 +365,7 @@ def get_available_prometheus_labels() -> Annotated[list, Body(description="List
 
     # Try Except block to make Grafana Cloud API call
     try:
-        auth_key_pair = secretsmanager.get(get_env_var("PROM_API_SECRET_NAME"), transform='json')
-        base_url = auth_key_pair['baseUrl']+"/api/v1/labels"
-        session = requests.Session()
-        session.auth = (auth_key_pair['username'], auth_key_pair['apikey'])   
-        
-        response = session.get(base_url).json()
+        response = await get_discovery_data("prometheus", "/api/v1/labels")
         logger.debug("get_available_labels - HTTP 200")
         return response['data']
     except Exception as e:
@@ -186,7 +384,7 @@ def get_available_prometheus_labels() -> Annotated[list, Body(description="List
          response_description="List of available Prometheus metric namesfrom Grafana Cloud"
          )
 @tracer.capture_method
-def get_available_metric_names() -> Annotated[list, Body(description="List of available Prometheus metric names from Grafana Cloud")]:
+async def get_available_metric_names() -> Annotated[list, Body(description="List of available Prometheus metric names from Grafana Cloud")]:
     # Adding custom logs
     logger.debug("get-available-metric-names - Invoked")
     # adding custom metrics
@@ -195,14 +393,99 @@ def get_available_metric_names() -> Annotated[list, Body(description="List of av
 
     # Try Except block to make Grafana Cloud API call
     try:
-        auth_key_pair = secretsmanager.get(get_env_var("PROM_API_SECRET_NAME"), transform='json')
-        base_url = auth_key_pair['baseUrl']+"/api/v1/label/__name__/values"
-        session = requests.Session()
-        session.auth = (auth_key_pair['username'], auth_key_pair['apikey'])   
-        
-        response = session.get(base_url).json()
+        response = await get_discovery_data("prometheus", "/api/v1/label/__name__/values")
         logger.debug("get_available_metrics - HTTP 200")
         return response['data']
     except Exception as e:
         logger.error(str(e))
-        raise 
\ No newline at end of file
+        raise
+
+@app.get("/search-metrics", 
+         summary="Searches the available prometheus metric names",
+         description="Returns the Prometheus metric names that best match the query, ranked by score from 0 to 1.\
+         Matches on the start of the name, on words of the name (e.g. cpu seconds matches node_cpu_seconds_total)\
+         and on partial or misspelled names. Use this instead of listing every available metric name.",
+         operation_id="searchPrometheusMetricNames",
+         tags=["GrafanaCloud","Prometheus","Metrics"],
+         response_description="Best matching Prometheus metric names"
+         )
+@tracer.capture_method
+async def search_metric_names(
+    q: Annotated[str, Query(description="Metric name, part of a name or words to search for", min_length=1)],
+    limit: Annotated[int, Query(description="Maximum number of matches to return", ge=1, le=50)] = 10
+) -> Annotated[dict, Body(description="Best matching Prometheus metric names")]:
+    metrics.add_metric(name="SearchMetricsInvocations", unit=MetricUnit.Count, value=1)
+    try:
+        await discovery_index.ensure_ready(clients["prometheus"])
+        return {"matches": discovery_index.search_metrics(q, limit), "metricNames": len(discovery_index.metric_names)}
+    except Exception as e:
+        logger.error(str(e))
+        raise
+
+@app.get("/search-labels", 
+         summary="Searches the available prometheus labels and label values",
+         description="Returns the Prometheus label names and label values that best match the query, ranked by score from 0 to 1.\
+         Label value matches come with their label name, for example {label: job, value: node-exporter}.\
+         Use this to find the labels and values to filter a PromQL statement on instead of listing every label.",
+         operation_id="searchPrometheusLabels",
+         tags=["GrafanaCloud","Prometheus","Labels"],
+         response_description="Best matching Prometheus label names and values"
+         )
+@tracer.capture_method
+async def search_labels(
+    q: Annotated[str, Query(description="Label name, label value or part of one to search for", min_length=1)],
+    limit: Annotated[int, Query(description="Maximum number of matches to return", ge=1, le=50)] = 10
+) -> Annotated[dict, Body(description="Best matching Prometheus label names and values")]:
+    metrics.add_metric(name="SearchLabelsInvocations", unit=MetricUnit.Count, value=1)
+    try:
+        await discovery_index.ensure_ready(clients["prometheus"])
+        return {"matches": discovery_index.search_labels(q, limit)}
+    except Exception as e:
+        logger.error(str(e))
+        raise
+
+@app.get("/fetch-result", 
+         summary="Fetches the full result of a summarized statement invocation",
+         description="Returns the full result of a PromQL or LogQL statement invocation that was summarized because it was too large.\
+         Pass the resultHandle from the summarized response. Results are kept for a limited time only.",
+         operation_id="fetchResult",
+         tags=["Results"],
+         response_description="Full result of the statement invocation"
+         )
+@tracer.capture_method
+async def fetch_result(
+    handle: Annotated[str, Query(description="The resultHandle from a summarized response", strict=True)],
+    format: Annotated[Optional[Literal["json", "compact"]], Query(description="Response encoding, compact returns a tabular text encoding of the result")] = None
+) -> Annotated[dict, Body(description="Full result of the statement invocation")]:
+    metrics.add_metric(name="FetchResultInvocations", unit=MetricUnit.Count, value=1)
+    result = await asyncio.to_thread(result_store.get, handle)
+    if result is None:
+        return {"error": f"No result found for handle {handle}, it may have expired. Invoke the statement again."}
+    return format_response(result, format)
+
+@app.get("/fetch-result-page", 
+         summary="Fetches one page of the full result of a summarized statement invocation",
+         description="Returns one page of the full result of a PromQL or LogQL statement invocation that was summarized because it was too large.\
+         Metric results are paged by series and log results by log line, the same handle and page always return the same page.\
+         The response has the page number, the number of pages, the range of series or log lines on the page and their total.\
+         Fetch only the pages needed to answer instead of invoking the statement again.",
+         operation_id="fetchResultPage",
+         tags=["Results"],
+         response_description="One page of the full result of the statement invocation"
+         )
+@tracer.capture_method
+async def fetch_result_page(
+    handle: Annotated[str, Query(description="The resultHandle from a summarized response", strict=True)],
+    page: Annotated[int, Query(description="The page to fetch, starting at 1", ge=1)] = 1,
+    format: Annotated[Optional[Literal["json", "compact"]], Query(description="Response encoding, compact returns a tabular text encoding of the result")] = None
+) -> Annotated[dict, Body(description="One page of the full result of the statement invocation")]:
+    metrics.add_metric(name="FetchResultPageInvocations", unit=MetricUnit.Count, value=1)
+    result = await asyncio.to_thread(result_store.get, handle)
+    if result is None:
+        return {"error": f"No result found for handle {handle}, it may have expired. Invoke the statement again."}
+    try:
+        response = result_page(result, page)
+    except ValueError as e:
+        return {"error": str(e)}
+    response["resultHandle"] = handle
+    return format_response(response, format)
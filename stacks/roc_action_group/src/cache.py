@@ -0,0 +1,211 @@
+# In-process TTL caches for near-static Grafana Cloud data (label names, metric names), and the
+# query result cache for PromQL and LogQL statements.
+# Discovery entries are bounded by size (least recently used entries are evicted first) and by age.
+# With stale_ttl set, an expired entry is still served for that many extra seconds while a
+# background task refreshes it (stale-while-revalidate), so callers never wait on the refresh.
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from aws_lambda_powertools.metrics import MetricUnit
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+
+    def __init__(self, value, ttl, stale_ttl):
+        now = time.monotonic()
+        self.value = value
+        self.expires_at = now + ttl
+        self.stale_until = self.expires_at + stale_ttl
+
+
+class TTLCache:
+
+    def __init__(self, name, ttl, maxsize, stale_ttl=0, metrics=None):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        self.metrics = metrics
+        self._entries = OrderedDict()
+        self._refreshing = {}
+
+    def _add_metric(self, name):
+        if self.metrics is not None:
+            self.metrics.add_metric(name=f"{self.name}{name}", unit=MetricUnit.Count, value=1)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() >= entry.stale_until:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key, value):
+        self._entries[key] = CacheEntry(value, self.ttl, self.stale_ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    # Returns the cached value for the key, calling the async loader on a miss.
+    # should_cache decides if a loaded value is kept, e.g. to skip caching error responses.
+    async def get_or_load(self, key, loader, should_cache=None):
+        entry = self.get(key)
+        if entry is not None:
+            if time.monotonic() < entry.expires_at:
+                self._add_metric("CacheHits")
+                return entry.value
+            self._add_metric("CacheStaleHits")
+            self._refresh_in_background(key, loader, should_cache)
+            return entry.value
+
+        self._add_metric("CacheMisses")
+        value = await loader()
+        if should_cache is None or should_cache(value):
+            self.set(key, value)
+        return value
+
+    def _refresh_in_background(self, key, loader, should_cache):
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                value = await loader()
+                if should_cache is None or should_cache(value):
+                    self.set(key, value)
+                    self._add_metric("CacheRefreshes")
+            except Exception as e:
+                logger.error(f"{self.name} cache refresh for {key} failed: {str(e)}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        # Keep a reference to the task so it is not garbage collected while running
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+
+# Storage for the query result cache. Values are JSON strings so the same results can be kept in process or
+# in a shared Redis compatible store, letting several Fargate tasks share cache hits.
+class InMemoryCacheBackend:
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self.size += len(value)
+        # Least recently used results are evicted first until the cache fits its memory bound
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    async def close(self):
+        self._entries.clear()
+        self.size = 0
+
+
+class RedisCacheBackend:
+
+    def __init__(self, url, prefix="roc:"):
+        # Optional dependency, only needed when a shared cache is configured
+        import redis.asyncio as redis
+        self.prefix = prefix
+        self.client = redis.from_url(url)
+
+    async def get(self, key):
+        value = await self.client.get(self.prefix + key)
+        return value.decode() if value is not None else None
+
+    async def set(self, key, value, ttl):
+        await self.client.set(self.prefix + key, value, ex=ttl)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+# Returns the shared backend when a Redis compatible URL is configured, the in process backend otherwise
+def create_cache_backend(url=None, max_bytes=64 * 1024 * 1024):
+    if url:
+        try:
+            return RedisCacheBackend(url)
+        except ImportError:
+            logger.error("RESULT_CACHE_URL is set but the redis package is not installed, using the in process cache")
+    return InMemoryCacheBackend(max_bytes)
+
+
+# Cache for PromQL and LogQL results. Entries are keyed by a request key (normalized statement plus an
+# aligned time range), each endpoint path has its own TTL and paths without a TTL are not cached.
+class ResultCache:
+
+    def __init__(self, name, backend, ttls, metrics=None):
+        self.name = name
+        self.backend = backend
+        self.ttls = ttls
+        self.metrics = metrics
+
+    def _add_metric(self, name):
+        if self.metrics is not None:
+            self.metrics.add_metric(name=f"{self.name}{name}", unit=MetricUnit.Count, value=1)
+
+    @staticmethod
+    def _hash(key):
+        return hashlib.sha256(json.dumps(key, default=str).encode()).hexdigest()
+
+    async def get_or_load(self, path, key, loader, should_cache=None):
+        ttl = self.ttls.get(path)
+        if not ttl:
+            return await loader()
+
+        cache_key = self._hash(key)
+        try:
+            cached = await self.backend.get(cache_key)
+        except Exception as e:
+            # The cache is an optimisation, a failing shared backend must not fail the request
+            logger.error(f"{self.name} cache get failed: {str(e)}")
+            cached = None
+        if cached is not None:
+            self._add_metric("CacheHits")
+            return json.loads(cached)
+
+        self._add_metric("CacheMisses")
+        value = await loader()
+        if should_cache is None or should_cache(value):
+            try:
+                await self.backend.set(cache_key, json.dumps(value, separators=(",", ":")), ttl)
+            except Exception as e:
+                logger.error(f"{self.name} cache set failed: {str(e)}")
+        return value
+
+    async def close(self):
+        await self.backend.close()
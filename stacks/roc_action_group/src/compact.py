@@ -0,0 +1,147 @@
+# Compact text encoding of Prometheus and Loki query results for the agent.
+# The JSON returned by Grafana Cloud repeats every label set, timestamp and quote for every sample.
+# The compact encoding writes labels shared by all series once, the remaining labels once per series,
+# regular sample timestamps as a start and step, and values rounded to a few significant digits.
+# Log lines are grouped per stream with the date written only when it changes.
+import math
+import os
+from datetime import datetime, timezone
+
+DEFAULT_VALUE_DIGITS = 4
+# Top level keys added by the RoC service (paging, range step, result pages) that are written to the header line
+EXTRA_KEYS = ("step", "lines", "bytes", "truncated", "resultHandle", "page", "pages", "range", "total")
+
+
+def format_value(value, digits):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    if math.isnan(number) or math.isinf(number):
+        return str(value)
+    if number == int(number) and abs(number) < 1e15:
+        return str(int(number))
+    return f"{number:.{digits}g}"
+
+
+def format_timestamp(ts):
+    ts = float(ts)
+    return str(int(ts)) if ts == int(ts) else f"{ts:.3f}"
+
+
+# Escapes label values like the Prometheus text format, so quotes and line breaks in a value do not break the line
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    return "{" + ", ".join(f'{name}="{escape_label_value(value)}"' for name, value in sorted(labels.items())) + "}"
+
+
+# Labels with the same value in every label set
+def common_labels(label_sets):
+    if len(label_sets) < 2:
+        return {}
+    common = dict(label_sets[0])
+    for labels in label_sets[1:]:
+        common = {name: value for name, value in common.items() if labels.get(name) == value}
+    return common
+
+
+def without(labels, common):
+    return {name: value for name, value in labels.items() if name not in common}
+
+
+def header(response, result_type, count_name, count):
+    fields = [f"resultType={result_type}", f"{count_name}={count}"]
+    fields.extend(f"{key}={str(response[key]).lower() if isinstance(response[key], bool) else response[key]}"
+                  for key in EXTRA_KEYS if key in response)
+    lines = [" ".join(fields)]
+    for warning in response.get("warnings", []):
+        lines.append(f"warning: {warning}")
+    if response.get("truncationMarker"):
+        lines.append(response["truncationMarker"])
+    return lines
+
+
+def encode_matrix(response, result, digits):
+    lines = header(response, "matrix", "series", len(result))
+    common = common_labels([series.get("metric", {}) for series in result])
+    if common:
+        lines.append(f"common {format_labels(common)}")
+    for series in result:
+        lines.append(format_labels(without(series.get("metric", {}), common)))
+        samples = series.get("values", [])
+        if not samples:
+            continue
+        timestamps = [float(ts) for ts, _ in samples]
+        values = " ".join(format_value(value, digits) for _, value in samples)
+        steps = {round(b - a, 3) for a, b in zip(timestamps, timestamps[1:])}
+        if len(steps) <= 1:
+            # Regular samples, the timestamps are implied by start and step
+            step = steps.pop() if steps else 0
+            lines.append(f"start={format_timestamp(timestamps[0])} step={format_timestamp(step)} values={values}")
+        else:
+            lines.append("samples=" + " ".join(f"{format_timestamp(ts)}:{format_value(value, digits)}" for ts, value in samples))
+    return lines
+
+
+def encode_vector(response, result, digits):
+    lines = header(response, "vector", "series", len(result))
+    common = common_labels([sample.get("metric", {}) for sample in result])
+    if common:
+        lines.append(f"common {format_labels(common)}")
+    times = {sample["value"][0] for sample in result if "value" in sample}
+    # Instant queries evaluate every series at the same time, write it once
+    shared_time = times.pop() if len(times) == 1 else None
+    if shared_time is not None:
+        lines.append(f"time={format_timestamp(shared_time)}")
+    for sample in result:
+        ts, value = sample.get("value", [None, None])
+        line = f"{format_labels(without(sample.get('metric', {}), common))} {format_value(value, digits)}"
+        if shared_time is None and ts is not None:
+            line += f" @{format_timestamp(ts)}"
+        lines.append(line)
+    return lines
+
+
+def encode_streams(response, result):
+    lines = header(response, "streams", "streams", len(result))
+    common = common_labels([stream.get("stream", {}) for stream in result])
+    if common:
+        lines.append(f"common {format_labels(common)}")
+    for stream in result:
+        lines.append(format_labels(without(stream.get("stream", {}), common)))
+        current_date = None
+        for ts, line in stream.get("values", []):
+            moment = datetime.fromtimestamp(int(ts) / 1e9, tz=timezone.utc)
+            date = moment.strftime("%Y-%m-%d")
+            if date != current_date:
+                lines.append(f"date={date}")
+                current_date = date
+            # Every log line takes one line of the encoding, multi-line entries such as stack traces are escaped
+            escaped = line.replace("\\", "\\\\").replace("\n", "\\n")
+            lines.append(f"{moment.strftime('%H:%M:%S.%f')[:-3]} {escaped}")
+    return lines
+
+
+# Encodes a successful query response, returns None for responses that have no compact form
+# (errors, summaries) so the caller can fall back to JSON
+def encode(response, digits=None):
+    if not isinstance(response, dict) or response.get("status") != "success" or "data" not in response:
+        return None
+    digits = digits or int(os.environ.get("COMPACT_VALUE_DIGITS", DEFAULT_VALUE_DIGITS))
+    data = response["data"]
+    result_type = data.get("resultType")
+    result = data.get("result", [])
+    if result_type == "matrix":
+        lines = encode_matrix(response, result, digits)
+    elif result_type == "vector":
+        lines = encode_vector(response, result, digits)
+    elif result_type == "streams":
+        lines = encode_streams(response, result)
+    elif result_type in ("scalar", "string"):
+        lines = [f"resultType={result_type} time={format_timestamp(result[0])} value={format_value(result[1], digits)}"]
+    else:
+        return None
+    return "\n".join(lines)
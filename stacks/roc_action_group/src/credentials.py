@@ -0,0 +1,95 @@
+# Cached Grafana Cloud credentials resolved from AWS Secrets Manager.
+# This module is shared by the RoC service (stacks/roc_action_group/src) and the metrics Lambda
+# (stacks/metrics_action_group/lambda). Both are packaged from their own folder, so keep the two copies identical.
+#
+# The secret is resolved once and the parsed base URL and basic auth tuple are kept for max_age seconds.
+# Within refresh_ahead seconds of expiry the secret is re-read on a background thread while the cached
+# value keeps being served, so Secrets Manager is off the hot path. Callers invalidate the cache when
+# Grafana answers 401 (e.g. after a key rotation), which forces a fresh read on the next call.
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE_SECONDS = 900
+DEFAULT_REFRESH_AHEAD_SECONDS = 60
+
+
+class GrafanaCredentials:
+
+    def __init__(self, base_url, username, apikey):
+        self.base_url = base_url
+        self.auth = (username, apikey)
+
+
+class GrafanaCredentialsProvider:
+
+    def __init__(self, secret_name, max_age=None, refresh_ahead=None, secrets_provider=None):
+        self.secret_name = secret_name
+        self.max_age = max_age or int(os.environ.get("GRAFANA_CREDENTIALS_MAX_AGE_SECONDS", DEFAULT_MAX_AGE_SECONDS))
+        if refresh_ahead is None:
+            refresh_ahead = int(os.environ.get("GRAFANA_CREDENTIALS_REFRESH_AHEAD_SECONDS", DEFAULT_REFRESH_AHEAD_SECONDS))
+        self.refresh_ahead = min(refresh_ahead, self.max_age)
+        self._secrets_provider = secrets_provider
+        self._credentials = None
+        self._expires_at = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    # The Secrets Manager provider (and boto3) is only loaded on the first read, keeping it out of cold start imports
+    @property
+    def secrets_provider(self):
+        if self._secrets_provider is None:
+            from aws_lambda_powertools.utilities import parameters
+            self._secrets_provider = parameters.SecretsProvider()
+        return self._secrets_provider
+
+    def _load(self):
+        # force_fetch skips the Powertools provider cache, the age of the secret is managed here
+        auth_key_pair = self.secrets_provider.get(self.secret_name, transform='json', force_fetch=True)
+        credentials = GrafanaCredentials(auth_key_pair['baseUrl'], auth_key_pair['username'], auth_key_pair['apikey'])
+        with self._lock:
+            self._credentials = credentials
+            self._expires_at = time.monotonic() + self.max_age
+        return credentials
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self._load()
+            except Exception as e:
+                # Keep serving the cached credentials until they expire
+                logger.error(f"Background refresh of secret {self.secret_name} failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    # Returns the cached credentials without blocking, or None when they need to be (re)loaded
+    def get_cached(self):
+        with self._lock:
+            credentials = self._credentials
+            remaining = self._expires_at - time.monotonic()
+        if credentials is None or remaining <= 0:
+            return None
+        if remaining <= self.refresh_ahead:
+            self._refresh_in_background()
+        return credentials
+
+    # Returns the credentials, reading the secret from Secrets Manager only when the cache is empty or expired
+    def get(self):
+        return self.get_cached() or self._load()
+
+    def invalidate(self):
+        logger.info(f"Invalidating cached credentials for secret {self.secret_name}")
+        with self._lock:
+            self._credentials = None
+            self._expires_at = 0
@@ -0,0 +1,119 @@
+# Long lived, connection pooled async HTTP clients for the Grafana Cloud backends (Loki and Prometheus)
+# One client is created per backend at application startup and shared by every request, so agent
+# tool calls reuse kept-alive TCP/TLS connections instead of paying a new handshake on each call,
+# and many Grafana queries can be in flight at once without tying up a worker thread each.
+import logging
+import os
+import re
+import time
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing defaults, can be overridden with environment variables on the Fargate task.
+# Each client only talks to a single Grafana host, so the connection limit is also the per host limit.
+DEFAULT_POOL_MAXSIZE = 100
+DEFAULT_POOL_MAX_KEEPALIVE = 20
+DEFAULT_KEEPALIVE_EXPIRY_SECONDS = 60
+DEFAULT_TIMEOUT_SECONDS = 30
+DEFAULT_COALESCE_TIME_BUCKET_SECONDS = 1
+
+
+def _int_env(var_name, default):
+    try:
+        return int(os.environ.get(var_name, default))
+    except ValueError:
+        logger.error(f"Environment variable {var_name} is not an integer, using {default}")
+        return default
+
+
+# Parameters that carry a PromQL or LogQL statement
+QUERY_PARAMS = ("query", "match[]")
+# Parameters that carry a time, requests without them are evaluated at "now"
+TIME_PARAMS = ("time", "start", "end")
+# Quoted strings (double, single or backtick) in a statement, these are kept verbatim
+QUOTED_STRING = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`[^`]*`')
+WHITESPACE = re.compile(r"\s+")
+PUNCTUATION_SPACING = re.compile(r" ?([{}()\[\],=!~<>]) ?")
+
+
+# Collapses insignificant whitespace in a PromQL or LogQL statement, leaving quoted strings untouched
+def normalize_query(query):
+    parts = []
+    position = 0
+    for match in QUOTED_STRING.finditer(query):
+        parts.append(PUNCTUATION_SPACING.sub(r"\1", WHITESPACE.sub(" ", query[position:match.start()])))
+        parts.append(match.group(0))
+        position = match.end()
+    parts.append(PUNCTUATION_SPACING.sub(r"\1", WHITESPACE.sub(" ", query[position:])))
+    return "".join(parts).strip()
+
+
+# Key identifying a Grafana API call: path, normalized statement and the remaining parameters.
+# Calls without an explicit time are evaluated at "now", they are bucketed by time_bucket seconds.
+def request_key(path, params=None, time_bucket=1):
+    params = dict(params or {})
+    for name in QUERY_PARAMS:
+        if name in params:
+            params[name] = normalize_query(str(params[name]))
+    key = [path] + sorted((name, str(value)) for name, value in params.items())
+    if not any(name in params for name in TIME_PARAMS):
+        key.append(("now", int(time.time() // time_bucket)))
+    return tuple(key)
+
+
+class GrafanaClient:
+
+    def __init__(self,
+                 name,
+                 credentials,
+                 singleflight=None,
+                 pool_maxsize=None,
+                 pool_max_keepalive=None,
+                 keepalive_expiry=None,
+                 timeout=None):
+        self.name = name
+        self.credentials = credentials
+        self.singleflight = singleflight
+        self.time_bucket = _int_env("GRAFANA_COALESCE_TIME_BUCKET_SECONDS", DEFAULT_COALESCE_TIME_BUCKET_SECONDS)
+        self.pool_maxsize = pool_maxsize or _int_env("GRAFANA_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE)
+        self.pool_max_keepalive = pool_max_keepalive or _int_env("GRAFANA_POOL_MAX_KEEPALIVE", DEFAULT_POOL_MAX_KEEPALIVE)
+        self.keepalive_expiry = keepalive_expiry or _int_env("GRAFANA_KEEPALIVE_EXPIRY_SECONDS", DEFAULT_KEEPALIVE_EXPIRY_SECONDS)
+        self.timeout = timeout or _int_env("GRAFANA_TIMEOUT_SECONDS", DEFAULT_TIMEOUT_SECONDS)
+
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.pool_maxsize,
+                                max_keepalive_connections=self.pool_max_keepalive,
+                                keepalive_expiry=self.keepalive_expiry),
+            timeout=httpx.Timeout(self.timeout),
+        )
+        logger.info(f"{self.name} client created with pool_maxsize={self.pool_maxsize} "
+                    f"pool_max_keepalive={self.pool_max_keepalive} keepalive_expiry={self.keepalive_expiry}")
+
+    async def _get_credentials(self):
+        # Secrets Manager lookups go through boto3 which is blocking, keep them off the event loop
+        return self.credentials.get_cached() or await run_in_threadpool(self.credentials.get)
+
+    # Makes a GET call to the given Grafana API path. Identical calls already in flight are coalesced into one
+    async def get(self, path, params=None):
+        if self.singleflight is None:
+            return await self._get(path, params)
+        return await self.singleflight.do((self.name,) + request_key(path, params, self.time_bucket),
+                                          lambda: self._get(path, params))
+
+    # Makes a GET call to the given Grafana API path using the cached credentials from Secrets Manager
+    async def _get(self, path, params=None):
+        credentials = await self._get_credentials()
+        response = await self.client.get(credentials.base_url + path, params=params, auth=credentials.auth)
+        if response.status_code == 401:
+            # The API key may have been rotated, re-read the secret and retry once
+            logger.warning(f"{self.name} returned 401, refreshing credentials")
+            self.credentials.invalidate()
+            credentials = await self._get_credentials()
+            response = await self.client.get(credentials.base_url + path, params=params, auth=credentials.auth)
+        return response
+
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,198 @@
+# Paged reads of Loki query_range results.
+# Instead of pulling a single large page, query_range is called repeatedly with a small page limit,
+# moving the time window past the last entry seen. Pages are consumed incrementally and collection
+# stops as soon as a line or byte budget is reached, so memory stays flat on large log volumes and
+# the agent receives a bounded result with an explicit truncation marker.
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+QUERY_RANGE_PATH = "/loki/api/v1/query_range"
+DEFAULT_LOOKBACK_SECONDS = 3600
+DEFAULT_PAGE_LIMIT = 1000
+DEFAULT_MAX_LINES = 5000
+DEFAULT_MAX_BYTES = 1_000_000
+
+
+class LokiQueryError(Exception):
+    pass
+
+
+# Converts a Loki time parameter (RFC3339, unix seconds or unix nanoseconds) to unix nanoseconds
+def parse_time_ns(value):
+    if value is None or value == "":
+        return None
+    try:
+        number = float(value)
+        # Values this large are already nanoseconds, anything else is treated as seconds
+        return int(number) if number > 1e14 else int(number * 1e9)
+    except ValueError:
+        return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1e9)
+
+
+def stream_key(labels):
+    return json.dumps(labels, sort_keys=True)
+
+
+async def get_page(client, logql, start_ns, end_ns, limit, direction):
+    response = await client.get(QUERY_RANGE_PATH, params={
+        'query': logql,
+        'start': start_ns,
+        'end': end_ns,
+        'limit': limit,
+        'direction': direction,
+    })
+    if not response.headers.get('Content-Type', '').startswith('application/json'):
+        raise LokiQueryError(response.text)
+    return response.json()
+
+
+# Yields the streams of every query_range page, moving the window until it is exhausted.
+# Metric queries (matrix results) are not paged and are yielded as a single page.
+async def iter_query_range(client, logql, start_ns, end_ns, direction="backward", page_limit=DEFAULT_PAGE_LIMIT):
+    # Entries at the page boundary timestamp are requested again on the next page, these are skipped
+    boundary_ts = None
+    boundary_seen = set()
+    while start_ns < end_ns:
+        page = await get_page(client, logql, start_ns, end_ns, page_limit, direction)
+        data = page.get('data', {})
+        if data.get('resultType') != 'streams':
+            yield page
+            return
+
+        entries = 0
+        new_entries = 0
+        last_ts = None
+        page_boundary = set()
+        streams = []
+        for stream in data.get('result', []):
+            key = stream_key(stream.get('stream', {}))
+            values = []
+            for ts, line in stream.get('values', []):
+                entries += 1
+                ts_int = int(ts)
+                if ts_int == boundary_ts and (key, line) in boundary_seen:
+                    continue
+                values.append([ts, line])
+                if last_ts is None or (ts_int < last_ts if direction == "backward" else ts_int > last_ts):
+                    last_ts = ts_int
+                    page_boundary = set()
+                if ts_int == last_ts:
+                    page_boundary.add((key, line))
+            if values:
+                new_entries += len(values)
+                streams.append({'stream': stream.get('stream', {}), 'values': values})
+
+        if streams:
+            yield {'status': page.get('status'), 'data': {'resultType': 'streams', 'result': streams}}
+
+        # A short page means the window is exhausted
+        if entries < page_limit:
+            return
+        if new_entries == 0:
+            # More entries share the boundary timestamp than fit in a page and the window cannot move. That timestamp
+            # is read alone with a limit past the entries seen so far, then the window steps past it. Entries beyond
+            # that limit are skipped and the page reports the timestamp as skippedTs.
+            limit = len(boundary_seen) + page_limit
+            page = await get_page(client, logql, boundary_ts, boundary_ts + 1, limit, direction)
+            entries = 0
+            streams = []
+            for stream in page.get('data', {}).get('result', []):
+                key = stream_key(stream.get('stream', {}))
+                entries += len(stream.get('values', []))
+                values = [[ts, line] for ts, line in stream.get('values', []) if (key, line) not in boundary_seen]
+                if values:
+                    streams.append({'stream': stream.get('stream', {}), 'values': values})
+            gap = {'status': page.get('status'), 'data': {'resultType': 'streams', 'result': streams}}
+            if entries >= limit:
+                gap['skippedTs'] = boundary_ts
+            yield gap
+            if direction == "backward":
+                end_ns = boundary_ts
+            else:
+                start_ns = boundary_ts + 1
+            boundary_ts = None
+            boundary_seen = set()
+            continue
+        if last_ts != boundary_ts:
+            boundary_seen = set()
+        boundary_ts = last_ts
+        boundary_seen |= page_boundary
+        # Loki end is exclusive and start inclusive, keep the boundary timestamp in the next window
+        if direction == "backward":
+            end_ns = last_ts + 1
+        else:
+            start_ns = last_ts
+
+
+# Collects paged query_range results until the line or byte budget is exhausted
+async def query_range(client, logql, start=None, end=None, direction="backward",
+                      page_limit=None, max_lines=None, max_bytes=None):
+    page_limit = page_limit or int(os.environ.get("LOKI_PAGE_LIMIT", DEFAULT_PAGE_LIMIT))
+    max_lines = max_lines or int(os.environ.get("LOKI_MAX_LINES", DEFAULT_MAX_LINES))
+    max_bytes = max_bytes or int(os.environ.get("LOKI_MAX_BYTES", DEFAULT_MAX_BYTES))
+    # Default end is aligned to the second so identical concurrent queries send identical requests
+    end_ns = parse_time_ns(end)
+    if end_ns is None:
+        end_ns = time.time_ns() // 1_000_000_000 * 1_000_000_000
+    start_ns = parse_time_ns(start)
+    if start_ns is None:
+        start_ns = end_ns - DEFAULT_LOOKBACK_SECONDS * 1_000_000_000
+
+    streams = {}
+    lines = 0
+    size = 0
+    truncated = False
+    # Timestamps with more entries than could be read, the result misses some of their lines
+    skipped = []
+    pages = iter_query_range(client, logql, start_ns, end_ns, direction, min(page_limit, max_lines))
+    try:
+        async for page in pages:
+            if page['data'].get('resultType') != 'streams':
+                return page
+            if 'skippedTs' in page:
+                skipped.append(page['skippedTs'])
+            for stream in page['data']['result']:
+                key = stream_key(stream['stream'])
+                if key not in streams:
+                    streams[key] = {'stream': stream['stream'], 'values': []}
+                    size += len(key)
+                for value in stream['values']:
+                    line_size = len(value[0]) + len(value[1].encode())
+                    if lines >= max_lines or size + line_size > max_bytes:
+                        truncated = True
+                        break
+                    streams[key]['values'].append(value)
+                    lines += 1
+                    size += line_size
+                if truncated:
+                    break
+            if truncated:
+                break
+    finally:
+        await pages.aclose()
+
+    markers = []
+    if truncated:
+        markers.append(f"Result truncated after {lines} lines ({size} bytes).")
+    if skipped:
+        markers.append(f"Lines are missing at {len(skipped)} timestamps with more lines than could be read, "
+                       f"the first at {skipped[0]}.")
+    response = {
+        'status': 'success',
+        'data': {
+            'resultType': 'streams',
+            'result': [stream for stream in streams.values() if stream['values']],
+        },
+        'lines': lines,
+        'bytes': size,
+        'truncated': bool(markers),
+    }
+    if markers:
+        response['truncationMarker'] = " ".join(markers + ["Narrow the time range or add label filters to see the remaining log lines."])
+    logger.info(f"query_range returned {lines} lines, {size} bytes, {len(response['data']['result'])} streams, truncated={response['truncated']}")
+    return response
@@ -0,0 +1,104 @@
+# Helpers for PromQL range queries: time parsing, automatic step selection, splitting ranges with too many points
+# into step aligned sub-ranges that can be fetched in parallel, and merging the sub-range results.
+# This module is shared by the RoC service (stacks/roc_action_group/src) and the metrics Lambda
+# (stacks/metrics_action_group/lambda). Both are packaged from their own folder, so keep the two copies identical.
+import math
+import os
+import re
+import time
+from datetime import datetime
+
+DEFAULT_LOOKBACK_SECONDS = 3600
+DEFAULT_MAX_POINTS = 500
+DEFAULT_SPLIT_MAX_POINTS = 250
+DEFAULT_SPLIT_CONCURRENCY = 4
+
+# Steps are rounded up to one of these values (seconds), so sub-range boundaries and cache keys line up
+NICE_STEPS = [1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400]
+
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "y": 31536000}
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h|d|w|y)")
+
+
+# Parses a Prometheus duration such as 5m, 1h30m or a plain number of seconds
+def parse_duration(value):
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        raise ValueError(f"Invalid duration {value}")
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+# Parses RFC3339, unix seconds or now / now-<duration> into unix seconds
+def parse_time(value, default=None):
+    if value is None or value == "":
+        return default
+    value = value.strip()
+    if value == "now":
+        return time.time()
+    if value.startswith("now-"):
+        return time.time() - parse_duration(value[4:])
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+# Smallest nice step that keeps the number of points per series within max_points
+def choose_step(start, end, max_points=None, min_step=None):
+    max_points = max_points or int(os.environ.get("PROMQL_MAX_POINTS", DEFAULT_MAX_POINTS))
+    wanted = max((end - start) / max(max_points - 1, 1), min_step or 0, 1)
+    for step in NICE_STEPS:
+        if step >= wanted:
+            return step
+    return math.ceil(wanted / NICE_STEPS[-1]) * NICE_STEPS[-1]
+
+
+# Splits [start, end] into sub-ranges of at most max_points step aligned timestamps, a range within the budget
+# is returned whole. Every sub-range evaluates a disjoint set of timestamps, so results can be merged without overlap.
+def split_range(start, end, step, max_points=None):
+    max_points = max_points or int(os.environ.get("PROMQL_SPLIT_MAX_POINTS", DEFAULT_SPLIT_MAX_POINTS))
+    # Align to the step so repeated queries over a moving window evaluate the same timestamps
+    start = math.floor(start / step) * step
+    end = math.floor(end / step) * step
+    if (end - start) / step + 1 <= max_points:
+        return [(start, end)]
+    # Sub-range boundaries are multiples of the sub-range length, so a moving window reuses cached sub-ranges
+    interval = max_points * step
+    ranges = []
+    sub_start = start
+    while sub_start <= end:
+        # Sub-ranges end at the last step before the next interval boundary
+        boundary = (math.floor(sub_start / interval) + 1) * interval
+        sub_end = min(end, boundary - step)
+        ranges.append((sub_start, sub_end))
+        sub_start = sub_end + step
+    return ranges
+
+
+# Merges query_range responses of consecutive sub-ranges into a single matrix response
+def merge_range_results(responses):
+    for response in responses:
+        if response.get("status") != "success":
+            return response
+
+    series = {}
+    warnings = []
+    for response in responses:
+        warnings.extend(response.get("warnings", []))
+        for item in response.get("data", {}).get("result", []):
+            key = tuple(sorted(item.get("metric", {}).items()))
+            if key not in series:
+                series[key] = {"metric": item.get("metric", {}), "values": []}
+            series[key]["values"].extend(item.get("values", []))
+
+    for item in series.values():
+        item["values"].sort(key=lambda sample: sample[0])
+
+    merged = {"status": "success", "data": {"resultType": "matrix", "result": list(series.values())}}
+    if warnings:
+        merged["warnings"] = warnings
+    return merged
@@ -0,0 +1,216 @@
+# Short lived store for full query results that were too large to return through the agent.
+# This module is shared by the RoC service (stacks/roc_action_group/src) and the metrics Lambda
+# (stacks/metrics_action_group/lambda). Both are packaged from their own folder, so keep the two copies identical.
+#
+# Results are kept in process, bounded by count (least recently used results are evicted first) and by age,
+# and are addressed by an opaque handle returned to the agent. When RESULT_STORE_BUCKET is set, results are also
+# written to that S3 (or S3 compatible, see RESULT_STORE_ENDPOINT_URL) bucket, so a handle can be fetched from
+# another Fargate task or Lambda execution environment than the one that stored it.
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAXSIZE = 32
+DEFAULT_TTL_SECONDS = 1800
+DEFAULT_PAGE_SERIES = 50
+DEFAULT_PAGE_LINES = 500
+
+
+class S3ResultBackend:
+
+    def __init__(self, bucket, prefix="results/", endpoint_url=None, client=None):
+        if client is None:
+            # Only needed when a bucket is configured
+            import boto3
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client
+
+    # Wall clock expiry, the object may be read by another process. Bucket lifecycle rules remove old objects.
+    def put(self, handle, result, ttl):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + handle,
+                               Body=json.dumps(result, separators=(",", ":")).encode(),
+                               ContentType="application/json",
+                               Metadata={"expires-at": str(int(time.time() + ttl))})
+
+    def get(self, handle):
+        try:
+            stored = self.client.get_object(Bucket=self.bucket, Key=self.prefix + handle)
+        except self.client.exceptions.NoSuchKey:
+            return None
+        if time.time() >= int(stored["Metadata"].get("expires-at", 0)):
+            return None
+        return json.loads(stored["Body"].read())
+
+
+# Returns the S3 backend when RESULT_STORE_BUCKET is set, None to keep results in process only
+def create_result_backend():
+    bucket = os.environ.get("RESULT_STORE_BUCKET")
+    if not bucket:
+        return None
+    return S3ResultBackend(bucket, endpoint_url=os.environ.get("RESULT_STORE_ENDPOINT_URL"))
+
+
+class ResultStore:
+
+    def __init__(self, maxsize=None, ttl=None, backend=None):
+        self.maxsize = maxsize or int(os.environ.get("RESULT_STORE_MAXSIZE", DEFAULT_MAXSIZE))
+        self.ttl = ttl or int(os.environ.get("RESULT_STORE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        self.backend = backend
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, handle, expires_at, result):
+        with self._lock:
+            self._results[handle] = (expires_at, result)
+            self._results.move_to_end(handle)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def put(self, result):
+        handle = uuid.uuid4().hex
+        self._remember(handle, time.monotonic() + self.ttl, result)
+        if self.backend is not None:
+            try:
+                self.backend.put(handle, result, self.ttl)
+            except Exception as e:
+                # The result can still be fetched from this process
+                logger.error(f"Could not write result {handle} to the result store backend: {str(e)}")
+        return handle
+
+    # Returns the stored result, or None if the handle is unknown or expired
+    def get(self, handle):
+        with self._lock:
+            stored = self._results.get(handle)
+            if stored is not None:
+                expires_at, result = stored
+                if time.monotonic() < expires_at:
+                    self._results.move_to_end(handle)
+                    return result
+                del self._results[handle]
+        if self.backend is None:
+            return None
+        try:
+            result = self.backend.get(handle)
+        except Exception as e:
+            logger.error(f"Could not read result {handle} from the result store backend: {str(e)}")
+            return None
+        if result is not None:
+            self._remember(handle, time.monotonic() + self.ttl, result)
+        return result
+
+
+def page_bounds(total, page, page_size):
+    pages = max(1, -(-total // page_size))
+    start = (page - 1) * page_size
+    return pages, start, min(start + page_size, total)
+
+
+def json_size(value):
+    return len(json.dumps(value, separators=(",", ":")))
+
+
+# Splits the series, or log streams, into pages of at most page_bytes serialized bytes. Every page is a list of
+# (position, values) pairs, values is None for a whole series or the (start, end) slice of the points, or lines, of a
+# series too large for a page of its own, which is split across consecutive pages. Only a single point or line larger
+# than page_bytes gives a larger page.
+def byte_pages(items, page_bytes):
+    pages = []
+    page = []
+    size = 0
+    for i, item in enumerate(items):
+        item_size = json_size(item) + 1
+        if size + item_size <= page_bytes:
+            page.append((i, None))
+            size += item_size
+            continue
+        values = item.get("values")
+        if item_size <= page_bytes or not values:
+            if page:
+                pages.append(page)
+            page = [(i, None)]
+            size = item_size
+            continue
+        start = 0
+        part_size = json_size(dict(item, values=[])) + 1
+        for j, value in enumerate(values):
+            value_size = json_size(value) + 1
+            if size + part_size + value_size > page_bytes and (page or j > start):
+                if j > start:
+                    page.append((i, (start, j)))
+                pages.append(page)
+                page = []
+                size = 0
+                start = j
+                part_size = json_size(dict(item, values=[])) + 1
+            part_size += value_size
+        page.append((i, (start, len(values))))
+        size += part_size
+    if page or not pages:
+        pages.append(page)
+    return pages
+
+
+# Returns one page of a stored result. Metric results are paged by series and log results by line, counting the
+# lines of all streams in the order they are stored, so the same handle and page number always give the same page.
+# With a byte budget (page_bytes or RESULT_PAGE_BYTES) pages are filled with whole series, or streams, up to that
+# many bytes instead, for callers with a response size limit such as the metrics Lambda.
+def result_page(result, page=1, page_size=None, page_bytes=None):
+    data = result.get("data", {})
+    result_type = data.get("resultType")
+    items = data.get("result", [])
+    if result_type not in ("matrix", "vector", "streams"):
+        # Scalar and string results are a single value
+        return dict(result, page=1, pages=1)
+    if page < 1:
+        raise ValueError("Pages are numbered from 1")
+
+    page_bytes = page_bytes or int(os.environ.get("RESULT_PAGE_BYTES", 0))
+    if page_bytes:
+        # The range and total count series, or streams, a split series is on more than one page
+        all_pages = byte_pages(items, page_bytes)
+        pages = len(all_pages)
+        if page > pages:
+            raise ValueError(f"The result has {pages} pages")
+        entries = all_pages[page - 1]
+        page_items = [items[i] if values is None else dict(items[i], values=items[i]["values"][values[0]:values[1]])
+                      for i, values in entries]
+        total = len(items)
+        start, end = (entries[0][0], entries[-1][0] + 1) if entries else (0, 0)
+    elif result_type == "streams":
+        page_size = page_size or int(os.environ.get("RESULT_PAGE_LINES", DEFAULT_PAGE_LINES))
+        total = sum(len(stream.get("values", [])) for stream in items)
+        pages, start, end = page_bounds(total, page, page_size)
+        page_items = []
+        offset = 0
+        for stream in items:
+            values = stream.get("values", [])
+            if offset + len(values) > start and offset < end:
+                page_items.append(dict(stream, values=values[max(0, start - offset):end - offset]))
+            offset += len(values)
+            if offset >= end:
+                break
+    else:
+        page_size = page_size or int(os.environ.get("RESULT_PAGE_SERIES", DEFAULT_PAGE_SERIES))
+        total = len(items)
+        pages, start, end = page_bounds(total, page, page_size)
+        page_items = items[start:end]
+
+    if page > pages:
+        raise ValueError(f"The result has {pages} pages")
+    return {
+        "status": result.get("status"),
+        "data": {"resultType": result_type, "result": page_items},
+        "page": page,
+        "pages": pages,
+        # One based range of the series, or log lines, on this page
+        "range": f"{start + 1}-{end}" if end > start else "0-0",
+        "total": total,
+    }
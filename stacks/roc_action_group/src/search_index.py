@@ -0,0 +1,242 @@
+# Search index over the Prometheus metric names, label names and label values, refreshed in the background.
+# /get-available-metric-names returns every metric name of the stack to the agent, often tens of thousands.
+# The search endpoints return the few best matches for a query instead.
+#
+# Names are matched by prefix, by word (names are split on _ : . - / and every query word has to start a word of
+# the name) and by character trigrams for partial or misspelled names. Trigrams are compared for the whole name and
+# for every query word against the words of the names, so one misspelled word does not hide the others. Prefix
+# lookups use a binary search over the sorted names, which answers them like a trie without keeping a node per
+# character.
+import asyncio
+import bisect
+import logging
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from heapq import nsmallest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_SECONDS = 300
+DEFAULT_MAX_VALUES_PER_LABEL = 1000
+DEFAULT_LABEL_CONCURRENCY = 8
+# Trigram matches below this similarity (Dice coefficient) are not returned
+MIN_SIMILARITY = 0.3
+# A word of a name only counts as a fuzzy match of a query word from this similarity on
+MIN_WORD_SIMILARITY = 0.5
+
+WORD_SEPARATORS = re.compile(r"[_:.\-/\s]+")
+
+
+def split_words(text):
+    return [word for word in WORD_SEPARATORS.split(text) if word]
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+
+    def __init__(self, names):
+        self.names = list(names)
+        lowered = [name.lower() for name in self.names]
+        self._sorted = sorted((name, i) for i, name in enumerate(lowered))
+        self._keys = [name for name, _ in self._sorted]
+        self._word_counts = []
+        self._trigram_counts = []
+        words = defaultdict(list)
+        self._trigrams = defaultdict(list)
+        for i, name in enumerate(lowered):
+            name_words = set(split_words(name))
+            self._word_counts.append(len(name_words) or 1)
+            for word in name_words:
+                words[word].append(i)
+            name_trigrams = trigrams(name)
+            self._trigram_counts.append(len(name_trigrams))
+            for trigram in name_trigrams:
+                self._trigrams[trigram].append(i)
+        self._words = dict(words)
+        self._word_keys = sorted(self._words)
+        self._word_trigram_counts = []
+        self._word_trigrams = defaultdict(list)
+        for position, word in enumerate(self._word_keys):
+            word_trigrams = trigrams(word)
+            self._word_trigram_counts.append(len(word_trigrams))
+            for trigram in word_trigrams:
+                self._word_trigrams[trigram].append(position)
+
+    def __len__(self):
+        return len(self.names)
+
+    # Positions of the names with the given prefix
+    def _prefixed(self, keys, prefix):
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + "\uffff", start)
+        return start, end
+
+    # Similarity of the closest word of every name to the query word, 1 for the words it starts
+    def _word_matches(self, query_word):
+        similarities = {}
+        start, end = self._prefixed(self._word_keys, query_word)
+        for position in range(start, end):
+            similarities[position] = 1.0
+        query_trigrams = trigrams(query_word)
+        common = Counter()
+        for trigram in query_trigrams:
+            common.update(self._word_trigrams.get(trigram, ()))
+        for position, count in common.items():
+            similarity = 2 * count / (len(query_trigrams) + self._word_trigram_counts[position])
+            if similarity >= MIN_WORD_SIMILARITY and similarity > similarities.get(position, 0):
+                similarities[position] = similarity
+
+        matches = {}
+        for position, similarity in similarities.items():
+            for i in self._words[self._word_keys[position]]:
+                if similarity > matches.get(i, 0):
+                    matches[i] = similarity
+        return matches
+
+    # Returns up to limit (position, score) pairs, best first. Exact matches score 1, prefix matches 0.8 to 0.9,
+    # word matches 0.6 to 0.8 and trigram matches up to 0.5. Ties go to the shorter name.
+    def search(self, query, limit=10):
+        query = query.strip().lower()
+        if not query or not self.names:
+            return []
+        scores = {}
+
+        start, end = self._prefixed(self._keys, query)
+        for name, i in self._sorted[start:end]:
+            scores[i] = 1.0 if name == query else 0.8 + 0.1 * len(query) / len(name)
+
+        query_words = split_words(query)
+        matched = None
+        for word in query_words:
+            start, end = self._prefixed(self._word_keys, word)
+            positions = set()
+            for key in self._word_keys[start:end]:
+                positions.update(self._words[key])
+            matched = positions if matched is None else matched & positions
+            if not matched:
+                break
+        for i in matched or ():
+            score = 0.6 + 0.2 * min(1.0, len(query_words) / self._word_counts[i])
+            if score > scores.get(i, 0):
+                scores[i] = score
+
+        # Trigram matches score below every prefix and word match, only look for them when those are not enough
+        if len(scores) < limit:
+            query_trigrams = trigrams(query)
+            common = Counter()
+            for trigram in query_trigrams:
+                common.update(self._trigrams.get(trigram, ()))
+            for i, count in common.items():
+                similarity = 2 * count / (len(query_trigrams) + self._trigram_counts[i])
+                if similarity >= MIN_SIMILARITY and 0.5 * similarity > scores.get(i, 0):
+                    scores[i] = 0.5 * similarity
+
+            # Every query word is matched on its own, a name scores the average similarity of its closest word to
+            # each query word. Only names matching every query word are scored, or any of them if there are none.
+            word_matches = [self._word_matches(word) for word in query_words]
+            candidates = set(word_matches[0]).intersection(*word_matches[1:]) if word_matches else set()
+            if not candidates:
+                candidates = set().union(*word_matches)
+            for i in candidates:
+                similarity = sum(matches.get(i, 0) for matches in word_matches) / len(query_words)
+                if similarity >= MIN_SIMILARITY and 0.5 * similarity > scores.get(i, 0):
+                    scores[i] = 0.5 * similarity
+
+        return nsmallest(limit, scores.items(), key=lambda item: (-item[1], len(self.names[item[0]]), self.names[item[0]]))
+
+
+# Metric names, label names and label values of the Prometheus data source. The indexes are rebuilt off the event
+# loop and swapped in whole, searches always see a complete index.
+class DiscoveryIndex:
+
+    def __init__(self, refresh_seconds=None, max_values_per_label=None, label_concurrency=None):
+        self.refresh_seconds = refresh_seconds or int(os.environ.get("INDEX_REFRESH_SECONDS", DEFAULT_REFRESH_SECONDS))
+        self.max_values_per_label = max_values_per_label or int(os.environ.get("INDEX_MAX_VALUES_PER_LABEL", DEFAULT_MAX_VALUES_PER_LABEL))
+        self.label_concurrency = label_concurrency or int(os.environ.get("INDEX_LABEL_CONCURRENCY", DEFAULT_LABEL_CONCURRENCY))
+        self.metric_names = None
+        self.label_names = None
+        self.label_values = None
+        # Label of every entry of label_values
+        self.value_labels = []
+        self.built_at = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def ready(self):
+        return self.built_at is not None
+
+    @staticmethod
+    async def _get_data(client, path):
+        response = (await client.get(path)).json()
+        if response.get("status") != "success":
+            raise RuntimeError(f"{path} returned {response.get('error', response.get('status'))}")
+        return response["data"]
+
+    async def refresh(self, client):
+        async with self._lock:
+            await self._refresh(client)
+
+    async def _refresh(self, client):
+        started = time.monotonic()
+        metric_names, label_names = await asyncio.gather(self._get_data(client, "/api/v1/label/__name__/values"),
+                                                         self._get_data(client, "/api/v1/labels"))
+        semaphore = asyncio.Semaphore(self.label_concurrency)
+
+        async def get_values(label):
+            async with semaphore:
+                try:
+                    return (await self._get_data(client, f"/api/v1/label/{label}/values"))[:self.max_values_per_label]
+                except Exception as e:
+                    logger.error(f"Could not index the values of label {label}: {str(e)}")
+                    return []
+
+        # Metric names are the values of __name__, they have their own index
+        labels = [label for label in label_names if label != "__name__"]
+        values = await asyncio.gather(*[get_values(label) for label in labels])
+        value_labels = [label for label, label_values in zip(labels, values) for _ in label_values]
+
+        def build():
+            return (NameIndex(metric_names), NameIndex(label_names),
+                    NameIndex([value for label_values in values for value in label_values]))
+
+        self.metric_names, self.label_names, self.label_values = await asyncio.to_thread(build)
+        self.value_labels = value_labels
+        self.built_at = time.time()
+        logger.info(f"Indexed {len(metric_names)} metric names, {len(label_names)} labels and "
+                    f"{len(value_labels)} label values in {time.monotonic() - started:.1f}s")
+
+    # Builds the index on the first search if the background refresh has not built it yet
+    async def ensure_ready(self, client):
+        if not self.ready:
+            async with self._lock:
+                if not self.ready:
+                    await self._refresh(client)
+
+    # Refreshes the index every refresh_seconds until cancelled, the previous index is kept when a refresh fails
+    async def run(self, client):
+        while True:
+            try:
+                await self.refresh(client)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Discovery index refresh failed: {str(e)}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    def search_metrics(self, query, limit=10):
+        return [{"name": self.metric_names.names[i], "score": round(score, 3)}
+                for i, score in self.metric_names.search(query, limit)]
+
+    # Label names and label values ranked together, values come with their label
+    def search_labels(self, query, limit=10):
+        matches = [({"label": self.label_names.names[i]}, score) for i, score in self.label_names.search(query, limit)]
+        matches.extend(({"label": self.value_labels[i], "value": self.label_values.names[i]}, score)
+                       for i, score in self.label_values.search(query, limit))
+        matches.sort(key=lambda match: (-match[1], len(match[0].get("value", match[0]["label"]))))
+        return [dict(match, score=round(score, 3)) for match, score in matches[:limit]]
@@ -0,0 +1,39 @@
+# Request coalescing (single-flight) for identical in-flight Grafana Cloud calls.
+# The first caller for a key starts the upstream call, callers arriving with the same key while it is
+# still in flight wait for that call and share its result instead of issuing their own.
+import asyncio
+import logging
+
+from aws_lambda_powertools.metrics import MetricUnit
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+
+    def __init__(self, name, metrics=None):
+        self.name = name
+        self.metrics = metrics
+        self._calls = {}
+
+    def _add_metric(self, name):
+        if self.metrics is not None:
+            self.metrics.add_metric(name=f"{self.name}{name}", unit=MetricUnit.Count, value=1)
+
+    # Runs the coroutine function once per key at a time and fans the result (or exception) out to every caller
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is not None:
+            self._add_metric("CoalescedRequests")
+            logger.debug(f"{self.name} coalesced request for {key}")
+        else:
+            # The upstream call runs as its own task, so a caller being cancelled (e.g. on a timeout)
+            # does not cancel the call for the other waiters
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self._add_metric("UpstreamRequests")
+        return await asyncio.shield(task)
+
+    def in_flight(self):
+        return len(self._calls)
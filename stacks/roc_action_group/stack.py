@@ -15,7 +15,8 @@ from aws_cdk import (
     aws_secretsmanager as sm,
     CfnOutput,
     ArnFormat,
-    aws_logs as logs
+    aws_logs as logs,
+    aws_s3 as s3
 )
 class RoCStack(Stack):
 
@@ -25,6 +26,7 @@ class RoCStack(Stack):
                  loki_secret_name: str,
                  prom_secret_name: str,
                  ecs_cluster: ecs.Cluster,
+                 access_logs_bucket: s3.IBucket,
                  **kwargs
                  ) -> None:
         super().__init__(scope, construct_id, **kwargs)
@@ -43,6 +45,18 @@ class RoCStack(Stack):
                                       log_group_name="roc-action-group",
                                        removal_policy=cdk.RemovalPolicy.DESTROY )
 
+        # Full query results that were too large for the agent, readable from any Fargate task by handle
+        results_bucket = s3.Bucket(self, "Results",
+            auto_delete_objects=True,
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True,
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            server_access_logs_bucket=access_logs_bucket,
+            server_access_logs_prefix="results-access-logs/",
+            lifecycle_rules=[s3.LifecycleRule(expiration=cdk.Duration.days(1))]
+        )
+
         fargate_service = ecs_patterns.ApplicationLoadBalancedFargateService(
             self,
             "roc-action-group-fargate",
@@ -60,7 +74,37 @@ class RoCStack(Stack):
                 log_driver=ecs.LogDriver.aws_logs(log_group=log_group,mode=ecs.AwsLogDriverMode.NON_BLOCKING, stream_prefix='roc-action-group'),
                 environment={
                     "LOKI_API_SECRET_NAME": loki_secret.secret_name,
-                    "PROM_API_SECRET_NAME": prom_secret.secret_name
+                    "PROM_API_SECRET_NAME": prom_secret.secret_name,
+                    # Connection pool used for the Grafana Cloud clients
+                    "GRAFANA_POOL_MAXSIZE": "100",
+                    "GRAFANA_POOL_MAX_KEEPALIVE": "20",
+                    "GRAFANA_TIMEOUT_SECONDS": "30",
+                    # Cache for label and metric name discovery calls
+                    "DISCOVERY_CACHE_TTL_SECONDS": "300",
+                    "DISCOVERY_CACHE_STALE_SECONDS": "900",
+                    "GRAFANA_CREDENTIALS_MAX_AGE_SECONDS": "900",
+                    # Search index of metric names, labels and label values behind /search-metrics and /search-labels
+                    "INDEX_REFRESH_SECONDS": "300",
+                    "INDEX_MAX_VALUES_PER_LABEL": "1000",
+                    # Paging and result budget for LogQL query_range
+                    "LOKI_PAGE_LIMIT": "1000",
+                    "LOKI_MAX_LINES": "5000",
+                    "LOKI_MAX_BYTES": "1000000",
+                    "RESULT_SUMMARY_BUDGET_BYTES": "100000",
+                    # Summarized results are kept in S3 and fetched page by page
+                    "RESULT_STORE_BUCKET": results_bucket.bucket_name,
+                    "RESULT_PAGE_SERIES": "50",
+                    "RESULT_PAGE_LINES": "500",
+                    # Point budgets and sub-query concurrency for PromQL range queries
+                    "PROMQL_MAX_POINTS": "500",
+                    "PROMQL_SPLIT_MAX_POINTS": "250",
+                    "PROMQL_SPLIT_CONCURRENCY": "4",
+                    # Result cache TTLs per endpoint, set RESULT_CACHE_URL to share the cache across tasks
+                    "RESULT_CACHE_TTL_PROMQL_SECONDS": "30",
+                    "RESULT_CACHE_TTL_PROMQL_RANGE_SECONDS": "60",
+                    "RESULT_CACHE_TTL_LOGQL_SECONDS": "30",
+                    # Return statement results in the compact text encoding, set to json for the raw Grafana responses
+                    "RESPONSE_FORMAT": "compact"
                 },
             ),
         )
@@ -97,5 +141,6 @@ class RoCStack(Stack):
         )
         prom_secret.grant_read(fargate_service.task_definition.task_role)
         loki_secret.grant_read(fargate_service.task_definition.task_role)
+        results_bucket.grant_read_write(fargate_service.task_definition.task_role)
         fargate_service.load_balancer.connections.security_groups[0].add_ingress_rule(peer=ec2.Peer.ipv4(ecs_cluster.vpc.vpc_cidr_block), connection=ec2.Port.tcp(80))
         self.fargate_service = fargate_service
\ No newline at end of file
@@ -1,3 +1,4 @@
+import json
 from constructs import Construct
 from aws_cdk import (
     aws_ecs as ecs,
@@ -7,6 +8,7 @@ from aws_cdk import (
     Stack,
     aws_ecr_assets as ecr_assets,
     aws_iam as iam,
+    aws_s3 as s3,
     aws_cognito as cognito,
     RemovalPolicy,
     aws_elasticloadbalancingv2 as elb,
@@ -31,9 +33,12 @@ class WebAppStack(Stack):
                  knowledgebase_id: str,
                  ecs_cluster: ecs.Cluster,
                  imported_cert_arn: str,
+                 access_logs_bucket: s3.IBucket,
                  fargate_service = ecs_patterns.ApplicationLoadBalancedFargateService,
+                 knowledgebase_retrieval: dict = None,
                  **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
+        knowledgebase_retrieval = knowledgebase_retrieval or {}
 
         # # Create a fargate task definition
         # task_definition = ecs.FargateTaskDefinition(self, "grafana-assistant-task")
@@ -46,6 +51,18 @@ class WebAppStack(Stack):
 
         
 
+        # Bucket for the chat transcripts, every turn is written here so the UI can keep a bounded history in memory
+        transcripts_bucket = s3.Bucket(self, "Transcripts",
+            auto_delete_objects=True,
+            removal_policy=RemovalPolicy.DESTROY,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True,
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            server_access_logs_bucket=access_logs_bucket,
+            server_access_logs_prefix="transcripts-access-logs/",
+            lifecycle_rules=[s3.LifecycleRule(expiration=Duration.days(90))]
+        )
+
         # Use ECS Pattern to create a load balanced Fargate service
         ui_fargate_service = ecs_patterns.ApplicationLoadBalancedFargateService(
             self,
@@ -67,7 +84,13 @@ class WebAppStack(Stack):
                     "BEDROCK_AGENT_ID": bedrock_agent.attr_agent_id,
                     "BEDROCK_AGENT_ALIAS_ID": bedrock_agent_alias.attr_agent_alias_id,
                     "KNOWLEDGEBASE_ID": knowledgebase_id,
-                    "FUNCTION_CALLING_URL": fargate_service.load_balancer.load_balancer_dns_name
+                    "FUNCTION_CALLING_URL": fargate_service.load_balancer.load_balancer_dns_name,
+                    "BEDROCK_AGENT_STREAM_FINAL_RESPONSE": "true",
+                    "TRANSCRIPT_BUCKET": transcripts_bucket.bucket_name,
+                    # Knowledge base retrieval settings from the environment configuration
+                    "KB_NUMBER_OF_RESULTS": str(knowledgebase_retrieval.get("NumberOfResults", 100)),
+                    "KB_SEARCH_TYPE": knowledgebase_retrieval.get("SearchType", "HYBRID"),
+                    "KB_FILTER": json.dumps(knowledgebase_retrieval.get("Filter"))
                 },
             #Allow 
                 #TODO: Log Group name
@@ -107,6 +130,7 @@ class WebAppStack(Stack):
                 "bedrock:InvokeAgent"
             ])
         )
+        transcripts_bucket.grant_put(ui_fargate_service.task_definition.task_role)
 
 
         cognito_domain_prefix = "observability-assistant-pool"
@@ -1,6 +1,9 @@
 import json
+import logging
 import os
 import bedrock_agent_runtime
+from citations import annotate_citations, group_references
+import history
 import streamlit as st
 import uuid
 
@@ -9,12 +12,20 @@ agent_id = os.environ.get("BEDROCK_AGENT_ID")
 agent_alias_id = os.environ.get("BEDROCK_AGENT_ALIAS_ID", "TSTALIASID") # TSTALIASID is the default test alias ID
 ui_title = os.environ.get("BEDROCK_AGENT_TEST_UI_TITLE", "Grafana Cloud Observability Assistant powered by Amazon Bedrock")
 ui_icon = os.environ.get("BEDROCK_AGENT_TEST_UI_ICON")
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
 
 def init_state():
     st.session_state.session_id = str(uuid.uuid4())
-    st.session_state.messages = []
+    history.init_history(st.session_state)
     st.session_state.citations = []
     st.session_state.trace = {}
+    st.session_state.trace_view = None
+
+trace_type_headers = {
+    "preProcessingTrace": "Pre-Processing",
+    "orchestrationTrace": "Orchestration",
+    "postProcessingTrace": "Post-Processing",
+}
 
 # General page configuration and initialization
 st.set_page_config(page_title=ui_title, page_icon=ui_icon, layout="wide")
@@ -27,101 +38,159 @@ with st.sidebar:
     if st.button("Reset Session"):
         init_state()
 
-# Messages in the conversation
-for message in st.session_state.messages:
+    # Knowledge base retrieval settings for the next question, defaults come from the environment configuration
+    with st.expander("Retrieval settings", expanded=False):
+        retrieval = {
+            "numberOfResults": st.number_input("Knowledge base results", min_value=1,
+                                               max_value=bedrock_agent_runtime.MAX_NUMBER_OF_RESULTS,
+                                               value=bedrock_agent_runtime.retrieval_settings["numberOfResults"]),
+            "searchType": st.selectbox("Search type", bedrock_agent_runtime.SEARCH_TYPES,
+                                       index=bedrock_agent_runtime.SEARCH_TYPES.index(bedrock_agent_runtime.retrieval_settings["searchType"]))
+        }
+
+# Messages in the conversation. Only the most recent messages are rendered in full, older ones are collapsed
+# and messages dropped from memory are only kept in the transcript.
+older_messages = st.session_state.messages[:-history.history_window]
+recent_messages = st.session_state.messages[-history.history_window:]
+if st.session_state.archived_messages > 0 or len(older_messages) > 0:
+    with st.expander(f"{st.session_state.archived_messages + len(older_messages)} earlier messages", expanded=False):
+        if st.session_state.archived_messages > 0:
+            st.caption(f"{st.session_state.archived_messages} messages are only kept in the transcript at "
+                       f"{history.transcript_store.location(st.session_state.session_id)}")
+        if st.toggle("Show earlier messages", key="show-earlier-messages"):
+            for message in older_messages:
+                with st.chat_message(message["role"]):
+                    st.markdown(message["content"], unsafe_allow_html=True)
+for message in recent_messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"], unsafe_allow_html=True)
 
 # Chat input that invokes the agent
 if prompt := st.chat_input():
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    user_message = {"role": "user", "content": prompt}
+    history.add_message(st.session_state, user_message)
     with st.chat_message("user"):
         st.write(prompt)
 
     with st.chat_message("assistant"):
         placeholder = st.empty()
         placeholder.markdown("...")
-        response = bedrock_agent_runtime.invoke_agent(
+        invocation = bedrock_agent_runtime.AgentInvocation(agent_id, agent_alias_id, st.session_state.session_id, retrieval)
+        # Render the answer as it streams in, and show which step the agent is on until the first text arrives
+        for event in bedrock_agent_runtime.invoke_agent_stream(
             agent_id,
             agent_alias_id,
             st.session_state.session_id,
-            prompt
-        )
-        output_text = response["output_text"]
+            prompt,
+            invocation
+        ):
+            if event["type"] == "chunk":
+                placeholder.markdown(invocation.output_text + " ▌", unsafe_allow_html=True)
+            elif event["type"] == "trace" and not invocation.output_text:
+                placeholder.markdown("... " + trace_type_headers.get(event["trace_type"], "Working"))
+        output_text = invocation.output_text
+        citations = invocation.citations
 
         # Add citations
-        if len(response["citations"]) > 0:
-            citation_num = 1
-            num_citation_chars = 0
-            citation_locs = ""
-            for citation in response["citations"]:
-                end_span = citation["generatedResponsePart"]["textResponsePart"]["span"]["end"] + 1
-                for retrieved_ref in citation["retrievedReferences"]:
-                    citation_marker = f"[{citation_num}]"
-                    output_text = output_text[:end_span + num_citation_chars] + citation_marker + output_text[end_span + num_citation_chars:]
-                    citation_locs = citation_locs + "\n<br>" + citation_marker + " " + retrieved_ref["location"]["s3Location"]["uri"]
-                    citation_num = citation_num + 1
-                    num_citation_chars = num_citation_chars + len(citation_marker)
-                output_text = output_text[:end_span + num_citation_chars] + "\n" + output_text[end_span + num_citation_chars:]
-                num_citation_chars = num_citation_chars + 1
-            output_text = output_text + "\n" + citation_locs
+        output_text = annotate_citations(output_text, citations)
 
         placeholder.markdown(output_text, unsafe_allow_html=True)
-        st.session_state.messages.append({"role": "assistant", "content": output_text})
-        st.session_state.citations = response["citations"]
-        st.session_state.trace = response["trace"]
+        assistant_message = {"role": "assistant", "content": output_text}
+        history.add_message(st.session_state, assistant_message)
+        st.session_state.turn += 1
+        history.transcript_store.save_turn(st.session_state.session_id, st.session_state.turn, [user_message, assistant_message])
+        st.session_state.citations = citations
+        st.session_state.trace = invocation.trace
+        st.session_state.trace_view = None
 
-trace_type_headers = {
-    "preProcessingTrace": "Pre-Processing",
-    "orchestrationTrace": "Orchestration",
-    "postProcessingTrace": "Post-Processing",
-}
 trace_info_types = ["invocationInput", "modelInvocationInput", "modelInvocationOutput", "observation", "rationale"]
+# Long traces are split in pages of steps, and very large steps are cut, so the sidebar stays fast to render
+trace_page_size = int(os.environ.get("TRACE_PAGE_SIZE", 20))
+trace_max_chars = int(os.environ.get("TRACE_MAX_CHARS", 20000))
+
+def format_json(value):
+    value_str = json.dumps(value, indent=2)
+    if len(value_str) > trace_max_chars:
+        value_str = value_str[:trace_max_chars] + f"\n... truncated, {len(value_str) - trace_max_chars} more characters"
+    return value_str
+
+# Groups the traces of a turn by step, similar to how it is shown in the Bedrock console, and formats them once.
+# The result is kept in the session state, so reruns of the page (e.g. on every keystroke) do not format it again.
+def build_trace_view(trace, citations):
+    steps = {trace_type: [] for trace_type in trace_type_headers}
+    step_num = 1
+    for trace_type in trace_type_headers:
+        trace_steps = {}
+        for step_trace in trace.get(trace_type, []):
+            # Each trace type and step may have different information for the end-to-end flow
+            for trace_info_type in trace_info_types:
+                if trace_info_type in step_trace:
+                    trace_steps.setdefault(step_trace[trace_info_type]["traceId"], []).append(step_trace)
+                    break
+        for step_traces in trace_steps.values():
+            steps[trace_type].append({
+                "title": "Trace Step " + str(step_num),
+                "json": [format_json(step_trace) for step_trace in step_traces]
+            })
+            step_num = step_num + 1
+
+    # Numbered like the markers in the answer, a reference cited several times is shown once
+    citation_views = []
+    for group in group_references(citations):
+        citation_views.append({
+            "number": group["number"],
+            "json": format_json({
+                "retrievedReference": group["retrievedReference"],
+                "generatedResponseParts": group["generatedResponseParts"]
+            })
+        })
+    trace_bytes = sum(len(json_str) for trace_steps in steps.values() for step in trace_steps for json_str in step["json"])
+    trace_bytes += sum(len(citation_view["json"]) for citation_view in citation_views)
+    return {"steps": steps, "citations": citation_views, "bytes": trace_bytes}
+
+# Shows a page of the items, with a page selector when they do not fit on one page
+def paginate(items, key):
+    if len(items) <= trace_page_size:
+        return 0, items
+    pages = (len(items) + trace_page_size - 1) // trace_page_size
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=key)
+    start = (page - 1) * trace_page_size
+    return start, items[start:start + trace_page_size]
+
+# Code blocks are only rendered for the steps the user opens
+def show_json(json_strs, key):
+    if st.toggle("Show JSON", key=key):
+        for json_str in json_strs:
+            st.code(json_str, language="json", line_numbers=json_str.count("\n"))
+
+if st.session_state.get("trace_view") is None:
+    st.session_state.trace_view = build_trace_view(st.session_state.trace, st.session_state.citations)
 
 # Sidebar section for trace
 with st.sidebar:
+    st.caption(f"Session memory: {len(st.session_state.messages)} messages, {st.session_state.history_bytes / 1024:.1f} KB of history, "
+               f"{st.session_state.trace_view['bytes'] / 1024:.1f} KB of trace")
     st.title("Trace")
 
     # Show each trace types in separate sections
-    step_num = 1
     for trace_type in trace_type_headers:
         st.subheader(trace_type_headers[trace_type])
 
-        # Organize traces by step similar to how it is shown in the Bedrock console
-        if trace_type in st.session_state.trace:
-            trace_steps = {}
-            for trace in st.session_state.trace[trace_type]:
-                # Each trace type and step may have different information for the end-to-end flow
-                for trace_info_type in trace_info_types:
-                    if trace_info_type in trace:
-                        trace_id = trace[trace_info_type]["traceId"]
-                        if trace_id not in trace_steps:
-                            trace_steps[trace_id] = [trace]
-                        else:
-                            trace_steps[trace_id].append(trace)
-                        break
-
-            # Show trace steps in JSON similar to the Bedrock console
-            for trace_id in trace_steps.keys():
-                with st.expander("Trace Step " + str(step_num), expanded=False):
-                    for trace in trace_steps[trace_id]:
-                        trace_str = json.dumps(trace, indent=2)
-                        st.code(trace_str, language="json", line_numbers=trace_str.count("\n"))
-                step_num = step_num + 1
+        trace_steps = st.session_state.trace_view["steps"][trace_type]
+        if len(trace_steps) > 0:
+            _, page_steps = paginate(trace_steps, f"trace-page-{trace_type}")
+            for step in page_steps:
+                with st.expander(step["title"], expanded=False):
+                    show_json(step["json"], f"trace-{step['title']}")
         else:
             st.text("None")
 
     st.subheader("Citations")
-    if len(st.session_state.citations) > 0:
-        citation_num = 1
-        for citation in st.session_state.citations:
-            for retrieved_ref_num, retrieved_ref in enumerate(citation["retrievedReferences"]):
-                with st.expander("Citation [" + str(citation_num) + "]", expanded=False):
-                    citation_str = json.dumps({
-                        "generatedResponsePart": citation["generatedResponsePart"],
-                        "retrievedReference": citation["retrievedReferences"][retrieved_ref_num]
-                    }, indent=2)
-                    st.code(citation_str, language="json", line_numbers=trace_str.count("\n"))
-                citation_num = citation_num + 1
+    citation_views = st.session_state.trace_view["citations"]
+    if len(citation_views) > 0:
+        _, page_citations = paginate(citation_views, "citation-page")
+        for citation_view in page_citations:
+            with st.expander("Citation [" + str(citation_view["number"]) + "]", expanded=False):
+                show_json([citation_view["json"]], f"citation-{citation_view['number']}")
     else:
         st.text("None")
@@ -1,53 +1,162 @@
 import boto3
 import json
+import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import botocore.config
 from botocore.exceptions import ClientError
-output_text = ""
-citations = []
-trace = {}
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError, TimeoutError as Urllib3TimeoutError
+from urllib3.util.retry import Retry
 requests.packages.urllib3.add_stderr_logger() 
 
 knowledge_base_id = os.environ.get("KNOWLEDGEBASE_ID")
 function_calling_url = os.environ.get("FUNCTION_CALLING_URL")
+# Ask the agent to stream the final response in chunks instead of sending it in one piece at the end
+stream_final_response = os.environ.get("BEDROCK_AGENT_STREAM_FINAL_RESPONSE", "true").lower() == "true"
 
-def invoke_agent_ROC(agent_id, agent_alias_id, session_id,invocation_id,return_control_invocation_results):
-    
-    session_config = botocore.config.Config(
-        user_agent_extra=f'APN/1.0 Grafana/1.0 Observability Assistant/168813752b3fd8f8a0e9411b7f9598a683f9854f'
+logger = logging.getLogger(__name__)
+
+SEARCH_TYPES = ["HYBRID", "SEMANTIC"]
+# Bedrock returns 1 to 100 knowledge base results
+MAX_NUMBER_OF_RESULTS = 100
+
+# Knowledge base retrieval settings of the environment (config/<environment>.yaml), overridable per request.
+# KB_FILTER is a Bedrock RetrievalFilter as JSON, e.g. {"equals": {"key": "source", "value": "promql"}}
+# Values Bedrock would reject fall back to the default search type or are clamped to the supported result counts.
+def load_retrieval_settings():
+    try:
+        number_of_results = int(os.environ.get("KB_NUMBER_OF_RESULTS") or MAX_NUMBER_OF_RESULTS)
+    except ValueError:
+        logger.warning(f"Invalid KB_NUMBER_OF_RESULTS {os.environ.get('KB_NUMBER_OF_RESULTS')}, using {MAX_NUMBER_OF_RESULTS}")
+        number_of_results = MAX_NUMBER_OF_RESULTS
+    search_type = (os.environ.get("KB_SEARCH_TYPE") or SEARCH_TYPES[0]).strip().upper()
+    if search_type not in SEARCH_TYPES:
+        logger.warning(f"Invalid KB_SEARCH_TYPE {search_type}, using {SEARCH_TYPES[0]}")
+        search_type = SEARCH_TYPES[0]
+    return {
+        "numberOfResults": min(max(number_of_results, 1), MAX_NUMBER_OF_RESULTS),
+        "searchType": search_type,
+        "filter": json.loads(os.environ.get("KB_FILTER") or "null")
+    }
+
+retrieval_settings = load_retrieval_settings()
+
+# Bounds for the return of control loop of a single turn, so a runaway tool chain can not hold a session forever
+max_return_control_hops = int(os.environ.get("BEDROCK_AGENT_MAX_RETURN_CONTROL_HOPS", 10))
+max_turn_seconds = int(os.environ.get("BEDROCK_AGENT_MAX_TURN_SECONDS", 300))
+
+# API calls requested in one return of control event run concurrently on this pool, shared by all sessions
+api_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("RETURN_CONTROL_MAX_WORKERS", 8)))
+
+# Pooled HTTP session for the return of control API, shared by all sessions so connections to the ALB are reused.
+# Failed connections are retried with exponential backoff for every method, POST included, as the request never
+# reached the API. GET requests answered with a 5xx are retried as well, POST requests are not. Read timeouts are
+# never retried, a stuck call already waited the full read timeout and a POST may already have been processed.
+api_timeout = (
+    float(os.environ.get("API_CONNECT_TIMEOUT_SECONDS", 3.05)),
+    float(os.environ.get("API_READ_TIMEOUT_SECONDS", 60))
+)
+api_session = requests.Session()
+api_session.mount("http://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=int(os.environ.get("API_POOL_MAXSIZE", 32)),
+    max_retries=Retry(
+        total=int(os.environ.get("API_MAX_RETRIES", 2)),
+        read=0,
+        backoff_factor=float(os.environ.get("API_RETRY_BACKOFF_SECONDS", 0.5)),
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=["GET"],
+        raise_on_status=False
     )
-    client = boto3.session.Session().client(service_name="bedrock-agent-runtime",config=session_config)
-    response = client.invoke_agent(
-            agentId=agent_id,
-            agentAliasId=agent_alias_id,
+))
+
+# One bedrock-agent-runtime client is shared by every Streamlit session in the process. boto3 clients are
+# thread safe, so creating it once removes session creation, endpoint resolution and credential lookup
+# from every turn and every return of control hop.
+client_config = botocore.config.Config(
+    user_agent_extra=f'APN/1.0 Grafana/1.0 Observability Assistant/168813752b3fd8f8a0e9411b7f9598a683f9854f',
+    max_pool_connections=int(os.environ.get("BEDROCK_CLIENT_MAX_POOL_CONNECTIONS", 50)),
+    connect_timeout=int(os.environ.get("BEDROCK_CLIENT_CONNECT_TIMEOUT_SECONDS", 10)),
+    # Agent turns can run for a while before the first event arrives
+    read_timeout=int(os.environ.get("BEDROCK_CLIENT_READ_TIMEOUT_SECONDS", 300)),
+    retries={
+        'max_attempts': int(os.environ.get("BEDROCK_CLIENT_MAX_ATTEMPTS", 3)),
+        'mode': 'standard'
+    }
+)
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            # Another session may have created the client while this one waited for the lock
+            if _client is None:
+                start = time.perf_counter()
+                _client = boto3.session.Session().client(service_name="bedrock-agent-runtime", config=client_config)
+                logger.info(f"bedrock-agent-runtime client created in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return _client
+
+# Session state sent with every call of a turn, with the retrieval settings overridden by the given values
+def get_knowledge_base_configurations(retrieval=None):
+    settings = dict(retrieval_settings, **{name: value for name, value in (retrieval or {}).items() if value is not None})
+    vector_search_configuration = {
+        'overrideSearchType': settings['searchType'],
+        'numberOfResults': settings['numberOfResults']
+    }
+    if settings['filter']:
+        vector_search_configuration['filter'] = settings['filter']
+    return [
+        {
+            'knowledgeBaseId': knowledge_base_id,
+            'retrievalConfiguration': {
+                'vectorSearchConfiguration': vector_search_configuration
+            }
+        }
+    ]
+
+# Output, citations and traces of a single agent invocation, including its return of control hops.
+# Every call gets its own object, so concurrent Streamlit sessions in one process never share state.
+# retrieval overrides the knowledge base retrieval settings (numberOfResults, searchType, filter) for this call.
+class AgentInvocation:
+
+    def __init__(self, agent_id, agent_alias_id, session_id, retrieval=None):
+        self.agent_id = agent_id
+        self.agent_alias_id = agent_alias_id
+        self.session_id = session_id
+        self.knowledge_base_configurations = get_knowledge_base_configurations(retrieval)
+        self.output_text = ""
+        self.citations = []
+        self.trace = {}
+
+def invoke_agent_ROC(invocation, invocation_id, return_control_invocation_results):
+    
+    response = get_client().invoke_agent(
+            agentId=invocation.agent_id,
+            agentAliasId=invocation.agent_alias_id,
             enableTrace=True,
-            sessionId=session_id,
+            sessionId=invocation.session_id,
             sessionState = {
                 'invocationId': invocation_id,
                 'returnControlInvocationResults': return_control_invocation_results,
-                'knowledgeBaseConfigurations': [
-                    {
-                        'knowledgeBaseId': knowledge_base_id, # Replace with your knowledge base ID
-                        'retrievalConfiguration': {
-                            'vectorSearchConfiguration':{
-                                'overrideSearchType': 'HYBRID',
-                                'numberOfResults': 100
-                            }
-                            
-                        }
-                    }
-                ]
-            }
+                'knowledgeBaseConfigurations': invocation.knowledge_base_configurations
+            },
+            streamingConfigurations={'streamFinalResponse': stream_final_response}
         )
-    process_response(response,agent_id, agent_alias_id, session_id)
+    return response
     
-def invoke_agent(agent_id, agent_alias_id, session_id, prompt):
+# Invokes the agent and yields text chunks, citations and trace events as they arrive, so the caller
+# can render the answer progressively. Events are dicts with a type of chunk, citations or trace.
+# Pass an AgentInvocation to read the accumulated output, citations and traces once the stream ends.
+def invoke_agent_stream(agent_id, agent_alias_id, session_id, prompt, invocation=None):
+    invocation = invocation or AgentInvocation(agent_id, agent_alias_id, session_id)
     try:
-        session_config = botocore.config.Config(
-            user_agent_extra=f'APN/1.0 Grafana/1.0 Observability Assistant/168813752b3fd8f8a0e9411b7f9598a683f9854f'
-        )
-        client = boto3.session.Session().client(service_name="bedrock-agent-runtime", config=session_config)
+        client = get_client()
         # See https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/bedrock-agent-runtime/client/invoke_agent.html
         response = client.invoke_agent(
             agentId=agent_id,
@@ -56,105 +165,157 @@ def invoke_agent(agent_id, agent_alias_id, session_id, prompt):
             sessionId=session_id,
             inputText=prompt,
             sessionState = {
-             'knowledgeBaseConfigurations': [
-                {
-                    'knowledgeBaseId': knowledge_base_id, # Replace with your knowledge base ID
-                    'retrievalConfiguration': {
-                         'vectorSearchConfiguration':{
-                            'overrideSearchType': 'HYBRID',
-                            'numberOfResults': 100
-                         }
-                         
-                    }
-                }
-            ]
-            }
+                'knowledgeBaseConfigurations': invocation.knowledge_base_configurations
+            },
+            streamingConfigurations={'streamFinalResponse': stream_final_response}
         )
-        global output_text, citations, trace
-        output_text = ""
-        citations = []
-        trace = {}
-        process_response(response,agent_id, agent_alias_id, session_id)
+        yield from run_agent_loop(response, invocation)
     except ClientError as e:
         raise
 
+def invoke_agent(agent_id, agent_alias_id, session_id, prompt, retrieval=None):
+    invocation = AgentInvocation(agent_id, agent_alias_id, session_id, retrieval)
+    for _ in invoke_agent_stream(agent_id, agent_alias_id, session_id, prompt, invocation):
+        pass
+
     return {
-        "output_text": output_text,
-        "citations": citations,
-        "trace": trace
+        "output_text": invocation.output_text,
+        "citations": invocation.citations,
+        "trace": invocation.trace
     }
 
 
-def process_response(response,agent_id, agent_alias_id, session_id):
-    
-    global output_text, citations, trace
+# Processes agent responses until the agent stops returning control. Every return of control event is answered
+# with the results of all its API calls in one request, and the loop stops once the hop or time budget is used up.
+def run_agent_loop(response, invocation):
+    deadline = time.monotonic() + max_turn_seconds
+    hops = 0
+    while True:
+        return_control = yield from process_response(response, invocation)
+        if return_control is None:
+            return
+
+        hops += 1
+        if hops > max_return_control_hops or time.monotonic() >= deadline:
+            logger.warning(f"Stopping agent turn for session {invocation.session_id} after {hops - 1} return of control hops")
+            text = "\n\nI stopped here because this question needed more data lookups than allowed for a single answer. Please narrow down the question."
+            invocation.output_text += text
+            yield {"type": "chunk", "text": text}
+            return
+
+        results = run_return_control(return_control)
+        response = invoke_agent_ROC(invocation, return_control['invocationId'], results)
+
+# Calls the APIs requested in a return of control event concurrently and returns all results in input order
+def run_return_control(return_control):
+    invocation_inputs = [invocation_input['apiInvocationInput'] for invocation_input in return_control['invocationInputs']]
+    start = time.perf_counter()
+    api_responses = list(api_executor.map(get_data_from_api, invocation_inputs))
+    logger.info(f"Return of control with {len(invocation_inputs)} API calls took {(time.perf_counter() - start) * 1000:.1f} ms")
+    return [result for api_response in api_responses for result in api_response]
+
+# Yields the chunk, citation and trace events of one agent response.
+# Returns the return of control event if the agent asked for API calls, None otherwise.
+def process_response(response, invocation):
     
+    return_control = None
     for event in response.get("completion"):
 
             #Implementing Return of Control to call the code locally
 
             if 'returnControl' in event:
-                # return_control_invocation_results = []
                 return_control = event['returnControl']
-                invocation_id = return_control['invocationId']
-                invocation_inputs = return_control['invocationInputs']
-
-                for invocation_input in invocation_inputs:
-                    function_invocation_input = invocation_input['apiInvocationInput']
-                    api_response = get_data_from_api(function_invocation_input)
-                    # return_control_invocation_results.append( 
-                    #     {
-                    #         'apiResult': lambda_response['response']
-                    #     }
-                    # )
-                    invoke_agent_ROC(agent_id, agent_alias_id, session_id, invocation_id,api_response)
                         
             # Combine the chunks to get the output text
             elif "chunk" in event:
                 chunk = event["chunk"]
-                output_text += chunk["bytes"].decode()
+                text = chunk["bytes"].decode()
+                invocation.output_text += text
+                yield {"type": "chunk", "text": text}
                 if "attribution" in chunk:
-                    citations = citations + chunk["attribution"]["citations"]
+                    invocation.citations.extend(chunk["attribution"]["citations"])
+                    yield {"type": "citations", "citations": chunk["attribution"]["citations"]}
 
             # Extract trace information from all events
             elif "trace" in event:
                 for trace_type in ["preProcessingTrace", "orchestrationTrace", "postProcessingTrace","actionGroupInvocationOutput","knowledgeBaseLookupOutput"]:
                     if trace_type in event["trace"]["trace"]:
-                        if trace_type not in trace:
-                            trace[trace_type] = []
-                        trace[trace_type].append(event["trace"]["trace"][trace_type])
+                        invocation.trace.setdefault(trace_type, []).append(event["trace"]["trace"][trace_type])
+                        yield {"type": "trace", "trace_type": trace_type, "trace": event["trace"]["trace"][trace_type]}
+
+    return return_control
+
+# Rebuilds the JSON request body from the properties Bedrock passes in the return of control event.
+# Bedrock passes every property value as a string, so arrays and objects are decoded back from JSON
+def get_request_body(parameters):
+    content = parameters.get('requestBody', {}).get('content', {})
+    properties = content.get('application/json', {}).get('properties', [])
+    body = {}
+    for request_property in properties:
+        value = request_property['value']
+        if request_property.get('type') in ('array', 'object'):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        body[request_property['name']] = value
+    return body
+
+# Bedrock response state for an HTTP status. Client errors are sent back for the agent to fix its request,
+# server errors and timeouts are reported as failures.
+def get_response_state(status_code):
+    if status_code >= 500:
+        return 'FAILURE'
+    if status_code >= 400:
+        return 'REPROMPT'
+    return None
 
 # Function which calls the local lambda function to get the data
+# Timeouts reach us as a requests Timeout, or as a ConnectionError wrapping urllib3's MaxRetryError once the retries
+# are used up, so the underlying reason is checked too. urllib3 derives refused connections from its connect timeout.
+def is_timeout(error):
+    if isinstance(error, requests.exceptions.Timeout):
+        return True
+    cause = error.args[0] if error.args else None
+    reason = getattr(cause, "reason", cause)
+    return isinstance(reason, Urllib3TimeoutError) and not isinstance(reason, NewConnectionError)
+
 def get_data_from_api(parameters):
     return_function_response = parameters
-    print(return_function_response)
+    logger.info(return_function_response)
     path_to_invoke = "http://"+function_calling_url+return_function_response['apiPath'] #TODO: Pass the protocol from ALB
-    # method_to_invoke = return_function_response['httpMethod']
-    parameters_to_pass = return_function_response['parameters']
-    # Check if the parameters_to_pass is not None
-    
-    session = requests.Session()
-
-    if not len(parameters_to_pass) == 0:
-        parameters_value = parameters_to_pass[0]['value']
-        parameters_name = parameters_to_pass[0]['name']
-        session.params = {
-            parameters_name: parameters_value
-        }
+    # Forward every parameter the agent passed, not just the first one
+    parameters_to_pass = {
+        parameter['name']: parameter['value'] for parameter in return_function_response.get('parameters', [])
+    }
     # {'actionGroup': 'logs-api-caller', 'actionInvocationType': 'RESULT', 'apiPath': '/get-available-logql-labels', 'httpMethod': 'GET', 'parameters': []}
     
-    response = session.get(path_to_invoke).json()
-    response_body = {"application/json": {"body": json.dumps(response)}}
+    try:
+        if return_function_response['httpMethod'] == 'POST':
+            response = api_session.post(path_to_invoke, params=parameters_to_pass, json=get_request_body(return_function_response), timeout=api_timeout)
+        else:
+            response = api_session.get(path_to_invoke, params=parameters_to_pass, timeout=api_timeout)
+        status_code = response.status_code
+        # The API response (JSON or compact text) is passed to the agent as is, without decoding and encoding it again
+        body = response.text
+    except requests.exceptions.RequestException as e:
+        # A stuck or unreachable backend is reported to the agent right away instead of failing the turn
+        logger.error(f"Calling {return_function_response['apiPath']} failed: {str(e)}")
+        status_code = 504 if is_timeout(e) else 502
+        body = json.dumps({"error": f"The API call failed: {str(e)}"})
+    response_body = {"application/json": {"body": body}}
     api_response = [{
                 'apiResult': {
                     'actionGroup': return_function_response['actionGroup'],
                     'apiPath': return_function_response['apiPath'],
                     # 'confirmationState': 'CONFIRM'|'DENY',
                     'httpMethod': return_function_response['httpMethod'],
-                    # 'httpStatusCode': response.status_code,
-                    'responseBody': response_body,
-                    # 'responseState': 'FAILURE'|'REPROMPT'
+                    'httpStatusCode': status_code,
+                    'responseBody': response_body
                 }
     }]
+    response_state = get_response_state(status_code)
+    if response_state is not None:
+        api_response[0]['apiResult']['responseState'] = response_state
 
-    return api_response
\ No newline at end of file
+    return api_response
@@ -0,0 +1,61 @@
+# Inserts citation markers into the agent answer.
+# Markers are placed after the part of the answer each citation covers, references are numbered in the order
+# they first appear and a reference cited again reuses its number. The annotated text is built in one pass
+# over the citations sorted by span, so it stays linear in the answer length and number of references.
+# The citations sidebar is numbered from the same map, so its numbers match the markers in the answer.
+
+def get_reference_uri(retrieved_ref):
+    location = retrieved_ref.get("location") or {}
+    if "s3Location" in location:
+        return location["s3Location"]["uri"]
+    if "webLocation" in location:
+        return location["webLocation"]["url"]
+    return location.get("type", "unknown")
+
+def sort_by_span(citations):
+    return sorted(citations, key=lambda citation: citation["generatedResponsePart"]["textResponsePart"]["span"]["end"])
+
+# Number of every cited reference, keyed by its uri
+def reference_numbers(citations):
+    numbers = {}
+    for citation in sort_by_span(citations):
+        for retrieved_ref in citation["retrievedReferences"]:
+            numbers.setdefault(get_reference_uri(retrieved_ref), len(numbers) + 1)
+    return numbers
+
+# One entry per numbered reference with the parts of the answer that cite it, ordered by number
+def group_references(citations):
+    numbers = reference_numbers(citations)
+    groups = {}
+    for citation in sort_by_span(citations):
+        for retrieved_ref in citation["retrievedReferences"]:
+            uri = get_reference_uri(retrieved_ref)
+            group = groups.setdefault(uri, {"number": numbers[uri], "retrievedReference": retrieved_ref, "generatedResponseParts": []})
+            group["generatedResponseParts"].append(citation["generatedResponsePart"])
+    return sorted(groups.values(), key=lambda group: group["number"])
+
+def annotate_citations(output_text, citations):
+    numbers = reference_numbers(citations)
+    if len(numbers) == 0:
+        return output_text
+
+    parts = []
+    last = 0
+    for citation in sort_by_span(citations):
+        if not citation["retrievedReferences"]:
+            continue
+        end_span = min(citation["generatedResponsePart"]["textResponsePart"]["span"]["end"] + 1, len(output_text))
+        markers = []
+        for retrieved_ref in citation["retrievedReferences"]:
+            marker = f"[{numbers[get_reference_uri(retrieved_ref)]}]"
+            if marker not in markers:
+                markers.append(marker)
+        parts.append(output_text[last:end_span])
+        parts.append("".join(markers) + "\n")
+        last = end_span
+    parts.append(output_text[last:])
+
+    parts.append("\n")
+    for uri, number in numbers.items():
+        parts.append(f"\n<br>[{number}] {uri}")
+    return "".join(parts)
@@ -0,0 +1,84 @@
+# Bounded conversation history for the chat page.
+# Every turn is written to the transcript store (S3 when TRANSCRIPT_BUCKET is set, a local folder otherwise) as
+# soon as it completes, so the in memory history can be bounded without losing anything. Only the last
+# HISTORY_WINDOW messages are rendered in full, older messages in memory are collapsed and the oldest are
+# dropped from memory once the session holds more than HISTORY_MAX_MESSAGES messages or HISTORY_MAX_BYTES bytes.
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+history_window = int(os.environ.get("HISTORY_WINDOW", 20))
+history_max_messages = int(os.environ.get("HISTORY_MAX_MESSAGES", 200))
+history_max_bytes = int(os.environ.get("HISTORY_MAX_BYTES", 2 * 1024 * 1024))
+
+
+def message_size(message):
+    return len(message["content"].encode())
+
+
+def init_history(state):
+    state.messages = []
+    state.history_bytes = 0
+    state.archived_messages = 0
+    state.turn = 0
+
+
+# Appends a message and drops the oldest messages from memory when the session is over its bounds
+def add_message(state, message):
+    state.messages.append(message)
+    state.history_bytes += message_size(message)
+    while len(state.messages) > 1 and (len(state.messages) > history_max_messages or state.history_bytes > history_max_bytes):
+        dropped = state.messages.pop(0)
+        state.history_bytes -= message_size(dropped)
+        state.archived_messages += 1
+
+
+class TranscriptStore:
+
+    def __init__(self, bucket=None, directory=None):
+        self.bucket = bucket
+        self.directory = directory
+        self._client = None
+        self._lock = threading.Lock()
+        # Writes happen in the background so the chat is not held up by storage
+        self._executor = ThreadPoolExecutor(max_workers=2)
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = boto3.session.Session().client("s3")
+            return self._client
+
+    # Each turn is its own JSON lines object under the session prefix, S3 objects can not be appended to
+    def _write(self, session_id, turn, messages):
+        body = "\n".join(json.dumps(message) for message in messages) + "\n"
+        try:
+            if self.bucket:
+                self._get_client().put_object(Bucket=self.bucket, Key=f"transcripts/{session_id}/{turn:05d}.jsonl",
+                                              Body=body.encode(), ContentType="application/x-ndjson")
+            else:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(os.path.join(self.directory, f"{session_id}.jsonl"), "a") as transcript:
+                    transcript.write(body)
+        except Exception as e:
+            logger.error(f"Writing transcript turn {turn} of session {session_id} failed: {str(e)}")
+
+    def save_turn(self, session_id, turn, messages):
+        messages = [dict(message, session_id=session_id, turn=turn, saved_at=time.time()) for message in messages]
+        self._executor.submit(self._write, session_id, turn, messages)
+
+    def location(self, session_id):
+        if self.bucket:
+            return f"s3://{self.bucket}/transcripts/{session_id}/"
+        return os.path.join(self.directory, f"{session_id}.jsonl")
+
+
+transcript_store = TranscriptStore(bucket=os.environ.get("TRANSCRIPT_BUCKET"),
+                                   directory=os.environ.get("TRANSCRIPT_DIR", "/tmp/transcripts"))
@@ -52,11 +52,12 @@ class VpcStack(Stack):
 
         self.ecs_cluster = cluster
 
-        #Access Logs specific S3 Bucket
+        #Access Logs specific S3 Bucket, the buckets of the other stacks write their server access logs here
 
-        # bucket = s3.Bucket(self, "AcecssLog",
-        #     encryption=s3.BucketEncryption.S3_MANAGED,
-        #     enforce_ssl=True
-        # )
+        bucket = s3.Bucket(self, "AccessLogs",
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True
+        )
 
-        # self.access_logs_bucket = bucket
\ No newline at end of file
+        self.access_logs_bucket = bucket
\ No newline at end of file
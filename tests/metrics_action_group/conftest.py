@@ -0,0 +1,6 @@
+# The metrics Lambda modules are imported from their source folder. It is appended, not prepended, because the modules
+# shared with the RoC service have the same names and the two copies are identical
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "stacks", "metrics_action_group", "lambda"))
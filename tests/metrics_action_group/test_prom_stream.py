@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from prom_stream import ContinuationError, decode_continuation, encode_continuation, query_page, read_page
+
+
+def vector(series):
+    return {"status": "success", "data": {"resultType": "vector", "result": [
+        {"metric": {"__name__": "up", "pod": f"api-{i}", "note": "naïve ✓"}, "value": [1700000000, str(i)]}
+        for i in range(series)
+    ]}}
+
+
+def chunked(response, size):
+    body = json.dumps(response, ensure_ascii=False).encode()
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+class FakeResponse:
+
+    def __init__(self, response):
+        self.response = response
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return iter(chunked(self.response, 100))
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 100000])
+def test_series_split_across_chunks_are_parsed(size):
+    response = vector(20)
+    page = read_page(chunked(response, size), budget_bytes=1_000_000)
+    assert page["data"] == response["data"]
+    assert page["seriesTotal"] == 20
+    assert page["truncated"] is False
+
+
+def test_responses_without_a_result_array_are_parsed_whole():
+    error = {"status": "error", "errorType": "bad_data", "error": "parse error"}
+    assert read_page(chunked(error, 5)) == error
+    scalar = {"status": "success", "data": {"resultType": "scalar", "result": [1700000000, "1"]}}
+    assert read_page(chunked(scalar, 5)) == scalar
+
+
+def test_continuation_tokens_round_trip():
+    token = encode_continuation('sum(up{job="api"})', 1700000000.5, 40)
+    assert decode_continuation(token, 'sum(up{job="api"})') == (1700000000.5, 40)
+    with pytest.raises(ContinuationError):
+        decode_continuation(token, "up")
+    with pytest.raises(ContinuationError):
+        decode_continuation("not a token", "up")
+
+
+def test_pages_follow_continuations_to_the_last_page():
+    response = vector(30)
+    requests = []
+    responses = []
+
+    def grafana_get(path, params, stream):
+        requests.append(params)
+        responses.append(FakeResponse(response))
+        return responses[-1]
+
+    series = []
+    eval_time, offset = 1700000000, 0
+    while True:
+        page = query_page(grafana_get, "up", eval_time, offset=offset, budget_bytes=1000)
+        series.extend(page["data"]["result"])
+        if not page["truncated"]:
+            break
+        assert page["seriesReturned"] > 0
+        eval_time, offset = decode_continuation(page["continuation"], "up")
+    assert "continuation" not in page
+    assert series == response["data"]["result"]
+    assert len(requests) > 1
+    assert {params["time"] for params in requests} == {1700000000}
+    assert all(fake.closed for fake in responses)
+
+
+def test_series_larger_than_the_budget_are_trimmed():
+    response = {"status": "success", "data": {"resultType": "matrix", "result": [
+        {"metric": {"__name__": "up"}, "values": [[1700000000 + t, "1"] for t in range(1000)]}]}}
+    page = read_page(chunked(response, 512), budget_bytes=2000)
+    series = page["data"]["result"][0]
+    assert series["samplesTruncated"] > 0
+    assert series["values"][-1] == [1700000999, "1"]
+    assert len(json.dumps(series["values"])) <= 2000
@@ -0,0 +1,5 @@
+# The RoC service modules are imported from their source folder, like the service does in its container
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "stacks", "roc_action_group", "src"))
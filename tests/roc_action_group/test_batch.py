@@ -0,0 +1,34 @@
+import asyncio
+import os
+
+# Importing the service creates its AWS clients
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import app  # noqa: E402
+from app import BatchRequest, Statement  # noqa: E402
+
+
+def test_statements_of_both_types_keep_their_results(monkeypatch):
+    calls = []
+
+    async def run_promql_statement(query):
+        calls.append(("promql", query))
+        return {"status": "success", "data": {"resultType": "vector", "result": []}}
+
+    async def run_logql_statement(query):
+        calls.append(("logql", query))
+        return {"status": "success", "data": {"resultType": "streams", "result": []}}
+
+    monkeypatch.setattr(app, "run_promql_statement", run_promql_statement)
+    monkeypatch.setattr(app, "run_logql_statement", run_logql_statement)
+    batch = BatchRequest(statements=[
+        Statement(type="promql", query='{job="api"}'),
+        Statement(type="logql", query='{job="api"}'),
+        Statement(type="promql", query='{job="api"}'),
+    ])
+    results = asyncio.run(app.invoke_batch_statements(batch, "json"))
+
+    assert sorted(calls) == [("logql", '{job="api"}'), ("promql", '{job="api"}')]
+    assert set(results) == {'promql:{job="api"}', 'logql:{job="api"}'}
+    assert results['promql:{job="api"}']["result"]["data"]["resultType"] == "vector"
+    assert results['logql:{job="api"}']["result"]["data"]["resultType"] == "streams"
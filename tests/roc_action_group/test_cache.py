@@ -0,0 +1,166 @@
+import asyncio
+import types
+
+import cache
+import grafana_client
+from cache import InMemoryCacheBackend, ResultCache, TTLCache
+from grafana_client import normalize_query, request_key
+
+
+class FakeClock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def use_clock(monkeypatch, module, clock):
+    # Only the module under test sees the fake clock, asyncio keeps the real one
+    monkeypatch.setattr(module, "time", types.SimpleNamespace(monotonic=clock, time=clock))
+
+
+def test_whitespace_variants_share_a_key():
+    variants = [
+        'sum(rate(http_requests_total{job="api"}[5m]))',
+        'sum( rate( http_requests_total{ job="api" }[5m] ) )',
+        'sum(rate(http_requests_total{job="api"}[5m]))\n',
+        'sum (\n\trate(http_requests_total{job = "api"} [5m])\n)',
+    ]
+    keys = {request_key("/api/v1/query", {"query": query, "time": "1700000000"}) for query in variants}
+    assert len(keys) == 1
+
+
+def test_operator_spacing_variants_share_a_key():
+    assert normalize_query('up == 1') == normalize_query('up==1')
+    assert normalize_query('{app =~ "api.*", env != "dev"}') == normalize_query('{app=~"api.*",env!="dev"}')
+    assert normalize_query('rate(x[5m]) > 0') == normalize_query('rate(x[5m])>0')
+
+
+def test_quoted_strings_are_kept_verbatim():
+    assert normalize_query('{msg="a  b"}') != normalize_query('{msg="a b"}')
+    assert normalize_query('{app="x"} |= "level = error"') == '{app="x"}|="level = error"'
+
+
+def test_different_statements_and_times_have_different_keys():
+    assert request_key("/api/v1/query", {"query": "up", "time": "1"}) != request_key("/api/v1/query", {"query": "down", "time": "1"})
+    assert request_key("/api/v1/query", {"query": "up", "time": "1"}) != request_key("/api/v1/query", {"query": "up", "time": "2"})
+    assert request_key("/api/v1/query", {"query": "up"}, 30) != request_key("/api/v1/query_range", {"query": "up"}, 30)
+
+
+def test_now_statements_are_bucketed_by_time(monkeypatch):
+    clock = FakeClock(now=600.0)
+    use_clock(monkeypatch, grafana_client, clock)
+    first = request_key("/api/v1/query", {"query": "up"}, time_bucket=30)
+    clock.now = 629.0
+    assert request_key("/api/v1/query", {"query": "up"}, time_bucket=30) == first
+    clock.now = 630.0
+    assert request_key("/api/v1/query", {"query": "up"}, time_bucket=30) != first
+
+
+def test_statements_with_an_explicit_time_are_not_bucketed(monkeypatch):
+    clock = FakeClock(now=600.0)
+    use_clock(monkeypatch, grafana_client, clock)
+    first = request_key("/api/v1/query", {"query": "up", "time": "500"}, time_bucket=30)
+    clock.now = 6000.0
+    assert request_key("/api/v1/query", {"query": "up", "time": "500"}, time_bucket=30) == first
+
+
+def test_ttl_cache_entries_expire(monkeypatch):
+    clock = FakeClock()
+    use_clock(monkeypatch, cache, clock)
+    ttl_cache = TTLCache("Test", ttl=10, maxsize=4)
+    ttl_cache.set("labels", ["job"])
+    clock.now += 9
+    assert ttl_cache.get("labels").value == ["job"]
+    clock.now += 1
+    assert ttl_cache.get("labels") is None
+
+
+def test_ttl_cache_serves_stale_entries_while_refreshing(monkeypatch):
+    clock = FakeClock()
+    use_clock(monkeypatch, cache, clock)
+    ttl_cache = TTLCache("Test", ttl=10, maxsize=4, stale_ttl=20)
+    loads = []
+
+    async def loader():
+        loads.append(clock.now)
+        return len(loads)
+
+    async def run():
+        assert await ttl_cache.get_or_load("key", loader) == 1
+        clock.now += 15
+        # Stale value is returned at once, the refresh runs in the background
+        assert await ttl_cache.get_or_load("key", loader) == 1
+        await asyncio.sleep(0)
+        assert await ttl_cache.get_or_load("key", loader) == 2
+        clock.now += 31
+        assert await ttl_cache.get_or_load("key", loader) == 3
+
+    asyncio.run(run())
+    assert len(loads) == 3
+
+
+def test_ttl_cache_evicts_least_recently_used(monkeypatch):
+    use_clock(monkeypatch, cache, FakeClock())
+    ttl_cache = TTLCache("Test", ttl=10, maxsize=2)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    ttl_cache.get("a")
+    ttl_cache.set("c", 3)
+    assert ttl_cache.get("b") is None
+    assert ttl_cache.get("a").value == 1
+
+
+def test_result_cache_loads_again_after_the_path_ttl(monkeypatch):
+    clock = FakeClock()
+    use_clock(monkeypatch, cache, clock)
+    result_cache = ResultCache("Test", InMemoryCacheBackend(max_bytes=1024 * 1024), ttls={"/api/v1/query": 30})
+    loads = []
+
+    async def loader():
+        loads.append(clock.now)
+        return {"status": "success", "data": {"loads": len(loads)}}
+
+    async def get():
+        return await result_cache.get_or_load("/api/v1/query", ("/api/v1/query", ("query", "up")), loader)
+
+    async def run():
+        assert (await get())["data"]["loads"] == 1
+        clock.now += 29
+        assert (await get())["data"]["loads"] == 1
+        clock.now += 1
+        assert (await get())["data"]["loads"] == 2
+
+    asyncio.run(run())
+
+
+def test_result_cache_skips_paths_without_ttl_and_uncacheable_results(monkeypatch):
+    use_clock(monkeypatch, cache, FakeClock())
+    result_cache = ResultCache("Test", InMemoryCacheBackend(max_bytes=1024 * 1024), ttls={"/api/v1/query": 30})
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return {"status": "error"}
+
+    async def run():
+        for path in ("/loki/api/v1/query_range", "/api/v1/query", "/api/v1/query"):
+            await result_cache.get_or_load(path, (path,), loader, should_cache=lambda value: value["status"] == "success")
+
+    asyncio.run(run())
+    assert len(loads) == 3
+
+
+def test_in_memory_backend_evicts_by_size(monkeypatch):
+    use_clock(monkeypatch, cache, FakeClock())
+    backend = InMemoryCacheBackend(max_bytes=10)
+
+    async def run():
+        await backend.set("a", "12345", 30)
+        await backend.set("b", "12345", 30)
+        await backend.set("c", "12345", 30)
+        return await backend.get("a"), await backend.get("c"), backend.size
+
+    assert asyncio.run(run()) == (None, "12345", 10)
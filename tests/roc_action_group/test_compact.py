@@ -0,0 +1,82 @@
+from compact import encode
+from result_store import result_page
+
+
+def test_matrix_writes_common_labels_once_and_regular_samples_as_start_and_step():
+    response = {"status": "success", "step": 60, "data": {"resultType": "matrix", "result": [
+        {"metric": {"job": "api", "pod": "a"}, "values": [[1700000000, "1"], [1700000060, "2.123456"]]},
+        {"metric": {"job": "api", "pod": "b"}, "values": [[1700000000, "3"], [1700000030, "4"], [1700000120, "5"]]},
+    ]}}
+    assert encode(response).split("\n") == [
+        "resultType=matrix series=2 step=60",
+        'common {job="api"}',
+        '{pod="a"}',
+        "start=1700000000 step=60 values=1 2.123",
+        '{pod="b"}',
+        "samples=1700000000:3 1700000030:4 1700000120:5",
+    ]
+
+
+def test_vector_writes_a_shared_evaluation_time_once():
+    response = {"status": "success", "data": {"resultType": "vector", "result": [
+        {"metric": {"__name__": "up", "pod": "a"}, "value": [1700000000, "1"]},
+        {"metric": {"__name__": "up", "pod": "b"}, "value": [1700000000, "0"]},
+    ]}}
+    assert encode(response).split("\n") == [
+        "resultType=vector series=2",
+        'common {__name__="up"}',
+        "time=1700000000",
+        '{pod="a"} 1',
+        '{pod="b"} 0',
+    ]
+
+
+def test_streams_write_the_date_when_it_changes():
+    response = {"status": "success", "lines": 3, "bytes": 120, "truncated": True,
+                "truncationMarker": "Result truncated after 3 lines (120 bytes).",
+                "data": {"resultType": "streams", "result": [
+                    {"stream": {"app": "api"}, "values": [
+                        ["1700006399000000000", "first"],
+                        ["1700006399500000000", "second"],
+                        ["1700006400000000000", "third"],
+                    ]},
+                ]}}
+    assert encode(response).split("\n") == [
+        "resultType=streams streams=1 lines=3 bytes=120 truncated=true",
+        "Result truncated after 3 lines (120 bytes).",
+        '{app="api"}',
+        "date=2023-11-14",
+        "23:59:59.000 first",
+        "23:59:59.500 second",
+        "date=2023-11-15",
+        "00:00:00.000 third",
+    ]
+
+
+def test_label_values_and_log_lines_are_escaped():
+    response = {"status": "success", "data": {"resultType": "streams", "result": [
+        {"stream": {"path": 'C:\\logs\\"app"', "msg": "two\nlines"},
+         "values": [["1700000000000000000", 'Traceback:\n  File "app.py"']]},
+    ]}}
+    lines = encode(response).split("\n")
+    assert lines[1] == '{msg="two\\nlines", path="C:\\\\logs\\\\\\"app\\""}'
+    assert lines[3] == '22:13:20.000 Traceback:\\n  File "app.py"'
+    assert len(lines) == 4
+
+
+def test_result_pages_write_their_paging_fields():
+    result = {"status": "success", "data": {"resultType": "vector", "result": [
+        {"metric": {"pod": str(i)}, "value": [1700000000, str(i)]} for i in range(3)]}}
+    page = dict(result_page(result, 2, page_size=2), resultHandle="abc")
+    assert encode(page).split("\n")[0] == "resultType=vector series=1 resultHandle=abc page=2 pages=2 range=3-3 total=3"
+
+
+def test_summaries_and_errors_have_no_compact_form():
+    assert encode({"status": "success", "summarized": True, "resultHandle": "abc", "summary": {}}) is None
+    assert encode({"status": "error", "error": "parse error"}) is None
+    assert encode("text") is None
+
+
+def test_scalars_are_a_single_line():
+    response = {"status": "success", "data": {"resultType": "scalar", "result": [1700000000.5, "0.333333"]}}
+    assert encode(response) == "resultType=scalar time=1700000000.500 value=0.3333"
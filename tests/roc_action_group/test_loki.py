@@ -0,0 +1,92 @@
+import asyncio
+import types
+
+import pytest
+
+import loki
+
+
+# Answers query_range like Loki: entries in [start, end), ordered by direction, at most limit of them, by stream
+class FakeLoki:
+
+    def __init__(self, entries):
+        # (timestamp in ns, line, stream labels)
+        self.entries = entries
+        self.requests = []
+
+    async def get(self, path, params):
+        self.requests.append(params)
+        selected = [entry for entry in self.entries if params['start'] <= entry[0] < params['end']]
+        selected.sort(key=lambda entry: entry[0], reverse=params['direction'] == "backward")
+        streams = {}
+        for ts, line, labels in selected[:params['limit']]:
+            streams.setdefault(loki.stream_key(labels), {'stream': labels, 'values': []})['values'].append([str(ts), line])
+        return types.SimpleNamespace(
+            headers={'Content-Type': 'application/json'},
+            json=lambda: {'status': 'success', 'data': {'resultType': 'streams', 'result': list(streams.values())}})
+
+
+def entries(timestamps, per_timestamp, labels=None):
+    return [(ts, f"line {ts} {i}", labels or {"app": "api"}) for ts in timestamps for i in range(per_timestamp)]
+
+
+def lines_of(response):
+    return sorted(line for stream in response['data']['result'] for _, line in stream['values'])
+
+
+def query(client, **kwargs):
+    kwargs.setdefault("max_lines", 1000)
+    kwargs.setdefault("max_bytes", 1_000_000)
+    return asyncio.run(loki.query_range(client, '{app="api"}', start="1", end="100", **kwargs))
+
+
+@pytest.mark.parametrize("direction", ["backward", "forward"])
+def test_pages_return_every_line_once(direction):
+    logs = entries(range(1_000_000_000, 1_000_000_020), 1)
+    client = FakeLoki(logs)
+    response = query(client, direction=direction, page_limit=3)
+    assert lines_of(response) == sorted(line for _, line, _ in logs)
+    assert response['truncated'] is False
+    assert len(client.requests) > 1
+
+
+@pytest.mark.parametrize("direction", ["backward", "forward"])
+@pytest.mark.parametrize("per_timestamp", [3, 4])
+def test_timestamps_with_more_entries_than_a_page_are_read_whole(direction, per_timestamp):
+    logs = entries([1_000_000_001, 1_000_000_002, 1_000_000_003], per_timestamp)
+    response = query(FakeLoki(logs), direction=direction, page_limit=3)
+    assert lines_of(response) == sorted(line for _, line, _ in logs)
+    assert response['truncated'] is False
+
+
+@pytest.mark.parametrize("direction", ["backward", "forward"])
+def test_lines_that_cannot_be_read_truncate_the_result(direction):
+    # Reading a timestamp alone goes past the entries seen by one page limit, 10 entries do not fit in 3 + 3
+    logs = entries([1_000_000_001, 1_000_000_002], 10)
+    response = query(FakeLoki(logs), direction=direction, page_limit=3)
+    assert response['truncated'] is True
+    assert "missing" in response['truncationMarker']
+    found = lines_of(response)
+    assert len(found) == len(set(found)) == 12
+    assert set(found) <= {line for _, line, _ in logs}
+
+
+def test_line_cap_truncates_the_result():
+    response = query(FakeLoki(entries(range(1_000_000_000, 1_000_000_050), 1)), page_limit=10, max_lines=25)
+    assert response['lines'] == 25
+    assert response['truncated'] is True
+    assert "truncated after 25 lines" in response['truncationMarker']
+
+
+def test_byte_cap_truncates_the_result():
+    response = query(FakeLoki(entries(range(1_000_000_000, 1_000_000_050), 1)), page_limit=10, max_bytes=300)
+    assert response['bytes'] <= 300
+    assert 0 < response['lines'] < 50
+    assert response['truncated'] is True
+
+
+def test_explicit_zero_times_are_kept():
+    client = FakeLoki([])
+    asyncio.run(loki.query_range(client, '{app="api"}', start="0", end="100"))
+    assert client.requests[0]['start'] == 0
+    assert client.requests[0]['end'] == 100_000_000_000
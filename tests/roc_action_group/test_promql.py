@@ -0,0 +1,81 @@
+import pytest
+
+from promql import NICE_STEPS, choose_step, merge_range_results, split_range
+
+
+def timestamps(start, end, step):
+    return list(range(int(start), int(end) + 1, step))
+
+
+@pytest.mark.parametrize("start,end,max_points", [
+    (1700000000, 1700003600, 500),
+    (1700000000, 1700086400, 500),
+    (1700000123, 1700604923, 250),
+    (0, 10, 11),
+    (1700000000, 1731536000, 100),
+])
+def test_steps_are_nice_and_keep_points_within_the_budget(start, end, max_points):
+    step = choose_step(start, end, max_points=max_points)
+    assert step in NICE_STEPS or step % NICE_STEPS[-1] == 0
+    assert (end - start) / step + 1 <= max_points
+
+
+def test_steps_respect_the_minimum_step():
+    assert choose_step(0, 60, max_points=500, min_step=30) == 30
+    assert choose_step(0, 60, max_points=500, min_step=31) == 60
+
+
+@pytest.mark.parametrize("start,end,step,max_points", [
+    (1700000007, 1700086407, 60, 250),
+    (1700000000, 1700086400, 300, 100),
+    (1700000000, 1700003600, 15, 50),
+    (1700000001, 1700000002, 15, 50),
+    (1700000000, 1700604800, 3600, 7),
+])
+def test_sub_ranges_cover_the_range_without_overlap(start, end, step, max_points):
+    ranges = split_range(start, end, step, max_points=max_points)
+    evaluated = [ts for sub_start, sub_end in ranges for ts in timestamps(sub_start, sub_end, step)]
+    aligned_start = start // step * step
+    aligned_end = end // step * step
+    # Every step aligned timestamp of the range is evaluated exactly once, in order
+    assert evaluated == timestamps(aligned_start, aligned_end, step)
+    for sub_start, sub_end in ranges:
+        assert sub_start % step == 0 and sub_end % step == 0
+        assert sub_start <= sub_end
+        assert (sub_end - sub_start) / step + 1 <= max_points
+    for (_, previous_end), (next_start, _) in zip(ranges, ranges[1:]):
+        assert next_start == previous_end + step
+
+
+def test_ranges_within_the_budget_are_not_split():
+    assert split_range(1700000007, 1700003607, 60, max_points=250) == [(1699999980, 1700003580)]
+
+
+def test_sub_ranges_are_reused_by_a_moving_window():
+    step, max_points = 60, 100
+    interval = step * max_points
+    first = split_range(1700000000, 1700000000 + 10 * interval, step, max_points=max_points)
+    moved = split_range(1700000000 + interval, 1700000000 + 11 * interval, step, max_points=max_points)
+    # Only the sub-ranges at the edges of the window differ
+    assert set(first[2:-1]) <= set(moved)
+    assert all(sub_start % interval == 0 for sub_start, _ in first[1:])
+
+
+def test_split_budget_is_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("PROMQL_SPLIT_MAX_POINTS", "10")
+    assert len(split_range(0, 99 * 60, 60)) == 10
+
+
+def test_sub_range_results_are_merged_in_time_order():
+    responses = [
+        {"status": "success", "data": {"resultType": "matrix", "result": [
+            {"metric": {"job": "api"}, "values": [[60, "2"], [0, "1"]]}]}},
+        {"status": "success", "data": {"resultType": "matrix", "result": [
+            {"metric": {"job": "api"}, "values": [[120, "3"]]},
+            {"metric": {"job": "db"}, "values": [[120, "9"]]}]}},
+    ]
+    merged = merge_range_results(responses)
+    assert merged["data"]["result"] == [{"metric": {"job": "api"}, "values": [[0, "1"], [60, "2"], [120, "3"]]},
+                                        {"metric": {"job": "db"}, "values": [[120, "9"]]}]
+    error = {"status": "error", "error": "timeout"}
+    assert merge_range_results([responses[0], error]) is error
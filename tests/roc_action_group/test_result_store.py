@@ -0,0 +1,155 @@
+import io
+import types
+
+import pytest
+
+import result_store
+from result_store import ResultStore, S3ResultBackend, json_size, result_page
+
+
+class FakeClock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class NoSuchKey(Exception):
+    pass
+
+
+# Keeps objects in a dict, shared by every backend created over it like a bucket
+class FakeS3Client:
+
+    exceptions = types.SimpleNamespace(NoSuchKey=NoSuchKey)
+
+    def __init__(self):
+        self.objects = {}
+        self.fail = False
+
+    def put_object(self, Bucket, Key, Body, ContentType, Metadata):
+        if self.fail:
+            raise RuntimeError("S3 is unavailable")
+        self.objects[(Bucket, Key)] = (Body, Metadata)
+
+    def get_object(self, Bucket, Key):
+        if self.fail:
+            raise RuntimeError("S3 is unavailable")
+        if (Bucket, Key) not in self.objects:
+            raise NoSuchKey(Key)
+        body, metadata = self.objects[(Bucket, Key)]
+        return {"Body": io.BytesIO(body), "Metadata": metadata}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(result_store, "time", types.SimpleNamespace(monotonic=clock, time=clock))
+    return clock
+
+
+def matrix(series, points=3):
+    return {"status": "success", "data": {"resultType": "matrix", "result": [
+        {"metric": {"__name__": "up", "instance": f"host-{i}"}, "values": [[t, str(i)] for t in range(points)]}
+        for i in range(series)
+    ]}}
+
+
+def test_least_recently_used_results_are_evicted(clock):
+    store = ResultStore(maxsize=2, ttl=60)
+    first = store.put({"n": 1})
+    second = store.put({"n": 2})
+    assert store.get(first) == {"n": 1}
+    third = store.put({"n": 3})
+    assert store.get(second) is None
+    assert store.get(first) == {"n": 1}
+    assert store.get(third) == {"n": 3}
+
+
+def test_results_expire(clock):
+    store = ResultStore(maxsize=2, ttl=60)
+    handle = store.put({"n": 1})
+    clock.now += 59
+    assert store.get(handle) == {"n": 1}
+    clock.now += 1
+    assert store.get(handle) is None
+    assert store.get("unknown") is None
+
+
+def test_s3_results_can_be_fetched_from_another_process(clock):
+    client = FakeS3Client()
+    handle = ResultStore(ttl=60, backend=S3ResultBackend("results", client=client)).put(matrix(2))
+    other = ResultStore(ttl=60, backend=S3ResultBackend("results", client=client))
+    assert other.get(handle) == matrix(2)
+    assert other.get("unknown") is None
+
+
+def test_s3_results_expire(clock):
+    client = FakeS3Client()
+    handle = ResultStore(ttl=60, backend=S3ResultBackend("results", client=client)).put(matrix(2))
+    clock.now += 60
+    assert ResultStore(ttl=60, backend=S3ResultBackend("results", client=client)).get(handle) is None
+
+
+def test_s3_failures_fall_back_to_the_process(clock):
+    client = FakeS3Client()
+    client.fail = True
+    store = ResultStore(ttl=60, backend=S3ResultBackend("results", client=client))
+    handle = store.put(matrix(2))
+    assert store.get(handle) == matrix(2)
+    assert ResultStore(ttl=60, backend=S3ResultBackend("results", client=client)).get(handle) is None
+
+
+def test_pages_by_series_are_deterministic():
+    result = matrix(5)
+    pages = [result_page(result, page, page_size=2) for page in (1, 2, 3)]
+    assert [page["range"] for page in pages] == ["1-2", "3-4", "5-5"]
+    assert all(page["pages"] == 3 and page["total"] == 5 for page in pages)
+    assert [series for page in pages for series in page["data"]["result"]] == result["data"]["result"]
+    assert result_page(result, 2, page_size=2) == pages[1]
+    with pytest.raises(ValueError):
+        result_page(result, 4, page_size=2)
+
+
+def test_pages_by_line_span_streams():
+    result = {"status": "success", "data": {"resultType": "streams", "result": [
+        {"stream": {"app": "a"}, "values": [["1", "a1"], ["2", "a2"], ["3", "a3"]]},
+        {"stream": {"app": "b"}, "values": [["4", "b1"], ["5", "b2"]]},
+    ]}}
+    page = result_page(result, 2, page_size=2)
+    assert page["range"] == "3-4"
+    assert page["data"]["result"] == [{"stream": {"app": "a"}, "values": [["3", "a3"]]},
+                                      {"stream": {"app": "b"}, "values": [["4", "b1"]]}]
+
+
+def test_pages_by_bytes_stay_under_the_budget():
+    result = matrix(20, points=10)
+    first = result_page(result, 1, page_bytes=1000)
+    assert first["pages"] > 1
+    series = []
+    for page in range(1, first["pages"] + 1):
+        response = result_page(result, page, page_bytes=1000)
+        assert json_size(response["data"]["result"]) <= 1000
+        series.extend(response["data"]["result"])
+    assert series == result["data"]["result"]
+
+
+def test_series_larger_than_a_page_are_split():
+    result = matrix(1, points=200)
+    first = result_page(result, 1, page_bytes=1000)
+    assert first["pages"] > 1
+    values = []
+    for page in range(1, first["pages"] + 1):
+        response = result_page(result, page, page_bytes=1000)
+        assert response["range"] == "1-1"
+        assert json_size(response["data"]["result"]) <= 1000
+        values.extend(response["data"]["result"][0]["values"])
+    assert values == result["data"]["result"][0]["values"]
+
+
+def test_page_bytes_are_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("RESULT_PAGE_BYTES", "1000")
+    result = matrix(20, points=10)
+    assert result_page(result, 1)["pages"] == result_page(result, 1, page_bytes=1000)["pages"]
@@ -0,0 +1,40 @@
+from search_index import NameIndex
+
+NAMES = [
+    "node_cpu_seconds_total",
+    "node_memory_MemAvailable_bytes",
+    "process_cpu_seconds_total",
+    "http_requests_total",
+    "http_request_duration_seconds_bucket",
+    "container_memory_working_set_bytes",
+]
+
+
+def names(index, query, limit=3):
+    return [index.names[i] for i, _ in index.search(query, limit)]
+
+
+def test_exact_prefix_and_word_matches_rank_first():
+    index = NameIndex(NAMES)
+    assert names(index, "http_requests_total")[0] == "http_requests_total"
+    assert names(index, "node_cpu")[0] == "node_cpu_seconds_total"
+    assert set(names(index, "cpu seconds", limit=2)) == {"node_cpu_seconds_total", "process_cpu_seconds_total"}
+
+
+def test_every_query_word_is_matched_on_its_own():
+    index = NameIndex(NAMES)
+    assert set(names(index, "cpu secnds", limit=2)) == {"node_cpu_seconds_total", "process_cpu_seconds_total"}
+    assert names(index, "node cpu secnds")[0] == "node_cpu_seconds_total"
+    assert names(index, "containr memroy")[0] == "container_memory_working_set_bytes"
+
+
+def test_misspelled_names_are_found():
+    index = NameIndex(NAMES)
+    assert names(index, "http_reqests_total")[0] == "http_requests_total"
+
+
+def test_unrelated_queries_match_nothing():
+    index = NameIndex(NAMES)
+    assert index.search("zzz qqq") == []
+    assert index.search("  ") == []
+    assert NameIndex([]).search("cpu") == []
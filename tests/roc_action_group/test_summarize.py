@@ -0,0 +1,52 @@
+import pytest
+
+from result_store import ResultStore
+from summarize import payload_size, summarize_if_needed
+
+
+def k8s_matrix(series=200, points=120):
+    return {"status": "success", "data": {"resultType": "matrix", "result": [
+        {"metric": {"__name__": "container_cpu_usage_seconds_total", "cluster": "prod-eu-west-1",
+                    "namespace": f"team-{i % 12}", "pod": f"checkout-service-7d9f8b6c4-{i:05d}",
+                    "container": "checkout", "node": f"ip-10-0-{i % 40}-{i % 250}.eu-west-1.compute.internal",
+                    "instance": f"10.0.{i % 40}.{i % 250}:10250", "job": "kubelet", "image": f"registry/checkout:{i}"},
+         "values": [[1700000000 + 15 * t, str(0.001 * i * t)] for t in range(points)]}
+        for i in range(series)
+    ]}}
+
+
+def k8s_vector(series=2000):
+    result = k8s_matrix(series, points=1)
+    for item in result["data"]["result"]:
+        item["value"] = item.pop("values")[0]
+    result["data"]["resultType"] = "vector"
+    return result
+
+
+def k8s_streams(streams=50, lines=200):
+    return {"status": "success", "data": {"resultType": "streams", "result": [
+        {"stream": {"namespace": f"team-{i % 12}", "pod": f"checkout-service-7d9f8b6c4-{i:05d}", "container": "checkout"},
+         "values": [[str(1700000000000000000 + i * 1000 + t),
+                     f"level=error msg=\"request failed\" trace_id={i:08x}{t:08x} path=/api/v1/orders/{t} " + "x" * 400]
+                    for t in range(lines)]}
+        for i in range(streams)
+    ]}}
+
+
+@pytest.mark.parametrize("response", [k8s_matrix(), k8s_vector(), k8s_streams()], ids=["matrix", "vector", "streams"])
+@pytest.mark.parametrize("budget", [20000, 5000])
+def test_summaries_fit_the_budget(response, budget):
+    summarized = summarize_if_needed(response, ResultStore(), budget_bytes=budget)
+    assert summarized["summarized"] is True
+    assert payload_size(summarized) <= budget
+
+
+def test_summaries_keep_as_much_as_fits():
+    summarized = summarize_if_needed(k8s_matrix(), ResultStore(), budget_bytes=20000)
+    assert summarized["summary"]["seriesCount"] == 200
+    assert summarized["summary"]["series"]
+
+
+def test_small_responses_are_unchanged():
+    response = k8s_matrix(series=1, points=2)
+    assert summarize_if_needed(response, ResultStore(), budget_bytes=20000) is response
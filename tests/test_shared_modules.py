@@ -0,0 +1,13 @@
+# Modules shared by the RoC service and the metrics Lambda are packaged from both folders and have to stay identical
+import filecmp
+import os
+
+import pytest
+
+STACKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "stacks")
+
+
+@pytest.mark.parametrize("module", ["promql.py", "result_store.py", "summarize.py", "credentials.py"])
+def test_shared_module_copies_are_identical(module):
+    assert filecmp.cmp(os.path.join(STACKS, "roc_action_group", "src", module),
+                       os.path.join(STACKS, "metrics_action_group", "lambda", module), shallow=False)
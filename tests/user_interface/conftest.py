@@ -0,0 +1,5 @@
+# The Streamlit UI modules are imported from their source folder, like the app does in its container
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "stacks", "user_interface", "streamlit"))
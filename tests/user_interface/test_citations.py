@@ -0,0 +1,86 @@
+from citations import annotate_citations, get_reference_uri, group_references, reference_numbers
+
+
+def s3_ref(uri):
+    return {"location": {"type": "S3", "s3Location": {"uri": uri}}}
+
+
+def web_ref(url):
+    return {"location": {"type": "WEB", "webLocation": {"url": url}}}
+
+
+def citation(start, end, *refs):
+    return {
+        "generatedResponsePart": {"textResponsePart": {"span": {"start": start, "end": end}, "text": ""}},
+        "retrievedReferences": list(refs),
+    }
+
+
+def test_no_citations_leave_the_answer_unchanged():
+    assert annotate_citations("The answer.", []) == "The answer."
+
+
+def test_markers_follow_the_cited_span():
+    text = "First part. Second part."
+    annotated = annotate_citations(text, [citation(0, 10, s3_ref("s3://kb/a.md")), citation(12, 23, web_ref("https://docs/b"))])
+    assert annotated == ("First part.[1]\n Second part.[2]\n\n"
+                         "\n<br>[1] s3://kb/a.md"
+                         "\n<br>[2] https://docs/b")
+
+
+def test_a_reference_cited_again_keeps_its_number():
+    text = "One. Two. Three."
+    citations = [
+        citation(0, 3, s3_ref("s3://kb/a.md")),
+        citation(5, 8, s3_ref("s3://kb/b.md"), s3_ref("s3://kb/a.md")),
+        citation(10, 15, s3_ref("s3://kb/a.md"), s3_ref("s3://kb/a.md")),
+    ]
+    annotated = annotate_citations(text, citations)
+    assert annotated.startswith("One.[1]\n Two.[2][1]\n Three.[1]\n")
+    assert annotated.count("<br>") == 2
+
+
+def test_references_are_numbered_by_span_not_by_list_order():
+    citations = [citation(10, 15, s3_ref("s3://kb/late.md")), citation(0, 3, s3_ref("s3://kb/early.md"))]
+    assert reference_numbers(citations) == {"s3://kb/early.md": 1, "s3://kb/late.md": 2}
+    assert annotate_citations("One. Two. Three.", citations).startswith("One.[1]\n Two. Three.[2]\n")
+
+
+def test_overlapping_spans_are_annotated_once_each():
+    text = "A long sentence with two sources."
+    citations = [citation(0, 32, s3_ref("s3://kb/a.md")), citation(2, 32, s3_ref("s3://kb/b.md")), citation(2, 14, s3_ref("s3://kb/c.md"))]
+    annotated = annotate_citations(text, citations)
+    assert annotated.startswith("A long sentence[1]\n with two sources.[2]\n[3]\n")
+    # The answer itself is kept whole
+    assert annotated.replace("[1]\n", "").replace("[2]\n", "").replace("[3]\n", "").startswith(text)
+
+
+def test_span_past_the_end_of_the_answer():
+    assert annotate_citations("Short.", [citation(0, 100, s3_ref("s3://kb/a.md"))]).startswith("Short.[1]\n")
+
+
+def test_missing_location():
+    assert get_reference_uri({}) == "unknown"
+    assert get_reference_uri({"location": None}) == "unknown"
+    assert get_reference_uri({"location": {"type": "CONFLUENCE"}}) == "CONFLUENCE"
+    assert annotate_citations("Answer.", [citation(0, 6, {})]) == "Answer.[1]\n\n\n<br>[1] unknown"
+
+
+def test_empty_retrieval_adds_no_markers():
+    assert annotate_citations("Answer.", [citation(0, 6)]) == "Answer."
+    annotated = annotate_citations("One. Two.", [citation(0, 3), citation(5, 8, s3_ref("s3://kb/a.md"))])
+    assert annotated == "One. Two.[1]\n\n\n<br>[1] s3://kb/a.md"
+
+
+def test_sidebar_groups_use_the_marker_numbers():
+    citations = [
+        citation(0, 3, s3_ref("s3://kb/a.md")),
+        citation(5, 8, s3_ref("s3://kb/b.md"), s3_ref("s3://kb/a.md")),
+        citation(10, 15),
+    ]
+    groups = group_references(citations)
+    assert [(group["number"], get_reference_uri(group["retrievedReference"])) for group in groups] == [
+        (1, "s3://kb/a.md"), (2, "s3://kb/b.md")]
+    assert len(groups[0]["generatedResponseParts"]) == 2
+    numbers = reference_numbers(citations)
+    assert all(numbers[get_reference_uri(group["retrievedReference"])] == group["number"] for group in groups)
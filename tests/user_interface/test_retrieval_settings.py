@@ -0,0 +1,22 @@
+import pytest
+
+from bedrock_agent_runtime import MAX_NUMBER_OF_RESULTS, SEARCH_TYPES, load_retrieval_settings
+
+
+@pytest.mark.parametrize("value,expected", [("hybrid", "HYBRID"), (" semantic ", "SEMANTIC"), ("KEYWORD", "HYBRID"), ("", "HYBRID")])
+def test_search_types_are_normalized(monkeypatch, value, expected):
+    monkeypatch.setenv("KB_SEARCH_TYPE", value)
+    assert load_retrieval_settings()["searchType"] == expected
+    assert expected in SEARCH_TYPES
+
+
+@pytest.mark.parametrize("value,expected", [("20", 20), ("500", MAX_NUMBER_OF_RESULTS), ("0", 1), ("many", MAX_NUMBER_OF_RESULTS)])
+def test_result_counts_are_clamped(monkeypatch, value, expected):
+    monkeypatch.setenv("KB_NUMBER_OF_RESULTS", value)
+    assert load_retrieval_settings()["numberOfResults"] == expected
+
+
+def test_defaults_without_configuration(monkeypatch):
+    for name in ("KB_NUMBER_OF_RESULTS", "KB_SEARCH_TYPE", "KB_FILTER"):
+        monkeypatch.delenv(name, raising=False)
+    assert load_retrieval_settings() == {"numberOfResults": MAX_NUMBER_OF_RESULTS, "searchType": "HYBRID", "filter": None}